@@ -0,0 +1,152 @@
+"""admision.py
+Control de admisión para el servidor con hilos. Cada grupo de rutas (y el total
+de la app) tiene un límite de requests simultáneos; los que no entran esperan en
+una cola acotada, ordenada por prioridad de clase y con plazo. Si la cola está
+llena, un request de mayor prioridad desplaza al peor que espera; si no, se
+rechaza enseguida para responder 503 + Retry-After en vez de acumular hilos.
+"""
+import bisect
+import itertools
+import math
+import threading
+import time
+
+# Menor número = se atiende antes
+PRIORIDADES = {'cliente': 0, 'admin': 1, 'reporte': 2}
+
+
+class Rechazado(Exception):
+    """Request no admitido; `reintentar` son los segundos sugeridos para Retry-After"""
+
+    def __init__(self, limitador, motivo, reintentar):
+        super().__init__(f'{limitador}: {motivo}')
+        self.limitador = limitador
+        self.motivo = motivo
+        self.reintentar = reintentar
+
+
+class _Turno:
+    __slots__ = ('evento', 'estado')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.estado = 'esperando'  # esperando, admitido, desplazado
+
+
+class Limitador:
+    """Semáforo con cola de espera por prioridad. Al salir, el lugar pasa directo
+    al mejor que espera, así que nadie se adelanta a la cola."""
+
+    def __init__(self, nombre, limite, max_cola):
+        self.nombre = nombre
+        self.limite = max(int(limite), 1)
+        self.max_cola = max(int(max_cola), 0)
+        self._lock = threading.Lock()
+        self._cola = []  # (prioridad, orden de llegada, turno), ordenada
+        self._llegadas = itertools.count()
+        self._servicio = 0.0  # Duración media (EWMA) de un request admitido, en segundos
+        self.en_curso = 0
+        self.admitidos = 0
+        self.rechazados = {'cola_llena': 0, 'plazo': 0, 'desplazado': 0}
+        self.cola_maxima = 0
+        self.espera_total = 0.0
+
+    def _reintentar(self):
+        """Segundos estimados hasta que se libere lugar para un request nuevo"""
+        return max(1, math.ceil((len(self._cola) + 1) * self._servicio / self.limite))
+
+    def entrar(self, prioridad=0, espera=1.0):
+        """Ocupar un lugar o esperar hasta `espera` segundos; lanza Rechazado si no se logra"""
+        with self._lock:
+            if self.en_curso < self.limite and not self._cola:
+                self.en_curso += 1
+                self.admitidos += 1
+                return
+            if len(self._cola) >= self.max_cola:
+                if not self._cola or self._cola[-1][0] <= prioridad:
+                    self.rechazados['cola_llena'] += 1
+                    raise Rechazado(self.nombre, 'cola_llena', self._reintentar())
+                # Cola llena de requests menos prioritarios: se descarta el último
+                _, _, desplazado = self._cola.pop()
+                desplazado.estado = 'desplazado'
+                desplazado.evento.set()
+                self.rechazados['desplazado'] += 1
+            turno = _Turno()
+            entrada = (prioridad, next(self._llegadas), turno)
+            bisect.insort(self._cola, entrada)
+            self.cola_maxima = max(self.cola_maxima, len(self._cola))
+
+        inicio = time.monotonic()
+        turno.evento.wait(espera)
+        with self._lock:
+            self.espera_total += time.monotonic() - inicio
+            if turno.estado == 'admitido':
+                self.admitidos += 1
+                return
+            if turno.estado == 'esperando':
+                self._cola.remove(entrada)
+                self.rechazados['plazo'] += 1
+                raise Rechazado(self.nombre, 'plazo', self._reintentar())
+            raise Rechazado(self.nombre, 'desplazado', self._reintentar())
+
+    def salir(self, duracion=None):
+        """Liberar el lugar (o pasárselo al primero de la cola)"""
+        with self._lock:
+            if duracion is not None:
+                self._servicio = duracion if not self._servicio else 0.8 * self._servicio + 0.2 * duracion
+            if self._cola:
+                _, _, turno = self._cola.pop(0)
+                turno.estado = 'admitido'
+                turno.evento.set()
+            else:
+                self.en_curso -= 1
+
+    def estado(self):
+        with self._lock:
+            return {
+                'limite': self.limite,
+                'en_curso': self.en_curso,
+                'en_cola': len(self._cola),
+                'cola_maxima': self.cola_maxima,
+                'admitidos': self.admitidos,
+                'rechazados': dict(self.rechazados),
+                'espera_total_s': round(self.espera_total, 3),
+                'servicio_medio_ms': round(self._servicio * 1000, 1),
+            }
+
+
+class Admision:
+    """Un limitador global más uno por grupo de rutas. Se entra primero al del grupo,
+    así las rutas pesadas esperan en su propia cola sin ocupar lugares globales."""
+
+    def __init__(self, limite_global, max_cola, limites_grupo, esperas):
+        self.esperas = dict(esperas)  # clase -> segundos máximos de espera
+        self.global_ = Limitador('global', limite_global, max_cola)
+        self.grupos = {nombre: Limitador(nombre, limite, max_cola) for nombre, limite in limites_grupo.items()}
+
+    def entrar(self, grupo, clase):
+        """Lista de limitadores ocupados (para `salir`); lanza Rechazado si no hay lugar"""
+        prioridad = PRIORIDADES.get(clase, 0)
+        plazo = time.monotonic() + self.esperas.get(clase, 1.0)
+        ocupados = []
+        limitador = self.grupos.get(grupo)
+        if limitador is not None:
+            limitador.entrar(prioridad, plazo - time.monotonic())
+            ocupados.append(limitador)
+        try:
+            self.global_.entrar(prioridad, max(plazo - time.monotonic(), 0))
+        except Rechazado:
+            for ocupado in ocupados:
+                ocupado.salir()
+            raise
+        ocupados.append(self.global_)
+        return ocupados
+
+    @staticmethod
+    def salir(ocupados, duracion=None):
+        for limitador in reversed(ocupados):
+            limitador.salir(duracion)
+
+    def estado(self):
+        return {'global': self.global_.estado(),
+                **{nombre: limitador.estado() for nombre, limitador in self.grupos.items()}}
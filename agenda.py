@@ -0,0 +1,147 @@
+"""agenda.py
+Planificador de turnos de tasación con capacidad por sucursal.
+Cada día hábil se divide en turnos de `duracion` minutos entre la apertura y el
+cierre; por cada tasador se guarda un entero usado como bitmap (bit i = turno i
+ocupado). Buscar el primer turno libre es una operación de bits por tasador y por
+día, así que la asignación no depende de cuántas citas haya en el año.
+La base de datos sigue siendo la fuente de verdad: la agenda se carga desde las
+citas activas y solo acelera la búsqueda de turnos.
+"""
+import threading
+from datetime import date, timedelta
+
+
+def minutos(hora):
+    """'HH:MM' -> minutos desde la medianoche"""
+    h, m = hora.split(':')
+    return int(h) * 60 + int(m)
+
+
+def formato_hora(total):
+    return f'{total // 60:02d}:{total % 60:02d}'
+
+
+class Agenda:
+    """Bitmaps de ocupación por día y por tasador"""
+
+    def __init__(self, tasadores, apertura='09:00', cierre='18:00', duracion=30, dias_habiles=(0, 1, 2, 3, 4, 5)):
+        self.tasadores = max(int(tasadores), 1)
+        self.apertura = minutos(apertura)
+        self.cierre = minutos(cierre)
+        self.duracion = int(duracion)
+        self.dias_habiles = frozenset(dias_habiles)
+        self.turnos_por_dia = max((self.cierre - self.apertura) // self.duracion, 0)
+        self._mascara = (1 << self.turnos_por_dia) - 1
+        self._dias = {}  # date -> [bitmap por tasador]
+        self._lock = threading.Lock()
+
+    # ---- turnos ----
+
+    def indice(self, hora):
+        """Índice del turno que empieza a `hora`, o None si no coincide con un turno"""
+        desde = minutos(hora) - self.apertura
+        if desde < 0 or desde % self.duracion or desde // self.duracion >= self.turnos_por_dia:
+            return None
+        return desde // self.duracion
+
+    def hora(self, indice):
+        return formato_hora(self.apertura + indice * self.duracion)
+
+    def es_dia_habil(self, dia):
+        return dia.weekday() in self.dias_habiles
+
+    def _bitmaps(self, dia):
+        bitmaps = self._dias.get(dia)
+        if bitmaps is None:
+            bitmaps = self._dias[dia] = [0] * self.tasadores
+        return bitmaps
+
+    def _bits_superpuestos(self, hora):
+        """Bits de los turnos que se superponen con una cita de `duracion` que empieza a `hora`
+        (las citas anteriores al planificador pueden no coincidir con la grilla)"""
+        inicio = minutos(hora) - self.apertura
+        fin = inicio + self.duracion
+        primero = max(inicio // self.duracion, 0)
+        ultimo = min(-(-fin // self.duracion), self.turnos_por_dia)
+        if ultimo <= primero:
+            return 0
+        return ((1 << (ultimo - primero)) - 1) << primero
+
+    # ---- ocupación ----
+
+    def ocupar(self, dia, hora, tasador=None):
+        """Marcar el turno como ocupado; devuelve el tasador asignado o None si no hay lugar.
+
+        Con `tasador` se respeta esa asignación (p. ej. al cargar desde la base).
+        """
+        bits = self._bits_superpuestos(hora)
+        if not bits:
+            return None
+        with self._lock:
+            bitmaps = self._bitmaps(dia)
+            candidatos = [tasador - 1] if tasador and 0 < tasador <= self.tasadores else range(self.tasadores)
+            for t in candidatos:
+                if not bitmaps[t] & bits:
+                    bitmaps[t] |= bits
+                    return t + 1
+            return None
+
+    def liberar(self, dia, hora, tasador):
+        if not tasador or not 0 < tasador <= self.tasadores:
+            return
+        with self._lock:
+            bitmaps = self._dias.get(dia)
+            if bitmaps:
+                bitmaps[tasador - 1] &= ~self._bits_superpuestos(hora)
+
+    def recargar_dia(self, dia, citas):
+        """Reemplazar la ocupación de un día con las citas (hora, tasador) leídas de la base"""
+        with self._lock:
+            self._dias.pop(dia, None)
+        for hora, tasador in citas:
+            self.ocupar(dia, hora, tasador)
+
+    # ---- búsqueda ----
+
+    def siguientes_libres(self, desde, hora_minima=None, k=5, max_dias=366):
+        """Los próximos `k` turnos libres (fecha, hora, tasador) desde el día `desde`.
+
+        Por día: los turnos libres son la unión de los bits en cero de cada tasador;
+        se recorren de menor a mayor y cada uno se asigna al primer tasador libre.
+        """
+        resultado = []
+        if not self.turnos_por_dia or not self.dias_habiles:
+            return resultado
+        minimo = 0
+        if hora_minima is not None:
+            minimo = max(-(-(minutos(hora_minima) - self.apertura) // self.duracion), 0)
+        with self._lock:
+            for n in range(max_dias):
+                dia = desde + timedelta(days=n)
+                if not self.es_dia_habil(dia):
+                    continue
+                bitmaps = self._dias.get(dia) or [0] * self.tasadores
+                libres_por_tasador = [~b & self._mascara for b in bitmaps]
+                libres = 0
+                for bits in libres_por_tasador:
+                    libres |= bits
+                if n == 0:
+                    libres &= ~((1 << minimo) - 1)
+                while libres and len(resultado) < k:
+                    bit = libres & -libres
+                    turno = bit.bit_length() - 1
+                    tasador = next(t for t, bits in enumerate(libres_por_tasador) if bits & bit)
+                    resultado.append((dia, self.hora(turno), tasador + 1))
+                    libres ^= bit
+                if len(resultado) >= k:
+                    break
+        return resultado
+
+    def primer_libre(self, desde, hora_minima=None):
+        turnos = self.siguientes_libres(desde, hora_minima, k=1)
+        return turnos[0] if turnos else None
+
+
+def parsear_dia(texto):
+    """'YYYY-MM-DD' (o ISO con hora) -> date"""
+    return date.fromisoformat(texto[:10])
@@ -5,28 +5,43 @@ protección CSRF, manejo de errores, logging, y mejor UX.
 """
 import os
 import sys
+import json
 import threading
-import webbrowser
 import time
-import urllib.request
 import logging
+import math
 import re
+import secrets
+import multiprocessing
+import queue
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timezone, timedelta
 from functools import wraps
+from types import SimpleNamespace
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, session, flash,
+                   get_flashed_messages, jsonify, g, has_app_context, Response)
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as SesionFlask
+from sqlalchemy import create_engine, event, inspect as sa_inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.util import find_tables
 from werkzeug.security import generate_password_hash, check_password_hash
 
-try:
-    import pystray
-    from PIL import Image, ImageDraw
-    _HAS_PYSTRAY = True
-except Exception:
-    _HAS_PYSTRAY = False
+import admision
+import agenda
+import catalogo
+import compresion
+import eventos
+import mantenimiento
+
+# pandas, numpy (cotizador, indices, riesgo), sklearn y pystray/PIL se importan de forma diferida:
+# solo se cargan cuando se usan por primera vez, para acelerar el arranque.
 
 # Configuración de logging
 logging.basicConfig(
@@ -47,19 +62,148 @@ template_folder = (
 
 app = Flask(__name__, template_folder=template_folder)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///data.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///data.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
-db = SQLAlchemy(app)
-
-# Modelo IA pequeño (dataset inline)
-data = pd.DataFrame({
-    'valor_referencia': [150000, 300000, 80000, 180000, 250000],
-    'estado': [0.8, 1.0, 0.5, 0.7, 0.9],
-    'valor_empeno': [90000, 210000, 40000, 95000, 150000],
-})
-modelo_ia = RandomForestRegressor(random_state=0)
-modelo_ia.fit(data[['valor_referencia', 'estado']], data['valor_empeno'])
+# Minutos que una pre-cotización queda disponible para ser aceptada
+app.config['COTIZACION_TTL_MINUTOS'] = int(os.environ.get('COTIZACION_TTL_MINUTOS', 30))
+# Minutos que se recuerda el resultado de un POST con clave de idempotencia
+app.config['IDEMPOTENCIA_TTL_MINUTOS'] = int(os.environ.get('IDEMPOTENCIA_TTL_MINUTOS', 60))
+# Login: método/costo del hash de contraseñas y throttling por token-bucket (IP y cuenta)
+app.config['HASH_METODO'] = os.environ.get('HASH_METODO', 'pbkdf2:sha256:600000')
+app.config['HASH_WORKERS'] = int(os.environ.get('HASH_WORKERS', 2))
+app.config['HASH_COLA'] = int(os.environ.get('HASH_COLA', 8))
+app.config['HASH_TIMEOUT'] = float(os.environ.get('HASH_TIMEOUT', 5))
+app.config['LOGIN_RAFAGA'] = int(os.environ.get('LOGIN_RAFAGA', 5))
+app.config['LOGIN_POR_MINUTO'] = float(os.environ.get('LOGIN_POR_MINUTO', 10))
+# Archivo histórico: empeños pagados hace más de ARCHIVO_MESES pasan a instance/data_archivo.db
+app.config['ARCHIVO_MESES'] = int(os.environ.get('ARCHIVO_MESES', 12))
+app.config['ARCHIVO_LOTE'] = int(os.environ.get('ARCHIVO_LOTE', 500))
+app.config['ARCHIVO_INTERVALO_HORAS'] = float(os.environ.get('ARCHIVO_INTERVALO_HORAS', 24))
+# Riesgo de cartera: procesos del cálculo por lotes (0 = uno por CPU), filas por bloque,
+# puntaje mínimo de la vista "en riesgo" y horas entre recálculos automáticos
+app.config['RIESGO_PROCESOS'] = int(os.environ.get('RIESGO_PROCESOS', 0))
+app.config['RIESGO_BLOQUE'] = int(os.environ.get('RIESGO_BLOQUE', 200000))
+app.config['RIESGO_UMBRAL'] = float(os.environ.get('RIESGO_UMBRAL', 0.6))
+app.config['RIESGO_INTERVALO_HORAS'] = float(os.environ.get('RIESGO_INTERVALO_HORAS', 6))
+# Mantenimiento: respaldo en línea cada MANTENIMIENTO_INTERVALO_HORAS; vacío incremental y
+# ANALYZE solo tras MANTENIMIENTO_SILENCIO_SEGUNDOS sin requests
+app.config['MANTENIMIENTO_INTERVALO_HORAS'] = float(os.environ.get('MANTENIMIENTO_INTERVALO_HORAS', 24))
+app.config['MANTENIMIENTO_SILENCIO_SEGUNDOS'] = int(os.environ.get('MANTENIMIENTO_SILENCIO_SEGUNDOS', 120))
+app.config['RESPALDO_PAGINAS'] = int(os.environ.get('RESPALDO_PAGINAS', 256))
+app.config['RESPALDOS_CONSERVAR'] = int(os.environ.get('RESPALDOS_CONSERVAR', 7))
+# Backend del modelo IA: 'bosque' (RandomForest), 'compilado' (árboles en NumPy) o 'lineal'
+app.config['COTIZADOR_BACKEND'] = os.environ.get('COTIZADOR_BACKEND', 'bosque')
+# Series de índices (indices.py): directorio con ipc.csv, tasa_diaria.csv y tasa_renovacion.csv,
+# segundos entre revisiones de los archivos y fecha (ISO) de los precios con que se entrenó el
+# modelo IA (vacío = se asume que ya están en pesos de hoy)
+app.config['INDICES_DIR'] = os.environ.get('INDICES_DIR', os.path.join(app.instance_path, 'indices'))
+app.config['INDICES_REVISION_SEGUNDOS'] = float(os.environ.get('INDICES_REVISION_SEGUNDOS', 60))
+app.config['COTIZADOR_FECHA_PRECIOS'] = os.environ.get('COTIZADOR_FECHA_PRECIOS', '')
+# Agenda de tasaciones: tasadores por sucursal ('2' o 'central:3,norte:2'), horario,
+# duración del turno en minutos y días hábiles (0=lunes ... 6=domingo)
+app.config['AGENDA_TASADORES'] = os.environ.get('AGENDA_TASADORES', '2')
+app.config['AGENDA_APERTURA'] = os.environ.get('AGENDA_APERTURA', '09:00')
+app.config['AGENDA_CIERRE'] = os.environ.get('AGENDA_CIERRE', '18:00')
+app.config['AGENDA_DURACION_MIN'] = int(os.environ.get('AGENDA_DURACION_MIN', 30))
+app.config['AGENDA_DIAS'] = os.environ.get('AGENDA_DIAS', '0,1,2,3,4,5')
+# Catálogo de precios de referencia: segundos entre sincronizaciones del trie con la base
+app.config['CATALOGO_REFRESCO_SEGUNDOS'] = float(os.environ.get('CATALOGO_REFRESCO_SEGUNDOS', 5))
+# Control de admisión: requests simultáneos en total y por grupo de rutas ('reportes:2,...'),
+# largo de cada cola de espera y espera máxima en ms por clase de prioridad
+app.config['ADMISION_ACTIVA'] = os.environ.get('ADMISION_ACTIVA', '1') != '0'
+app.config['ADMISION_LIMITE'] = int(os.environ.get('ADMISION_LIMITE', 16))
+app.config['ADMISION_LIMITES_RUTA'] = os.environ.get('ADMISION_LIMITES_RUTA', 'reportes:2,exportar:1,importar:1,admin_panel:4')
+app.config['ADMISION_COLA'] = int(os.environ.get('ADMISION_COLA', 32))
+app.config['ADMISION_ESPERA_MS'] = os.environ.get('ADMISION_ESPERA_MS', 'cliente:5000,admin:2000,reporte:1000')
+# Servidor ASGI opcional (asgi.py): conexiones aiosqlite por base, hilos para la predicción del modelo IA
+# y hilos para las rutas de Flask (HTML, formularios)
+app.config['ASGI_CONEXIONES'] = int(os.environ.get('ASGI_CONEXIONES', 4))
+app.config['ASGI_HILOS_PREDICCION'] = int(os.environ.get('ASGI_HILOS_PREDICCION', 2))
+app.config['ASGI_HILOS_FLASK'] = int(os.environ.get('ASGI_HILOS_FLASK', 16))
+# Compresión gzip/brotli de respuestas de al menos COMPRESION_MINIMO bytes (0 = desactivada)
+app.config['COMPRESION_MINIMO'] = int(os.environ.get('COMPRESION_MINIMO', 1024))
+app.config['COMPRESION_NIVEL'] = int(os.environ.get('COMPRESION_NIVEL', 6))
+# Caché persistente del bytecode de las plantillas Jinja (vacío = sin caché en disco)
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+if app.config['JINJA_CACHE_DIR']:
+    from jinja2 import FileSystemBytecodeCache
+    os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+    # Debe fijarse antes del primer acceso a app.jinja_env, que se crea con estas opciones
+    app.jinja_options = {**app.jinja_options,
+                         'bytecode_cache': FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])}
+
+# Sucursales: una base SQLite por sucursal. La primera usa la base principal (data.db);
+# las demás, data_<sucursal>.db en el mismo directorio.
+SUCURSALES = [
+    s for s in (x.strip().lower() for x in os.environ.get('SUCURSALES', 'central').split(','))
+    if re.match(r'^[a-z0-9_]+$', s)
+] or ['central']
+SUCURSAL_PRINCIPAL = SUCURSALES[0]
+# Tablas compartidas por todas las sucursales: siempre en la base principal
+_TABLAS_GLOBALES = {'admin', 'login_throttle', 'clave_idempotencia', 'catalogo_articulo'}
+
+_engines_sucursal = {}
+_engines_lock = threading.Lock()
+
+
+def _sucursal_actual():
+    """Sucursal del request/contexto actual (None = principal)"""
+    return g.get('sucursal') if has_app_context() else None
+
+
+# Tablas nombradas en SQL textual (text()): FROM / INTO / UPDATE / JOIN [esquema.]tabla
+_PATRON_TABLAS_SQL = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(?:"?\w+"?\.)?"?(\w+)', re.IGNORECASE)
+
+
+def _tablas_sentencia(clause):
+    """Nombres de las tablas que toca una sentencia Core o text()"""
+    if isinstance(clause, TextClause):
+        return {nombre.lower() for nombre in _PATRON_TABLAS_SQL.findall(clause.text)}
+    return {tabla.name for tabla in find_tables(clause, include_crud=True, include_joins=True)}
+
+
+class SesionPorSucursal(SesionFlask):
+    """Sesión que enruta cada consulta a la base de la sucursal actual (g.sucursal).
+
+    Las tablas globales van siempre a la base principal: por el mapper en las consultas
+    ORM y, sin mapper (Core o text()), si la sentencia nombra tablas globales y ninguna
+    de sucursal.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        sucursal = _sucursal_actual()
+        if bind is not None or sucursal in (None, SUCURSAL_PRINCIPAL):
+            return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        if mapper is not None:
+            if sa_inspect(mapper).local_table.name in _TABLAS_GLOBALES:
+                return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        elif clause is not None:
+            tablas = _tablas_sentencia(clause)
+            if tablas & _TABLAS_GLOBALES and not tablas & (set(db.metadata.tables) - _TABLAS_GLOBALES):
+                return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        return _engine_sucursal(sucursal)
+
+
+db = SQLAlchemy(app, session_options={'class_': SesionPorSucursal})
+
+# Modelo IA pequeño (dataset inline en cotizador.py), construido en el primer uso
+modelo_ia = None
+_modelo_ia_lock = threading.Lock()
+
+
+def obtener_modelo_ia():
+    """Devolver el backend de cotización, creándolo la primera vez que se pide"""
+    global modelo_ia
+    if modelo_ia is None:
+        with _modelo_ia_lock:
+            if modelo_ia is None:
+                import cotizador
+                modelo_ia = cotizador.crear_backend(
+                    app.config['COTIZADOR_BACKEND'],
+                    ruta_compilado=os.path.join(app.instance_path, 'modelo_compilado.npz'),
+                )
+    return modelo_ia
 
 
 class User(db.Model):
@@ -69,6 +213,7 @@ class User(db.Model):
     email = db.Column(db.String(120))
     telefono = db.Column(db.String(20))
     created_at = db.Column(db.String(64), default=lambda: datetime.now(timezone.utc).isoformat())
+    sucursal = db.Column(db.String(32), default=lambda: _sucursal_actual() or SUCURSAL_PRINCIPAL)
     
     def to_dict(self):
         return {
@@ -77,13 +222,14 @@ class User(db.Model):
             'dni': self.dni, 
             'email': self.email,
             'telefono': self.telefono,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'sucursal': self.sucursal
         }
 
 
 class Empeno(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     tipo = db.Column(db.String(120))
     descripcion = db.Column(db.String(500))
     valor_estimado = db.Column(db.Integer)
@@ -93,8 +239,16 @@ class Empeno(db.Model):
     renovaciones = db.Column(db.Integer, default=0)
     estado = db.Column(db.String(20), default='activo')  # activo, pagado, vencido
     interes_acumulado = db.Column(db.Float, default=0.0)
+    sucursal = db.Column(db.String(32), default=lambda: _sucursal_actual() or SUCURSAL_PRINCIPAL)
+    catalogo_id = db.Column(db.Integer)  # Artículo del catálogo usado al cotizar (si hubo)
+    # Versión de la fila: cada UPDATE/DELETE lleva WHERE id = ? AND version = ? (ver _con_reintentos)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     user = db.relationship('User', backref=db.backref('empenos', lazy=True))
 
+    __mapper_args__ = {'version_id_col': version}
+    # AUTOINCREMENT: los ids de empeños ya archivados no se vuelven a asignar (ver _MIGRACIONES)
+    __table_args__ = {'sqlite_autoincrement': True}
+
 
 class Admin(db.Model):
     """Modelo para administradores con contraseña hasheada"""
@@ -104,7 +258,7 @@ class Admin(db.Model):
     created_at = db.Column(db.String(64), default=lambda: datetime.now(timezone.utc).isoformat())
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=app.config['HASH_METODO'])
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -123,7 +277,7 @@ class RenovationLog(db.Model):
 class PaidLog(db.Model):
     """Registro de pagos (marcar como pagado). Mantener historial separado para evitar migraciones en tablas existentes."""
     id = db.Column(db.Integer, primary_key=True)
-    empeno_id = db.Column(db.Integer)
+    empeno_id = db.Column(db.Integer, index=True)
     by_admin = db.Column(db.Boolean, default=True)
     time = db.Column(db.String(64))
     monto_pagado = db.Column(db.Integer)
@@ -133,17 +287,200 @@ class PaidLog(db.Model):
 class Cita(db.Model):
     """Registro de citas para evaluación de empeños"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     empeno_id = db.Column(db.Integer)  # ID de la precotización si está relacionada
     fecha = db.Column(db.String(64))  # Fecha de la cita (ISO format)
     hora = db.Column(db.String(5))  # Hora en formato HH:MM
     created_at = db.Column(db.String(64), default=lambda: datetime.now(timezone.utc).isoformat())
     estado = db.Column(db.String(20), default='pendiente')  # pendiente, confirmada, completada, cancelada
+    tasador = db.Column(db.Integer)  # Tasador asignado por la agenda (1..N de la sucursal)
+    sucursal = db.Column(db.String(32), default=lambda: _sucursal_actual() or SUCURSAL_PRINCIPAL)
     user = db.relationship('User', backref=db.backref('citas', lazy=True))
 
 
-with app.app_context():
-    db.create_all()
+class Cotizacion(db.Model):
+    """Pre-cotizaciones pendientes de aceptar. La sesión (cookie) solo guarda el ID corto;
+    las filas vencidas se eliminan al crear nuevas cotizaciones."""
+    id = db.Column(db.String(16), primary_key=True)
+    user_id = db.Column(db.Integer)
+    tipo = db.Column(db.String(120))
+    descripcion = db.Column(db.String(500))
+    valor_ref = db.Column(db.Float)
+    estado = db.Column(db.Float)
+    valor_estimado = db.Column(db.Integer)
+    catalogo_id = db.Column(db.Integer)
+    created_at = db.Column(db.String(64))
+    expires_at = db.Column(db.String(64), index=True)
+
+
+class CatalogoArticulo(db.Model):
+    """Catálogo global de precios de referencia. `clave` es 'tipo|marca|modelo' normalizado:
+    su índice único resuelve la búsqueda exacta y los rangos por prefijo de categoría ('celular|...')"""
+    __tablename__ = 'catalogo_articulo'
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(370), unique=True, nullable=False)
+    tipo = db.Column(db.String(120), nullable=False)
+    marca = db.Column(db.String(120), default='')
+    modelo = db.Column(db.String(120), default='')
+    valor_referencia = db.Column(db.Float, nullable=False)
+    aceptados = db.Column(db.Integer, nullable=False, default=0)  # Empeños registrados con este artículo
+    suma_aceptado = db.Column(db.Float, nullable=False, default=0.0)  # Suma de sus valores de empeño
+    revision = db.Column(db.Integer, index=True)  # Crece en cada cambio (sincronización incremental del trie)
+    updated_at = db.Column(db.String(64))
+
+
+class LoginThrottle(db.Model):
+    """Token-bucket de intentos de login por clave ('ip:...', 'dni:...', 'admin:...').
+    Vive en SQLite para que lo compartan todos los procesos del servidor."""
+    clave = db.Column(db.String(160), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    actualizado = db.Column(db.Float, nullable=False)  # epoch en segundos
+
+
+class ClaveIdempotencia(db.Model):
+    """Resultado de un POST con clave de idempotencia (campo de formulario o header
+    Idempotency-Key). Un reintento con la misma clave repite la redirección y los mensajes
+    sin volver a escribir; las filas vencidas se eliminan al registrar claves nuevas."""
+    clave = db.Column(db.String(200), primary_key=True)
+    estado = db.Column(db.String(16), nullable=False)  # en_curso, hecho
+    status = db.Column(db.Integer)
+    location = db.Column(db.String(500))
+    flashes = db.Column(db.Text)  # JSON [[categoria, mensaje], ...]
+    expires_at = db.Column(db.String(64), index=True)
+
+
+class RiesgoEmpeno(db.Model):
+    """Puntaje de riesgo de caducidad de cada empeño activo; lo reescribe calcular_riesgo()"""
+    empeno_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer)
+    puntaje = db.Column(db.Float, nullable=False, index=True)
+    dias_a_vencer = db.Column(db.Integer)
+    renovaciones = db.Column(db.Integer)
+    interes_capital = db.Column(db.Float)  # Interés acumulado / capital
+    caducados_previos = db.Column(db.Integer)  # Empeños anteriores del cliente que caducaron
+    capital = db.Column(db.Float)
+    cobro_esperado = db.Column(db.Float)
+    calculado_at = db.Column(db.String(64))
+
+
+class ResumenUsuario(db.Model):
+    """Resumen precalculado por usuario para /panel; se actualiza en cada escritura
+    sobre sus empeños o citas (ver _actualizar_resumen)."""
+    user_id = db.Column(db.Integer, primary_key=True)
+    total_empenos = db.Column(db.Integer, default=0)
+    activos = db.Column(db.Integer, default=0)
+    pagados = db.Column(db.Integer, default=0)
+    saldo_activo = db.Column(db.Integer, default=0)  # Suma de valor_estimado de los activos
+    proximo_vencimiento = db.Column(db.String(64))
+    proxima_cita_fecha = db.Column(db.String(64))
+    proxima_cita_hora = db.Column(db.String(5))
+    actualizado = db.Column(db.String(64))
+
+
+# Versión del esquema guardada en PRAGMA user_version. Si la base ya está en esta
+# versión se omiten create_all() y la verificación del admin por defecto al arrancar.
+SCHEMA_VERSION = 11
+
+
+def _agregar_columna(conn, tabla, columna, definicion):
+    """ALTER TABLE ADD COLUMN idempotente (SQLite no soporta IF NOT EXISTS)"""
+    columnas = {fila[1] for fila in conn.exec_driver_sql(f'PRAGMA table_info({tabla})')}
+    if columna not in columnas:
+        conn.exec_driver_sql(f'ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}')
+
+
+def _migracion_indices_por_usuario(conn):
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_empeno_user_id ON empeno (user_id)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_cita_user_id ON cita (user_id)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_paid_log_empeno_id ON paid_log (empeno_id)')
+
+
+def _migracion_sucursal(conn):
+    for tabla in ('user', 'empeno', 'cita'):
+        _agregar_columna(conn, f'"{tabla}"', 'sucursal', f"VARCHAR(32) DEFAULT '{SUCURSAL_PRINCIPAL}'")
+
+
+def _migracion_version_empeno(conn):
+    _agregar_columna(conn, 'empeno', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+def _migracion_tasador_cita(conn):
+    _agregar_columna(conn, 'cita', 'tasador', 'INTEGER')
+    # Las citas activas previas se numeran dentro de su turno para que el índice único sea válido
+    conn.exec_driver_sql(
+        "UPDATE cita SET tasador = (SELECT COUNT(*) FROM cita c2 WHERE c2.fecha = cita.fecha "
+        "AND c2.hora = cita.hora AND c2.estado IN ('pendiente', 'confirmada') AND c2.id <= cita.id) "
+        "WHERE tasador IS NULL AND estado IN ('pendiente', 'confirmada')"
+    )
+    # Un tasador no puede tener dos citas activas en el mismo turno (aunque haya varios procesos)
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_cita_turno_activo ON cita (fecha, hora, tasador) "
+        "WHERE estado IN ('pendiente', 'confirmada')"
+    )
+
+
+def _migracion_catalogo(conn):
+    for tabla in ('empeno', 'cotizacion'):
+        _agregar_columna(conn, tabla, 'catalogo_id', 'INTEGER')
+
+
+def _max_id_empeno_archivado(conn):
+    """Mayor id de empeño en el archivo (0 si todavía no existe la tabla)"""
+    if not conn.exec_driver_sql("SELECT 1 FROM archivo.sqlite_master WHERE name = 'empeno'").scalar():
+        return 0
+    return conn.exec_driver_sql('SELECT COALESCE(MAX(id), 0) FROM archivo.empeno').scalar()
+
+
+def _migracion_autoincremento_empeno(conn):
+    # Sin AUTOINCREMENT, SQLite asigna MAX(id) + 1 de la tabla activa y reutiliza los ids de
+    # empeños archivados (que siguen referenciados por archivo.paid_log, archivo.cita...).
+    # SQLite no permite agregarlo con ALTER TABLE: se reconstruye la tabla.
+    if 'AUTOINCREMENT' in (conn.exec_driver_sql(
+            "SELECT sql FROM main.sqlite_master WHERE name = 'empeno'").scalar() or '').upper():
+        return
+    columnas = ', '.join(fila[1] for fila in conn.exec_driver_sql('PRAGMA main.table_info(empeno)'))
+    ddl = str(CreateTable(Empeno.__table__).compile(dialect=conn.dialect))
+    conn.exec_driver_sql(ddl.replace('CREATE TABLE empeno', 'CREATE TABLE _empeno_nueva', 1))
+    conn.exec_driver_sql(f'INSERT INTO _empeno_nueva ({columnas}) SELECT {columnas} FROM main.empeno')
+    conn.exec_driver_sql('DROP TABLE main.empeno')
+    conn.exec_driver_sql('ALTER TABLE _empeno_nueva RENAME TO empeno')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_empeno_user_id ON empeno (user_id)')
+    # El contador arranca después del mayor id activo o archivado
+    siguiente = max(conn.exec_driver_sql('SELECT COALESCE(MAX(id), 0) FROM main.empeno').scalar(),
+                    _max_id_empeno_archivado(conn))
+    conn.exec_driver_sql("DELETE FROM main.sqlite_sequence WHERE name = 'empeno'")
+    conn.exec_driver_sql("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('empeno', ?)", (siguiente,))
+
+
+# Migraciones idempotentes por versión: (version, funcion(conn))
+_MIGRACIONES = [
+    (4, _migracion_indices_por_usuario),
+    (5, _migracion_sucursal),
+    (7, _migracion_version_empeno),
+    (8, _migracion_tasador_cita),
+    (9, _migracion_catalogo),
+    (11, _migracion_autoincremento_empeno),
+]
+
+
+def _inicializar_esquema(engine=None):
+    """Crear/migrar el esquema solo si PRAGMA user_version está desactualizado"""
+    engine = engine or db.engine
+    with engine.connect() as conn:
+        actual = conn.exec_driver_sql('PRAGMA user_version').scalar() or 0
+    if actual == SCHEMA_VERSION:
+        return False
+
+    db.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for version, migracion in _MIGRACIONES:
+            if version > actual:
+                migracion(conn)
+        conn.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    logger.info(f"Esquema de {engine.url.database} actualizado de la versión {actual} a {SCHEMA_VERSION}")
+    if engine is not db.engine:
+        return True
+
     # Crear admin por defecto si no existe
     if not Admin.query.filter_by(username='admin').first():
         admin = Admin(username='admin')
@@ -151,38 +488,343 @@ with app.app_context():
         db.session.add(admin)
         db.session.commit()
         logger.info("Admin por defecto creado: admin/admin")
+    return True
+
+
+# ============ ARCHIVO HISTÓRICO (HOT/COLD) ============
+
+# Tablas que se mueven al archivo junto con cada empeño liquidado
+TABLAS_ARCHIVABLES = ('empeno', 'paid_log', 'renovation_log', 'cita')
+
+
+def _ruta_archivo(ruta_base):
+    return os.path.splitext(ruta_base)[0] + '_archivo.db'
+
+
+def _configurar_engine(engine):
+    """Adjuntar la base de archivo (esquema 'archivo') en cada conexión nueva.
+
+    El archivo vive junto a la base principal: instance/data.db -> instance/data_archivo.db
+    """
+    ruta_archivo = _ruta_archivo(engine.url.database)
+
+    @event.listens_for(engine, 'connect')
+    def _adjuntar_archivo(dbapi_conn, _registro):
+        dbapi_conn.execute('ATTACH DATABASE ? AS archivo', (ruta_archivo,))
+
+
+def _asegurar_archivo(conn):
+    """Crear las tablas de archivo y agregarles las columnas nuevas del esquema principal"""
+    if conn.exec_driver_sql('PRAGMA archivo.user_version').scalar() == SCHEMA_VERSION:
+        return
+    for tabla in TABLAS_ARCHIVABLES:
+        conn.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS archivo.{tabla} AS SELECT * FROM main.{tabla} WHERE 0')
+        principal = conn.exec_driver_sql(f'PRAGMA main.table_info({tabla})').all()
+        existentes = {fila[1] for fila in conn.exec_driver_sql(f'PRAGMA archivo.table_info({tabla})')}
+        for _, columna, tipo, *_ in principal:
+            if columna not in existentes:
+                conn.exec_driver_sql(f'ALTER TABLE archivo.{tabla} ADD COLUMN {columna} {tipo}')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS archivo.ix_archivo_empeno_user_id ON empeno (user_id)')
+    conn.exec_driver_sql(f'PRAGMA archivo.user_version = {SCHEMA_VERSION}')
+
+
+def _tabla_historica(tabla, columnas, where=''):
+    """Subconsulta SQL que une la tabla activa con su copia archivada.
+
+    El filtro opcional se aplica dentro de cada rama para que SQLite use los índices.
+    """
+    cols = ', '.join(columnas)
+    filtro = f' WHERE {where}' if where else ''
+    return f'(SELECT {cols} FROM main.{tabla}{filtro} UNION ALL SELECT {cols} FROM archivo.{tabla}{filtro})'
+
+
+def archivar_liquidados(meses=None, lote=None):
+    """Mover al archivo los empeños pagados hace más de `meses`, con sus logs y citas.
+
+    Trabaja en lotes de `lote` empeños, cada uno en su propia transacción corta para no
+    retener el lock de escritura de SQLite. Devuelve la cantidad de empeños archivados.
+    """
+    meses = app.config['ARCHIVO_MESES'] if meses is None else meses
+    lote = lote or app.config['ARCHIVO_LOTE']
+    corte = (datetime.now(timezone.utc) - timedelta(days=30 * meses)).isoformat()
+    engine = _engine_sucursal(_sucursal_actual())
+    total = 0
+    with engine.begin() as conn:
+        _asegurar_archivo(conn)
+        columnas = {
+            tabla: ', '.join(fila[1] for fila in conn.exec_driver_sql(f'PRAGMA main.table_info({tabla})'))
+            for tabla in TABLAS_ARCHIVABLES
+        }
+    while True:
+        with engine.begin() as conn:
+            ids = [fila[0] for fila in conn.execute(text(
+                "SELECT e.id FROM main.empeno e JOIN main.paid_log p ON p.empeno_id = e.id "
+                "WHERE e.estado = 'pagado' GROUP BY e.id HAVING MAX(p.time) < :corte LIMIT :lote"
+            ), {'corte': corte, 'lote': lote})]
+            if not ids:
+                break
+            marcadores = ', '.join(str(int(i)) for i in ids)
+            for tabla, clave in (('empeno', 'id'), ('paid_log', 'empeno_id'),
+                                 ('renovation_log', 'empeno_id'), ('cita', 'empeno_id')):
+                conn.exec_driver_sql(
+                    f'INSERT INTO archivo.{tabla} ({columnas[tabla]}) '
+                    f'SELECT {columnas[tabla]} FROM main.{tabla} WHERE {clave} IN ({marcadores})'
+                )
+                conn.exec_driver_sql(f'DELETE FROM main.{tabla} WHERE {clave} IN ({marcadores})')
+        total += len(ids)
+    if total:
+        logger.info(f"Archivado histórico ({_sucursal_actual() or SUCURSAL_PRINCIPAL}): "
+                    f"{total} empeños liquidados antes de {corte[:10]}")
+    return total
+
+
+def _hilo_archivado(espera_inicial=300):
+    """Archivado periódico en segundo plano (lanzador de escritorio)"""
+    # La primera pasada espera unos minutos para no competir con el arranque
+    time.sleep(espera_inicial)
+    while True:
+        try:
+            en_todas_las_sucursales(archivar_liquidados)
+        except Exception as e:
+            logger.error(f"Error en archivado histórico: {e}")
+        time.sleep(app.config['ARCHIVO_INTERVALO_HORAS'] * 3600)
+
+
+def _preparar_engine(engine):
+    """Adjuntar el archivo, crear/migrar el esquema y asegurar las tablas de archivo"""
+    _configurar_engine(engine)
+    _inicializar_esquema(engine)
+    with engine.begin() as conn:
+        _asegurar_archivo(conn)
+    return engine
+
+
+def _engine_sucursal(sucursal):
+    """Engine de la base de una sucursal; se crea y prepara la primera vez"""
+    if sucursal in (None, SUCURSAL_PRINCIPAL):
+        return db.engine
+    engine = _engines_sucursal.get(sucursal)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines_sucursal.get(sucursal)
+            if engine is None:
+                base, extension = os.path.splitext(db.engine.url.database)
+                engine = _preparar_engine(create_engine(f'sqlite:///{base}_{sucursal}{extension}'))
+                _engines_sucursal[sucursal] = engine
+    return engine
+
+
+class _EnSucursal:
+    """Contexto de app ligado a una sucursal (para hilos, CLI y fan-out)"""
+
+    def __init__(self, sucursal):
+        self.sucursal = sucursal
+        self._ctx = app.app_context()
+
+    def __enter__(self):
+        self._ctx.push()
+        g.sucursal = self.sucursal
+        return self.sucursal
+
+    def __exit__(self, *exc):
+        db.session.remove()
+        self._ctx.pop()
+
+
+_pool_sucursales = ThreadPoolExecutor(max_workers=max(len(SUCURSALES), 1), thread_name_prefix='sucursal')
+
+
+def en_todas_las_sucursales(funcion, *args):
+    """Ejecutar funcion(*args) en cada sucursal en paralelo; devuelve {sucursal: resultado}"""
+    def _ejecutar(sucursal):
+        with _EnSucursal(sucursal):
+            return funcion(*args)
+    if len(SUCURSALES) == 1:
+        return {SUCURSAL_PRINCIPAL: _ejecutar(SUCURSAL_PRINCIPAL)}
+    return dict(zip(SUCURSALES, _pool_sucursales.map(_ejecutar, SUCURSALES)))
+
+
+with app.app_context():
+    _preparar_engine(db.engine)
+
+
+# ============ CONTROL DE ADMISIÓN ============
+
+# Grupo de límite y clase de prioridad por endpoint; el resto va sin grupo y como 'cliente'
+_ADMISION_RUTAS = {
+    'reportes': ('reportes', 'reporte'),
+    'exportar': ('exportar', 'reporte'),
+    'admin_importar': ('importar', 'reporte'),
+    'admin_panel': ('admin_panel', 'admin'),
+    'admin_cita_accion': (None, 'admin'),
+    'rechazar_empeno': (None, 'admin'),
+    'marcar_pagado': (None, 'admin'),
+    'crear_admin': (None, 'admin'),
+    'admin_catalogo': (None, 'admin'),
+    'api_stats': (None, 'admin'),
+    'riesgo_cartera': ('reportes', 'reporte'),
+    'recalcular_riesgo': ('reportes', 'reporte'),
+}
+# Conexiones largas (SSE) y métricas quedan fuera del control de admisión
+_ADMISION_EXENTAS = {'static', 'api_stats_stream', 'api_admision', '_shutdown'}
+
+
+def _pares_config(valor):
+    """'reportes:2,exportar:1' -> {'reportes': '2', 'exportar': '1'}"""
+    return dict(p.strip().split(':', 1) for p in valor.split(',') if ':' in p)
+
+
+control_admision = admision.Admision(
+    app.config['ADMISION_LIMITE'],
+    app.config['ADMISION_COLA'],
+    {grupo: int(limite) for grupo, limite in _pares_config(app.config['ADMISION_LIMITES_RUTA']).items()},
+    {clase: int(ms) / 1000 for clase, ms in _pares_config(app.config['ADMISION_ESPERA_MS']).items()},
+)
+
+
+@app.before_request
+def _admitir():
+    """Ocupar lugar en los limitadores del endpoint o responder 503 + Retry-After"""
+    if not app.config['ADMISION_ACTIVA'] or request.endpoint in _ADMISION_EXENTAS:
+        return None
+    grupo, clase = _ADMISION_RUTAS.get(request.endpoint, (None, 'cliente'))
+    try:
+        g.admision = (control_admision.entrar(grupo, clase), time.monotonic())
+    except admision.Rechazado as rechazo:
+        logger.warning(f"Request rechazado por saturación: {request.method} {request.path} "
+                       f"({rechazo.limitador}, {rechazo.motivo})")
+        if request.path.startswith('/api/'):
+            respuesta = jsonify({'error': 'Servidor saturado', 'reintentar': rechazo.reintentar})
+        else:
+            respuesta = Response(f'<h1>Servidor ocupado</h1><p>Intente nuevamente en {rechazo.reintentar} '
+                                 f'segundos.</p>', mimetype='text/html')
+        respuesta.status_code = 503
+        respuesta.headers['Retry-After'] = str(rechazo.reintentar)
+        return respuesta
+    return None
+
+
+@app.teardown_request
+def _liberar_admision(exc=None):
+    # En las respuestas por streaming corre al terminar de enviarlas
+    ocupados = g.pop('admision', None)
+    if ocupados:
+        control_admision.salir(ocupados[0], time.monotonic() - ocupados[1])
+
+
+# ============ MANTENIMIENTO (RESPALDOS, VACÍO, ANALYZE) ============
+
+_ultima_actividad = time.monotonic()
+
+
+@app.before_request
+def _marcar_actividad():
+    global _ultima_actividad
+    _ultima_actividad = time.monotonic()
+
+
+def _hay_silencio():
+    """True si no hubo requests en los últimos MANTENIMIENTO_SILENCIO_SEGUNDOS"""
+    return time.monotonic() - _ultima_actividad >= app.config['MANTENIMIENTO_SILENCIO_SEGUNDOS']
+
+
+def _bases_sqlite():
+    """Archivos de todas las bases: principal, sucursales y sus archivos históricos"""
+    rutas = []
+    for sucursal in SUCURSALES:
+        ruta = _engine_sucursal(sucursal).url.database
+        rutas += [ruta, _ruta_archivo(ruta)]
+    return rutas
+
+
+def _carpeta_datos():
+    return os.path.dirname(os.path.abspath(db.engine.url.database))
+
+
+def ejecutar_mantenimiento(forzar=False, rutas=None):
+    """Respaldar todas las bases (o solo `rutas`) y, en una ventana sin actividad (o si
+    `forzar`), compactarlas y optimizarlas"""
+    carpeta = _carpeta_datos()
+    entradas = mantenimiento.mantener(
+        rutas or _bases_sqlite(),
+        os.path.join(carpeta, 'respaldos'),
+        os.path.join(carpeta, 'mantenimiento.jsonl'),
+        hay_silencio=(lambda: True) if forzar else _hay_silencio,
+        paginas=app.config['RESPALDO_PAGINAS'],
+        conservar=app.config['RESPALDOS_CONSERVAR'],
+    )
+    for entrada in entradas:
+        detalle = entrada.get('error') or entrada.get('omitido') or f"{entrada.get('segundos', 0):.2f}s"
+        logger.info(f"Mantenimiento {entrada['operacion']} de {os.path.basename(entrada['base'])}: {detalle}, "
+                    f"{entrada['bytes_antes'] / 1e6:.1f} MB -> {entrada['bytes_despues'] / 1e6:.1f} MB")
+    return entradas
+
+
+def _hilo_mantenimiento(espera_inicial=600, espera_silencio=3600):
+    """Mantenimiento periódico en segundo plano (lanzador de escritorio)"""
+    time.sleep(espera_inicial)
+    pendientes = None  # Bases cuyo respaldo se cortó por escrituras continuas
+    while True:
+        # Esperar (hasta `espera_silencio` segundos) una ventana sin requests antes de empezar
+        limite = time.monotonic() + espera_silencio
+        while not _hay_silencio() and time.monotonic() < limite:
+            time.sleep(30)
+        try:
+            with app.app_context():
+                entradas = ejecutar_mantenimiento(rutas=pendientes)
+            pendientes = [entrada['base'] for entrada in entradas if entrada.get('reintentar')]
+        except Exception as e:
+            pendientes = []
+            logger.error(f"Error en mantenimiento de la base: {e}")
+        if pendientes:
+            # Reintentar esos respaldos en la próxima ventana sin actividad, no en el próximo ciclo
+            time.sleep(app.config['MANTENIMIENTO_SILENCIO_SEGUNDOS'])
+            continue
+        pendientes = None
+        time.sleep(app.config['MANTENIMIENTO_INTERVALO_HORAS'] * 3600)
 
 
 usuario_activo = None
 LOAN_TERM_DAYS = 30
+EMPENOS_POR_PAGINA = 20  # Empeños por página en la carga diferida del panel
+LOTE_LISTADO = 500  # Filas por consulta en los listados generados en streaming
+DASHBOARD_KEEPALIVE = 15  # Segundos entre keepalives del stream SSE del panel admin
 INTERES_RENOVACION = 0.05  # 5% interés por renovación
 INTERES_DIARIO = 0.001  # 0.1% interés diario
+REINTENTOS_CONCURRENCIA = 5  # Reintentos de una transición de empeño ante conflicto de versión
+ESTADOS_CITA_ACTIVOS = ('pendiente', 'confirmada')  # Citas que ocupan un turno de la agenda
 
 
 # ============ UTILIDADES Y VALIDACIÓN ============
 
+# Patrones de validación (compartidos con la importación masiva de importador.py)
+# DNI debe ser numérico y tener entre 7-8 dígitos
+PATRON_DNI = r'^\d{7,8}$'
+PATRON_EMAIL = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+# Aceptar números con o sin guiones/espacios
+PATRON_TELEFONO = r'^[\d\s\-\+\(\)]{7,20}$'
+PATRONES_VALIDACION = {'dni': PATRON_DNI, 'email': PATRON_EMAIL, 'telefono': PATRON_TELEFONO}
+
+
 def validar_dni(dni):
     """Validar formato de DNI"""
     if not dni or not isinstance(dni, str):
         return False
-    # DNI debe ser numérico y tener entre 7-8 dígitos
-    return bool(re.match(r'^\d{7,8}$', dni.strip()))
+    return bool(re.match(PATRON_DNI, dni.strip()))
 
 
 def validar_email(email):
     """Validar formato de email"""
     if not email:
         return True  # Email es opcional
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email.strip()))
+    return bool(re.match(PATRON_EMAIL, email.strip()))
 
 
 def validar_telefono(telefono):
     """Validar formato de teléfono"""
     if not telefono:
         return True  # Teléfono es opcional
-    # Aceptar números con o sin guiones/espacios
-    return bool(re.match(r'^[\d\s\-\+\(\)]{7,20}$', telefono.strip()))
+    return bool(re.match(PATRON_TELEFONO, telefono.strip()))
 
 
 def sanitizar_input(texto, max_length=500):
@@ -193,6 +835,59 @@ def sanitizar_input(texto, max_length=500):
     return texto[:max_length]
 
 
+# Consume un token del bucket en una sola sentencia (atómica en SQLite): si el bucket
+# recargado no llega a 1 token, el WHERE del upsert no actualiza nada y rowcount es 0.
+_SQL_CONSUMIR_TOKEN = text("""
+    INSERT INTO login_throttle (clave, tokens, actualizado)
+    VALUES (:clave, :capacidad - 1, :ahora)
+    ON CONFLICT(clave) DO UPDATE SET
+        tokens = MIN(:capacidad, tokens + (:ahora - actualizado) * :tasa) - 1,
+        actualizado = :ahora
+    WHERE MIN(:capacidad, tokens + (:ahora - actualizado) * :tasa) >= 1
+""")
+
+
+def consumir_intento_login(*claves):
+    """Descontar un intento de cada bucket; False si alguno está agotado"""
+    params = {
+        'capacidad': app.config['LOGIN_RAFAGA'],
+        'tasa': app.config['LOGIN_POR_MINUTO'] / 60.0,
+        'ahora': time.time(),
+    }
+    # Siempre en la base principal: un bucket por sucursal permitiría saltear el límite
+    try:
+        with db.engine.begin() as conn:
+            for clave in claves:
+                if conn.execute(_SQL_CONSUMIR_TOKEN, dict(params, clave=clave)).rowcount != 1:
+                    return False
+        return True
+    except Exception as e:
+        logger.error(f"Error en throttling de login: {e}")
+        return True
+
+
+# Pool acotado para verificar hashes: como mucho HASH_WORKERS hashes en paralelo y
+# HASH_COLA en espera; el resto se rechaza enseguida en lugar de saturar la CPU.
+_pool_hash = ThreadPoolExecutor(max_workers=app.config['HASH_WORKERS'], thread_name_prefix='hash')
+_cupos_hash = threading.BoundedSemaphore(app.config['HASH_WORKERS'] + app.config['HASH_COLA'])
+
+
+def verificar_password(password_hash, password):
+    """True/False según la contraseña, o None si el pool de hash está saturado"""
+    if not _cupos_hash.acquire(blocking=False):
+        return None
+    try:
+        futuro = _pool_hash.submit(check_password_hash, password_hash, password)
+    except Exception:
+        _cupos_hash.release()
+        raise
+    futuro.add_done_callback(lambda _: _cupos_hash.release())
+    try:
+        return futuro.result(timeout=app.config['HASH_TIMEOUT'])
+    except FuturesTimeoutError:
+        return None
+
+
 def login_required(f):
     """Decorador para rutas que requieren login"""
     @wraps(f)
@@ -215,6 +910,158 @@ def admin_required(f):
     return decorated_function
 
 
+def _reservar_clave(clave):
+    """Registrar la clave como 'en_curso'. Devuelve None si es nueva o la fila ya existente"""
+    tabla = ClaveIdempotencia.__table__
+    ahora = datetime.now(timezone.utc)
+    with db.engine.begin() as conn:
+        # Expulsión por TTL: borrado indexado por expires_at
+        conn.execute(tabla.delete().where(tabla.c.expires_at < ahora.isoformat()))
+        nueva = conn.execute(sqlite_insert(tabla).values(
+            clave=clave, estado='en_curso',
+            expires_at=(ahora + timedelta(minutes=app.config['IDEMPOTENCIA_TTL_MINUTOS'])).isoformat(),
+        ).on_conflict_do_nothing()).rowcount
+        if nueva:
+            return None
+        return conn.execute(tabla.select().where(tabla.c.clave == clave)).first()
+
+
+def _esperar_clave(clave, espera=5.0):
+    """Esperar a que termine el request que tiene la clave en curso (doble clic)"""
+    tabla = ClaveIdempotencia.__table__
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        with db.engine.connect() as conn:
+            fila = conn.execute(tabla.select().where(tabla.c.clave == clave)).first()
+        if fila is None or fila.estado == 'hecho':
+            return fila
+    return None
+
+
+def _cerrar_clave(clave, respuesta=None, flashes=()):
+    """Guardar el resultado (redirección y mensajes) o liberar la clave si no se puede repetir"""
+    tabla = ClaveIdempotencia.__table__
+    with db.engine.begin() as conn:
+        if respuesta is None:
+            conn.execute(tabla.delete().where(tabla.c.clave == clave))
+        else:
+            conn.execute(tabla.update().where(tabla.c.clave == clave).values(
+                estado='hecho', status=respuesta.status_code, location=respuesta.location,
+                flashes=json.dumps(list(flashes), ensure_ascii=False),
+            ))
+
+
+def idempotente(f):
+    """Decorador para POSTs de escritura: un reintento con la misma clave no repite la operación.
+
+    Solo se guardan los resultados exitosos: redirecciones (el patrón de las rutas de escritura)
+    sin mensajes de categoría 'error'. Cualquier otra respuesta, un mensaje de error (conflicto
+    de versión, validación fallida) o una excepción liberan la clave para que el reintento se
+    procese.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        clave = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if not clave:
+            return f(*args, **kwargs)
+        clave = f'{request.path}:{clave[:100]}'
+
+        existente = _reservar_clave(clave)
+        if existente is not None:
+            if existente.estado != 'hecho':
+                existente = _esperar_clave(clave)
+            if existente is None or existente.estado != 'hecho':
+                flash('La operación ya se está procesando', 'info')
+                return redirect(request.referrer or url_for('index'))
+            for categoria, mensaje in json.loads(existente.flashes or '[]'):
+                flash(mensaje, categoria)
+            logger.info(f"POST repetido en {request.path}: se devuelve el resultado guardado")
+            return redirect(existente.location, code=existente.status)
+
+        previos = len(session.get('_flashes', []))
+        try:
+            respuesta = app.make_response(f(*args, **kwargs))
+        except Exception:
+            _cerrar_clave(clave)
+            raise
+        nuevos = session.get('_flashes', [])[previos:]
+        if 300 <= respuesta.status_code < 400 and respuesta.location and \
+                not any(categoria == 'error' for categoria, _ in nuevos):
+            _cerrar_clave(clave, respuesta, nuevos)
+        else:
+            _cerrar_clave(clave)
+        return respuesta
+    return decorated_function
+
+
+def _con_reintentos(transicion, descripcion):
+    """Ejecutar la transición de un empeño reintentando ante conflictos de versión.
+
+    El commit hace UPDATE ... WHERE id = ? AND version = ?; si otra transacción cambió el
+    empeño primero, SQLAlchemy lanza StaleDataError, se descarta la transacción y se vuelve
+    a ejecutar `transicion`, que relee y valida el estado actual. Tras REINTENTOS_CONCURRENCIA
+    conflictos seguidos se propaga el StaleDataError.
+    """
+    for intento in range(1, REINTENTOS_CONCURRENCIA + 1):
+        try:
+            return transicion()
+        except StaleDataError:
+            db.session.rollback()
+            if intento == REINTENTOS_CONCURRENCIA:
+                raise
+            logger.info(f"Conflicto de versión en {descripcion}; reintento {intento}")
+            time.sleep(0.005 * intento)
+
+
+# Series de índices en memoria (indices.py), creadas en el primer uso. Sin archivo, las tasas
+# son las constantes de arriba y el IPC vale 1 (no ajusta)
+SERIES_INDICES = {'ipc': 1.0, 'tasa_diaria': INTERES_DIARIO, 'tasa_renovacion': INTERES_RENOVACION}
+_indices = None
+_indices_lock = threading.Lock()
+
+
+def _registrar_indices(series, error):
+    if error:
+        logger.error(f"Error leyendo series de índices (se mantiene la versión anterior): {error}")
+    logger.info(f"Series de índices de {app.config['INDICES_DIR']}: {', '.join(series) or 'ninguna'}")
+
+
+def _serie(nombre):
+    """Serie vigente de SERIES_INDICES ('ipc', 'tasa_diaria' o 'tasa_renovacion')"""
+    global _indices
+    if _indices is None:
+        with _indices_lock:
+            if _indices is None:
+                import indices
+                _indices = indices.Indices(app.config['INDICES_DIR'], SERIES_INDICES,
+                                           app.config['INDICES_REVISION_SEGUNDOS'], _registrar_indices)
+    return _indices.serie(nombre)
+
+
+def _dia(momento):
+    """datetime con zona -> días desde 1970-01-01 con fracción (la escala de las series)"""
+    return momento.timestamp() / 86400.0
+
+
+def ajustar_por_inflacion(valores, desde, hasta):
+    """Montos en pesos de `desde` llevados a pesos de `hasta` (días, escalares o arreglos)"""
+    return valores * _serie('ipc').factor(desde, hasta)
+
+
+def intereses_acumulados(creados, capital, renovaciones, hasta):
+    """Interés de cada empeño hasta `hasta` (días, escalares o arreglos): el recargo por
+    renovación vigente a la fecha de creación (la última renovación) más la tasa diaria
+    acumulada por cada día completo transcurrido"""
+    if isinstance(creados, float):
+        transcurridos = math.floor(hasta - creados)
+    else:
+        import numpy as np
+        transcurridos = np.floor(hasta - creados)
+    return (capital * _serie('tasa_renovacion').valor(creados) * renovaciones
+            + capital * _serie('tasa_diaria').acumulado(creados, creados + transcurridos))
+
+
 def calcular_interes_acumulado(created_iso, valor_inicial, renovaciones=0):
     """Calcular interés acumulado por días transcurridos"""
     now = datetime.now(timezone.utc)
@@ -223,11 +1070,8 @@ def calcular_interes_acumulado(created_iso, valor_inicial, renovaciones=0):
     except Exception:
         return 0.0
     
-    dias = (now - created).days
-    interes_renovaciones = valor_inicial * INTERES_RENOVACION * renovaciones
-    interes_diario_total = valor_inicial * INTERES_DIARIO * dias
-    
-    return interes_renovaciones + interes_diario_total
+    # Redondeo a 6 decimales: que el error de punto flotante no reste un peso al truncar
+    return round(float(intereses_acumulados(_dia(created), valor_inicial, renovaciones, _dia(now))), 6)
 
 
 def validar_fecha_cita(fecha_str):
@@ -260,13 +1104,67 @@ def validar_hora_cita(hora_str):
         return False, f"Error validando hora: {str(e)}"
 
 
+def _elegir_sucursal(valor):
+    """Sucursal válida a partir de un valor de formulario/sesión"""
+    valor = (valor or '').strip().lower()
+    return valor if valor in SUCURSALES else SUCURSAL_PRINCIPAL
+
+
+@app.before_request
+def _fijar_sucursal():
+    """Enrutar el request a la base de la sucursal de la sesión"""
+    if session.get('is_admin') and request.args.get('sucursal'):
+        # El admin cambia la sucursal sobre la que opera con ?sucursal=<nombre>
+        session['sucursal'] = _elegir_sucursal(request.args.get('sucursal'))
+    g.sucursal = _elegir_sucursal(session.get('sucursal'))
+
+
+@app.after_request
+def _comprimir_respuesta(response):
+    """Comprimir con brotli/gzip las respuestas de texto según Accept-Encoding"""
+    minimo = app.config['COMPRESION_MINIMO']
+    if (not minimo or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in compresion.TIPOS_COMPRIMIBLES):
+        return response
+    response.vary.add('Accept-Encoding')
+    codificacion = compresion.elegir_codificacion(request.accept_encodings)
+    if not codificacion:
+        return response
+    nivel = app.config['COMPRESION_NIVEL']
+    if response.is_streamed:
+        # Streaming: se comprime bloque a bloque sin esperar al final del render
+        response.response = compresion.comprimir_flujo(response.response, codificacion, nivel)
+        response.headers.pop('Content-Length', None)
+    else:
+        datos = response.get_data()
+        if len(datos) < minimo:
+            return response
+        response.set_data(compresion.comprimir(datos, codificacion, nivel))
+    response.headers['Content-Encoding'] = codificacion
+    return response
+
+
+@app.context_processor
+def _contexto_sucursal():
+    return {'sucursales': SUCURSALES, 'sucursal_actual': _sucursal_actual() or SUCURSAL_PRINCIPAL}
+
+
+@app.context_processor
+def _contexto_idempotencia():
+    # Cada formulario de escritura lleva su propia clave: {{ clave_idempotencia() }}
+    return {'clave_idempotencia': lambda: secrets.token_urlsafe(16)}
+
+
 @app.route('/')
 def index():
     return render_template('index.html', usuario=usuario_activo)
 
 
 @app.route('/registrar', methods=['POST'])
+@idempotente
 def registrar():
+    g.sucursal = _elegir_sucursal(request.form.get('sucursal'))
     nombre = sanitizar_input(request.form.get('nombre', ''), 120)
     dni = sanitizar_input(request.form.get('dni', ''), 64)
     email = sanitizar_input(request.form.get('email', ''), 120)
@@ -293,6 +1191,7 @@ def registrar():
         nuevo = User(nombre=nombre, dni=dni, email=email, telefono=telefono)
         db.session.add(nuevo)
         db.session.commit()
+        dashboard.notificar()
         logger.info(f"Usuario registrado: {nombre} - DNI: {dni}")
         flash(f'Usuario {nombre} registrado con éxito', 'success')
     except IntegrityError:
@@ -310,18 +1209,25 @@ def registrar():
 @app.route('/login', methods=['POST'])
 def login():
     global usuario_activo
+    g.sucursal = _elegir_sucursal(request.form.get('sucursal'))
     dni = sanitizar_input(request.form.get('dni', ''), 64)
     
     if not validar_dni(dni):
         flash('DNI inválido', 'error')
         return redirect(url_for('index'))
     
+    if not consumir_intento_login(f'ip:{request.remote_addr}', f'dni:{dni}'):
+        logger.warning(f"Login bloqueado por exceso de intentos: DNI {dni} desde {request.remote_addr}")
+        flash('Demasiados intentos de ingreso. Espere unos minutos.', 'error')
+        return redirect(url_for('index'))
+    
     user = User.query.filter_by(dni=dni).first()
     if user:
         usuario_activo = user
         session.permanent = True
         session['user_id'] = user.id
         session['user_dni'] = user.dni
+        session['sucursal'] = g.sucursal
         logger.info(f"Login exitoso: {user.nombre} - DNI: {dni}")
         flash(f'Bienvenido, {user.nombre}', 'success')
         return redirect(url_for('panel'))
@@ -351,11 +1257,176 @@ def _days_left(created_iso, term=LOAN_TERM_DAYS):
     return max(left, 0), (created + timedelta(days=term)).isoformat()
 
 
+def _actualizar_resumen(user_id):
+    """Recalcular el resumen precalculado de un usuario.
+
+    Se llama dentro de la transacción de cada escritura (antes del commit), así que
+    solo agrega cambios a la sesión; las consultas usan los índices por user_id.
+    """
+    if user_id is None:
+        return None
+    # Los conteos incluyen los empeños ya archivados
+    empenos = _tabla_historica('empeno', ['estado'], where='user_id = :user_id')
+    conteos = dict(db.session.execute(
+        text(f'SELECT estado, COUNT(*) FROM {empenos} GROUP BY estado'), {'user_id': user_id}
+    ).all())
+    activos = Empeno.query.with_entities(Empeno.created_at, Empeno.term_days, Empeno.valor_estimado) \
+        .filter_by(user_id=user_id, estado='activo').all()
+    vencimientos = [_days_left(c, t or LOAN_TERM_DAYS)[1] for c, t, _ in activos]
+    hoy = datetime.now(timezone.utc).date().isoformat()
+    proxima_cita = Cita.query.with_entities(Cita.fecha, Cita.hora).filter(
+        Cita.user_id == user_id,
+        Cita.estado.in_(['pendiente', 'confirmada']),
+        Cita.fecha >= hoy
+    ).order_by(Cita.fecha, Cita.hora).first()
+
+    resumen = db.session.get(ResumenUsuario, user_id) or ResumenUsuario(user_id=user_id)
+    resumen.total_empenos = sum(conteos.values())
+    resumen.activos = conteos.get('activo', 0)
+    resumen.pagados = conteos.get('pagado', 0)
+    resumen.saldo_activo = sum(v or 0 for _, _, v in activos)
+    resumen.proximo_vencimiento = min(vencimientos) if vencimientos else None
+    resumen.proxima_cita_fecha = proxima_cita.fecha if proxima_cita else None
+    resumen.proxima_cita_hora = proxima_cita.hora if proxima_cita else None
+    resumen.actualizado = datetime.now(timezone.utc).isoformat()
+    db.session.add(resumen)
+    return resumen
+
+
+def _obtener_resumen(user_id):
+    """Resumen del usuario; lo crea la primera vez (usuarios anteriores a la tabla).
+
+    La próxima cita y el próximo vencimiento dependen de la fecha: si el resumen es de
+    un día anterior o su cita ya pasó, se recalcula aunque no haya habido escrituras.
+    """
+    resumen = db.session.get(ResumenUsuario, user_id)
+    hoy = datetime.now(timezone.utc).date().isoformat()
+    if resumen is None or (resumen.actualizado or '')[:10] < hoy or (resumen.proxima_cita_fecha or hoy)[:10] < hoy:
+        try:
+            resumen = _actualizar_resumen(user_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error calculando resumen del usuario {user_id}: {e}")
+    return resumen
+
+
+# Fila compacta de los listados de empeños (tupla con nombre: sin __dict__ por fila)
+FilaEmpeno = namedtuple('FilaEmpeno', (
+    'id', 'dni', 'nombre_usuario', 'tipo', 'descripcion', 'valor_estimado', 'valor_inicial',
+    'interes_acumulado', 'total_a_pagar', 'renovaciones', 'created_at', 'term_days',
+    'dias_restantes', 'expiracion', 'pagado', 'pagado_at', 'estado', 'border_color', 'border_class',
+))
+
+
+def _detalle_empeno(e, pagado_at, dni=None, nombre_usuario=None):
+    """Fila de un empeño para el panel de usuario y el listado admin"""
+    left, exp = _days_left(e.created_at, e.term_days or LOAN_TERM_DAYS)
+    pagado = pagado_at is not None
+
+    # Calcular interés acumulado
+    interes = int(calcular_interes_acumulado(
+        e.created_at, 
+        e.valor_inicial or e.valor_estimado, 
+        e.renovaciones
+    ))
+    # Color y clase de borde para la tarjeta en UI ('paid', 'active', 'expired'),
+    # para evitar lógica CSS en plantilla
+    if pagado:
+        border_color, border_class = '#27ae60', 'paid'
+    elif left > 0:
+        border_color, border_class = '#3498db', 'active'
+    else:
+        border_color, border_class = '#e74c3c', 'expired'
+
+    return FilaEmpeno(
+        e.id, dni, nombre_usuario, e.tipo, e.descripcion, e.valor_estimado,
+        e.valor_inicial or e.valor_estimado, interes, e.valor_estimado + interes, e.renovaciones,
+        e.created_at, e.term_days, left, exp, pagado, pagado_at, e.estado or 'activo',
+        border_color, border_class,
+    )
+
+
+def _ultimos_pagos(empeno_ids):
+    """{empeno_id: fecha del último pago} en una sola consulta"""
+    if not empeno_ids:
+        return {}
+    return dict(
+        db.session.query(PaidLog.empeno_id, db.func.max(PaidLog.time))
+        .filter(PaidLog.empeno_id.in_(empeno_ids)).group_by(PaidLog.empeno_id).all()
+    )
+
+
+def _filas_empenos_admin(filtros):
+    """Generar las filas del listado admin por lotes (keyset por id: un lote en memoria a la vez)"""
+    ultimo = 0
+    while True:
+        lote = db.session.query(Empeno, User.dni, User.nombre) \
+            .outerjoin(User, Empeno.user_id == User.id) \
+            .filter(Empeno.id > ultimo, *filtros) \
+            .order_by(Empeno.id).limit(LOTE_LISTADO).all()
+        if not lote:
+            return
+        pagos = _ultimos_pagos([e.id for e, _, _ in lote])
+        for e, dni, nombre in lote:
+            yield _detalle_empeno(e, pagos.get(e.id), dni, nombre)
+        ultimo = lote[-1][0].id
+
+
+def _filas_usuarios():
+    """Generar los usuarios (solo las columnas del listado) por lotes"""
+    ultimo = 0
+    while True:
+        lote = db.session.query(User.id, User.nombre, User.dni, User.email, User.telefono, User.created_at) \
+            .filter(User.id > ultimo).order_by(User.id).limit(LOTE_LISTADO).all()
+        if not lote:
+            return
+        yield from lote
+        ultimo = lote[-1].id
+
+
+def _en_bloques(fragmentos, tamano=16384):
+    """Agrupar los fragmentos de Jinja en bloques de ~`tamano` caracteres por escritura"""
+    buffer, acumulado = [], 0
+    for fragmento in fragmentos:
+        buffer.append(fragmento)
+        acumulado += len(fragmento)
+        if acumulado >= tamano:
+            yield ''.join(buffer)
+            buffer, acumulado = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _render_streaming(plantilla, **contexto):
+    """Renderizar una plantilla en streaming: el HTML se envía a medida que se generan las filas"""
+    # Los flashes se leen antes de enviar los headers para que la cookie de sesión los descarte
+    get_flashed_messages(with_categories=True)
+    return Response(_en_bloques(stream_template(plantilla, **contexto)), mimetype='text/html')
+
+
 @app.route('/panel')
 @login_required
 def panel():
-    historial = []
     search_query = request.args.get('search', '').strip()
+    resumen = _obtener_resumen(usuario_activo.id)
+    
+    # Citas del usuario (las más recientes; la próxima ya está en el resumen)
+    try:
+        citas = Cita.query.filter_by(user_id=usuario_activo.id).order_by(Cita.created_at.desc()).limit(10).all()
+    except Exception:
+        citas = []
+
+    # El historial de empeños se carga por páginas desde /panel/empenos
+    return render_template('panel.html', usuario=usuario_activo, resumen=resumen, search_query=search_query, citas=citas)
+
+
+@app.route('/panel/empenos')
+@login_required
+def panel_empenos():
+    """Página del historial de empeños del usuario (fragmento HTML para el panel)"""
+    search_query = request.args.get('search', '').strip()
+    pagina = max(request.args.get('pagina', 1, type=int) or 1, 1)
     
     query = Empeno.query.filter_by(user_id=usuario_activo.id)
     
@@ -366,61 +1437,21 @@ def panel():
             (Empeno.descripcion.contains(search_query))
         )
     
-    for e in query.all():
-        left, exp = _days_left(e.created_at, e.term_days or LOAN_TERM_DAYS)
-        paid_entry = PaidLog.query.filter_by(empeno_id=e.id).order_by(PaidLog.time.desc()).first()
-        pagado = bool(paid_entry)
-        pagado_at = paid_entry.time if paid_entry else None
-        
-        # Calcular interés acumulado
-        interes = calcular_interes_acumulado(
-            e.created_at, 
-            e.valor_inicial or e.valor_estimado, 
-            e.renovaciones
-        )
-        total_a_pagar = e.valor_estimado + int(interes)
-        
-        historial.append({
-            'id': e.id,
-            'tipo': e.tipo,
-            'descripcion': e.descripcion,
-            'valor_estimado': e.valor_estimado,
-            'valor_inicial': e.valor_inicial or e.valor_estimado,
-            'interes_acumulado': int(interes),
-            'total_a_pagar': total_a_pagar,
-            'renovaciones': e.renovaciones,
-            'created_at': e.created_at,
-            'term_days': e.term_days,
-            'dias_restantes': left,
-            'expiracion': exp,
-            'pagado': pagado,
-            'pagado_at': pagado_at,
-            'estado': e.estado or 'activo'
-        })
-        # Agregar color de borde para la tarjeta en UI y evitar lógica CSS en plantilla
-        try:
-            # color y clase de borde: 'paid', 'active', 'expired'
-            if pagado:
-                historial[-1]['border_color'] = '#27ae60'
-                historial[-1]['border_class'] = 'paid'
-            elif left > 0:
-                historial[-1]['border_color'] = '#3498db'
-                historial[-1]['border_class'] = 'active'
-            else:
-                historial[-1]['border_color'] = '#e74c3c'
-                historial[-1]['border_class'] = 'expired'
-        except Exception:
-            historial[-1]['border_color'] = '#3498db'
-            historial[-1]['border_class'] = 'active'
-    
-    # Citas del usuario (para mostrarlas en el panel)
-    try:
-        citas = Cita.query.filter_by(user_id=usuario_activo.id).order_by(Cita.created_at.desc()).all()
-    except Exception:
-        citas = []
-
-    return render_template('panel.html', usuario=usuario_activo, historial=historial, search_query=search_query, citas=citas)
+    # Una fila extra para saber si hay otra página sin hacer COUNT(*)
+    empenos = query.order_by(Empeno.id.desc()) \
+        .offset((pagina - 1) * EMPENOS_POR_PAGINA).limit(EMPENOS_POR_PAGINA + 1).all()
+    hay_mas = len(empenos) > EMPENOS_POR_PAGINA
+    empenos = empenos[:EMPENOS_POR_PAGINA]
+    pagos = _ultimos_pagos([e.id for e in empenos])
+    historial = [_detalle_empeno(e, pagos.get(e.id)) for e in empenos]
 
+    return render_template(
+        '_panel_empenos.html',
+        historial=historial,
+        pagina=pagina,
+        hay_mas=hay_mas,
+        search_query=search_query
+    )
 
 
 @app.route('/admin_login', methods=['POST'])
@@ -433,9 +1464,20 @@ def admin_login():
         flash('Usuario y contraseña son obligatorios', 'error')
         return redirect(url_for('index'))
     
+    if not consumir_intento_login(f'ip:{request.remote_addr}', f'admin:{username}'):
+        logger.warning(f"Login admin bloqueado por exceso de intentos: {username} desde {request.remote_addr}")
+        flash('Demasiados intentos de ingreso. Espere unos minutos.', 'error')
+        return redirect(url_for('index'))
+    
     admin = Admin.query.filter_by(username=username).first()
+    valido = verificar_password(admin.password_hash, password) if admin else False
     
-    if admin and admin.check_password(password):
+    if valido is None:
+        logger.warning(f"Pool de verificación de contraseñas saturado: {username}")
+        flash('El servidor está ocupado. Intente nuevamente en unos segundos.', 'error')
+        return redirect(url_for('index'))
+    
+    if valido:
         usuario_activo = {
             'nombre': f'Administrador ({username})',
             'dni': 'admin',
@@ -454,18 +1496,60 @@ def admin_login():
     return redirect(url_for('index'))
 
 
+# Consultas de estadísticas por sucursal (también las usa el servidor ASGI sobre aiosqlite)
+SQL_STATS_EMPENOS = ("SELECT COUNT(*), COALESCE(SUM(estado = 'activo'), 0), COALESCE(SUM(estado = 'pagado'), 0) "
+                     f"FROM {_tabla_historica('empeno', ['estado'])}")
+SQL_TOTAL_USUARIOS = 'SELECT COUNT(*) FROM "user"'
+
+
+def _armar_stats(totales_empenos, total_usuarios):
+    total_empenos, total_activos, total_pagados = totales_empenos
+    return {
+        'total_empenos': total_empenos,
+        'total_pagados': total_pagados,
+        'total_activos': total_activos,
+        'total_usuarios': total_usuarios
+    }
+
+
+def _stats_sucursal():
+    """Totales de empeños (activos + archivados) y de usuarios de la sucursal actual"""
+    return _armar_stats(db.session.execute(text(SQL_STATS_EMPENOS)).one(),
+                        db.session.execute(text(SQL_TOTAL_USUARIOS)).scalar())
+
+
+def _sumar_stats(parciales):
+    stats = {}
+    for parcial in parciales:
+        for clave, valor in parcial.items():
+            stats[clave] = stats.get(clave, 0) + valor
+    return stats
+
+
+def _stats_globales():
+    """Totales sumados de todas las sucursales (consultas en paralelo)"""
+    return _sumar_stats(en_todas_las_sucursales(_stats_sucursal).values())
+
+
+def _estado_dashboard():
+    with app.app_context():
+        return _stats_globales()
+
+
+# Panel admin en vivo: un publicador SSE alimentado por las rutas de escritura
+dashboard = eventos.Publicador(_estado_dashboard)
+
+
 @app.route('/admin_panel')
 @admin_required
 def admin_panel():
     search_query = request.args.get('search', '').strip()
     estado_filter = request.args.get('estado', '').strip()
     
-    enriched = []
-    empeno_query = Empeno.query
-    
+    filtros = []
     # Filtros de búsqueda
     if search_query:
-        empeno_query = empeno_query.join(User).filter(
+        filtros.append(
             (Empeno.tipo.contains(search_query)) |
             (Empeno.descripcion.contains(search_query)) |
             (User.dni.contains(search_query)) |
@@ -473,68 +1557,41 @@ def admin_panel():
         )
     
     if estado_filter:
-        empeno_query = empeno_query.filter(Empeno.estado == estado_filter)
-    
-    for e in empeno_query.all():
-        left, exp = _days_left(e.created_at, e.term_days or LOAN_TERM_DAYS)
-        paid_entry = PaidLog.query.filter_by(empeno_id=e.id).order_by(PaidLog.time.desc()).first()
-        pagado = bool(paid_entry)
-        pagado_at = paid_entry.time if paid_entry else None
-        
-        interes = calcular_interes_acumulado(
-            e.created_at,
-            e.valor_inicial or e.valor_estimado,
-            e.renovaciones
-        )
-        total_a_pagar = e.valor_estimado + int(interes)
-        
-        enriched.append({
-            'id': e.id,
-            'dni': e.user.dni if e.user else None,
-            'nombre_usuario': e.user.nombre if e.user else None,
-            'tipo': e.tipo,
-            'descripcion': e.descripcion,
-            'valor_estimado': e.valor_estimado,
-            'valor_inicial': e.valor_inicial or e.valor_estimado,
-            'interes_acumulado': int(interes),
-            'total_a_pagar': total_a_pagar,
-            'renovaciones': e.renovaciones,
-            'created_at': e.created_at,
-            'term_days': e.term_days,
-            'expiracion': exp,
-            'pagado': pagado,
-            'pagado_at': pagado_at,
-            'estado': e.estado or 'activo'
-        })
+        filtros.append(Empeno.estado == estado_filter)
     
-    users_db = User.query.all()
-    renov_log = RenovationLog.query.order_by(RenovationLog.time.desc()).limit(50).all()
-    pagos_log = PaidLog.query.order_by(PaidLog.time.desc()).limit(50).all()
-    # Citas recientes
-    citas_db = Cita.query.order_by(Cita.created_at.desc()).limit(200).all()
+    total_empenos = db.session.query(db.func.count(Empeno.id)) \
+        .outerjoin(User, Empeno.user_id == User.id).filter(*filtros).scalar()
+    total_usuarios = db.session.query(db.func.count(User.id)).scalar()
+    # La plantilla se genera después de que la vista retorna, con la sesión ya cerrada: se le pasan
+    # filas de columnas ya leídas, no objetos ORM (sus relaciones no podrían cargarse)
+    renov_log = db.session.query(
+        RenovationLog.empeno_id, RenovationLog.by, RenovationLog.time, RenovationLog.old, RenovationLog.new,
+        RenovationLog.by_admin,
+    ).order_by(RenovationLog.time.desc()).limit(50).all()
+    pagos_log = db.session.query(
+        PaidLog.empeno_id, PaidLog.time, PaidLog.monto_pagado, PaidLog.interes_pagado, PaidLog.by_admin,
+    ).order_by(PaidLog.time.desc()).limit(50).all()
+    # Citas recientes, con el nombre y DNI del usuario
+    citas_db = db.session.query(
+        Cita.id, Cita.empeno_id, Cita.fecha, Cita.hora, Cita.tasador, Cita.estado, User.nombre, User.dni,
+    ).outerjoin(User, Cita.user_id == User.id).order_by(Cita.created_at.desc()).limit(200).all()
     
-    # Estadísticas
-    total_empenos = Empeno.query.count()
-    total_pagados = PaidLog.query.distinct(PaidLog.empeno_id).count()
-    total_activos = Empeno.query.filter_by(estado='activo').count()
-    total_usuarios = User.query.count()
+    # Estadísticas (incluyen el archivo histórico)
+    stats = _stats_globales()
     
-    stats = {
-        'total_empenos': total_empenos,
-        'total_pagados': total_pagados,
-        'total_activos': total_activos,
-        'total_usuarios': total_usuarios
-    }
-    
-    return render_template(
+    # Empeños y usuarios se generan por lotes mientras se envía la página
+    return _render_streaming(
         'admin.html',
         usuario=usuario_activo,
-        usuarios=users_db,
-        empenos=enriched,
+        usuarios=_filas_usuarios(),
+        total_usuarios=total_usuarios,
+        empenos=_filas_empenos_admin(filtros),
+        total_empenos=total_empenos,
         citas=citas_db,
         renovaciones_log=renov_log,
         pagos_log=pagos_log,
         stats=stats,
+        total_catalogo=len(_catalogo()),
         search_query=search_query,
         estado_filter=estado_filter
     )
@@ -542,6 +1599,7 @@ def admin_panel():
 
 @app.route('/admin/cita/accion', methods=['POST'])
 @admin_required
+@idempotente
 def admin_cita_accion():
     try:
         cita_id = int(request.form.get('cita_id', 0))
@@ -555,22 +1613,55 @@ def admin_cita_accion():
         flash('Cita no encontrada', 'error')
         return redirect(url_for('admin_panel'))
 
+    agenda_suc = _agenda_sucursal()
+    anterior = cita.estado
+    fecha, hora = cita.fecha, cita.hora
+    reocupado = None
     try:
         if action == 'confirmar':
+            if anterior not in ESTADOS_CITA_ACTIVOS:
+                # Una cita rechazada vuelve a ocupar su turno: primero su tasador, si no otro libre
+                dia = agenda.parsear_dia(fecha)
+                reocupado = agenda_suc.ocupar(dia, hora, cita.tasador) or agenda_suc.ocupar(dia, hora)
+                if reocupado is None:
+                    flash(f'El turno de la cita #{cita.id} ya fue ocupado. Próximos turnos: '
+                          f'{_describir_turnos(agenda_suc.siguientes_libres(dia, hora, k=3))}', 'error')
+                    return redirect(url_for('admin_panel'))
+                cita.tasador = reocupado
             cita.estado = 'confirmada'
-            flash(f'Cita #{cita.id} confirmada', 'success')
         elif action == 'rechazar':
             cita.estado = 'rechazada'
-            flash(f'Cita #{cita.id} rechazada', 'info')
         else:
             flash('Acción desconocida', 'error')
             return redirect(url_for('admin_panel'))
 
-        db.session.add(cita)
-        db.session.commit()
+        try:
+            db.session.add(cita)
+            _actualizar_resumen(cita.user_id)
+            db.session.commit()
+        except IntegrityError:
+            # Otro proceso tomó el turno (índice único): se relee el día desde la base
+            db.session.rollback()
+            agenda_suc.recargar_dia(agenda.parsear_dia(fecha), [(h, t) for _, h, t in _citas_activas(fecha)])
+            flash(f'El turno de la cita #{cita_id} se acaba de ocupar', 'error')
+            return redirect(url_for('admin_panel'))
+        if anterior in ESTADOS_CITA_ACTIVOS and cita.estado not in ESTADOS_CITA_ACTIVOS:
+            # El turno vuelve a quedar libre en la agenda
+            try:
+                agenda_suc.liberar(agenda.parsear_dia(fecha), hora, cita.tasador)
+            except ValueError:
+                pass
+        if cita.estado == 'confirmada':
+            flash(f'Cita #{cita.id} confirmada', 'success')
+        else:
+            flash(f'Cita #{cita.id} rechazada', 'info')
+        dashboard.notificar('cita', id=cita.id, fecha=cita.fecha, hora=cita.hora, estado=cita.estado,
+                            sucursal=_sucursal_actual())
         logger.info(f"Admin {session.get('admin_username')} cambió estado de cita {cita.id} a {cita.estado}")
     except Exception as e:
         db.session.rollback()
+        if reocupado is not None:
+            agenda_suc.liberar(agenda.parsear_dia(fecha), hora, reocupado)
         logger.error(f"Error cambiando estado de cita: {e}")
         flash('Error al actualizar la cita', 'error')
 
@@ -579,6 +1670,7 @@ def admin_cita_accion():
 
 @app.route('/rechazar_empeno', methods=['POST'])
 @admin_required
+@idempotente
 def rechazar_empeno():
     try:
         emp_id = int(request.form.get('id', 0))
@@ -595,11 +1687,24 @@ def rechazar_empeno():
         flash(f'No se puede rechazar el empeño {emp_id} porque fue renovado', 'warning')
         return redirect(url_for('admin_panel'))
     
-    try:
-        db.session.delete(target)
+    def _rechazar():
+        empeno = db.session.get(Empeno, emp_id, populate_existing=True)
+        if empeno is None or empeno.renovaciones:
+            return False
+        db.session.delete(empeno)
+        _actualizar_resumen(empeno.user_id)
         db.session.commit()
-        logger.info(f"Empeño {emp_id} rechazado por admin")
-        flash(f'Empeño {emp_id} rechazado y eliminado', 'success')
+        return True
+
+    try:
+        if _con_reintentos(_rechazar, f'rechazo del empeño {emp_id}'):
+            dashboard.notificar()
+            logger.info(f"Empeño {emp_id} rechazado por admin")
+            flash(f'Empeño {emp_id} rechazado y eliminado', 'success')
+        else:
+            flash(f'El empeño {emp_id} cambió mientras se procesaba y ya no se puede rechazar', 'warning')
+    except StaleDataError:
+        flash('El empeño está siendo modificado por otra operación. Intente nuevamente', 'error')
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error rechazando empeño {emp_id}: {e}")
@@ -610,6 +1715,7 @@ def rechazar_empeno():
 
 @app.route('/marcar_pagado', methods=['POST'])
 @admin_required
+@idempotente
 def marcar_pagado():
     try:
         emp_id = int(request.form.get('id', 0))
@@ -622,7 +1728,15 @@ def marcar_pagado():
         flash(f'No se encontró empeño con ID {emp_id}', 'error')
         return redirect(url_for('admin_panel'))
     
-    try:
+    if empeno.estado == 'pagado':
+        flash(f'El empeño {emp_id} ya estaba pagado', 'warning')
+        return redirect(url_for('admin_panel'))
+    
+    def _pagar():
+        # Se relee en cada intento: otra operación pudo renovarlo o pagarlo mientras tanto
+        empeno = db.session.get(Empeno, emp_id, populate_existing=True)
+        if empeno is None or empeno.estado == 'pagado':
+            return None
         now = datetime.now(timezone.utc).isoformat()
         
         # Calcular interés final
@@ -645,10 +1759,22 @@ def marcar_pagado():
         empeno.estado = 'pagado'
         empeno.interes_acumulado = interes
         db.session.add(empeno)
+        _actualizar_resumen(empeno.user_id)
         
         db.session.commit()
-        logger.info(f"Empeño {emp_id} marcado como pagado. Monto: ${empeno.valor_estimado}, Interés: ${int(interes)}")
-        flash(f'Empeño {emp_id} marcado como pagado. Total: ${empeno.valor_estimado + int(interes)}', 'success')
+        return empeno.valor_estimado, interes
+    
+    try:
+        resultado = _con_reintentos(_pagar, f'pago del empeño {emp_id}')
+        if resultado is None:
+            flash(f'El empeño {emp_id} ya estaba pagado', 'warning')
+            return redirect(url_for('admin_panel'))
+        monto, interes = resultado
+        dashboard.notificar()
+        logger.info(f"Empeño {emp_id} marcado como pagado. Monto: ${monto}, Interés: ${int(interes)}")
+        flash(f'Empeño {emp_id} marcado como pagado. Total: ${monto + int(interes)}', 'success')
+    except StaleDataError:
+        flash('El empeño está siendo modificado por otra operación. Intente nuevamente', 'error')
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error marcando empeño {emp_id} como pagado: {e}")
@@ -658,6 +1784,7 @@ def marcar_pagado():
 
 
 @app.route('/renovar_empeno', methods=['POST'])
+@idempotente
 def renovar_empeno():
     if not usuario_activo:
         flash('Debe iniciar sesión', 'error')
@@ -689,10 +1816,14 @@ def renovar_empeno():
         flash('No se puede renovar un empeño ya pagado', 'warning')
         return redirect(url_for('panel') if isinstance(usuario_activo, User) else url_for('admin_panel'))
     
-    try:
+    def _renovar():
+        # Se relee en cada intento: el nuevo valor se calcula sobre la versión vigente
+        empeno = db.session.get(Empeno, emp_id, populate_existing=True)
+        if empeno is None or empeno.estado == 'pagado':
+            return None
         now = datetime.now(timezone.utc)
         old = empeno.valor_estimado or 0
-        nuevo = int(old * (1 + INTERES_RENOVACION))
+        nuevo = int(old * (1 + _serie('tasa_renovacion').valor(_dia(now))))
         
         # Guardar valor inicial si es la primera renovación
         if not empeno.valor_inicial:
@@ -712,7 +1843,18 @@ def renovar_empeno():
             new=nuevo
         )
         db.session.add(log)
+        _actualizar_resumen(empeno.user_id)
         db.session.commit()
+        return old, nuevo
+    
+    destino = url_for('panel') if isinstance(usuario_activo, User) else url_for('admin_panel')
+    try:
+        resultado = _con_reintentos(_renovar, f'renovación del empeño {emp_id}')
+        if resultado is None:
+            flash('No se puede renovar un empeño ya pagado', 'warning')
+            return redirect(destino)
+        old, nuevo = resultado
+        dashboard.notificar()
         
         logger.info(f"Empeño {emp_id} renovado. ${old} -> ${nuevo}. By: {active_dni} (admin: {is_admin})")
         flash(f'Empeño {emp_id} renovado con éxito. Nuevo valor: ${nuevo}', 'success')
@@ -721,113 +1863,281 @@ def renovar_empeno():
             return redirect(url_for('admin_panel'))
         return redirect(url_for('panel'))
         
+    except StaleDataError:
+        flash('El empeño está siendo modificado por otra operación. Intente nuevamente', 'error')
+        return redirect(destino)
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error renovando empeño {emp_id}: {e}")
         flash('Error al renovar empeño', 'error')
-        return redirect(url_for('panel') if isinstance(usuario_activo, User) else url_for('admin_panel'))
+        return redirect(destino)
+
+
+def _user_id_activo():
+    """ID del usuario logueado (o del usuario con el DNI del admin activo, si existe)"""
+    if isinstance(usuario_activo, User):
+        return usuario_activo.id
+    u = User.query.filter_by(dni=usuario_activo.get('dni')).first()
+    return u.id if u else None
+
+
+def _guardar_cotizacion(datos):
+    """Guardar una pre-cotización en el store del servidor y devolver su ID corto"""
+    ahora = datetime.now(timezone.utc)
+    # Expulsión por TTL: borrado indexado por expires_at
+    Cotizacion.query.filter(Cotizacion.expires_at < ahora.isoformat()).delete(synchronize_session=False)
+    cotizacion = Cotizacion(
+        id=secrets.token_urlsafe(9),
+        created_at=ahora.isoformat(),
+        expires_at=(ahora + timedelta(minutes=app.config['COTIZACION_TTL_MINUTOS'])).isoformat(),
+        **datos
+    )
+    db.session.add(cotizacion)
+    db.session.commit()
+    return cotizacion.id
+
+
+def _aceptar_cotizacion(cotizacion_id):
+    """Registrar como empeño la cotización guardada con ese ID"""
+    datos = db.session.get(Cotizacion, cotizacion_id) if cotizacion_id else None
+    if not datos or datos.expires_at < datetime.now(timezone.utc).isoformat():
+        flash('No se encontró la última cotización', 'error')
+        return redirect(url_for('panel'))
+
+    try:
+        user_id = _user_id_activo()
+        if user_id is None or datos.user_id != user_id:
+            flash('Usuario inválido', 'error')
+            return redirect(url_for('panel'))
+
+        nuevo = Empeno(
+            user_id=user_id,
+            tipo=datos.tipo,
+            descripcion=datos.descripcion,
+            valor_estimado=datos.valor_estimado,
+            valor_inicial=datos.valor_estimado,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            term_days=LOAN_TERM_DAYS,
+            renovaciones=0,
+            estado='activo',
+            interes_acumulado=0.0,
+            catalogo_id=datos.catalogo_id
+        )
+        db.session.add(nuevo)
+        db.session.delete(datos)
+        _actualizar_resumen(user_id)
+        db.session.commit()
+        session.pop('cotizacion_id', None)
+        if nuevo.catalogo_id:
+            try:
+                _registrar_aceptado(nuevo.catalogo_id, nuevo.valor_estimado)
+            except Exception as e:
+                # El empeño ya quedó registrado; solo se pierde este dato del historial
+                logger.warning(f"No se pudo actualizar el catálogo {nuevo.catalogo_id}: {e}")
+        dashboard.notificar('empeno', id=nuevo.id, tipo=nuevo.tipo, valor_estimado=nuevo.valor_estimado,
+                            sucursal=_sucursal_actual())
+
+        logger.info(f"Empeño registrado: ID {nuevo.id}, User: {user_id}, Valor: ${nuevo.valor_estimado}")
+        flash(f'Empeño registrado exitosamente. ID: {nuevo.id}', 'success')
+        # Redirigir al formulario para agendar cita asociada al empeño recién creado
+        return redirect(url_for('agendar_cita_form', empeno_id=nuevo.id))
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error guardando empeño: {e}")
+        flash('Error guardando el empeño', 'error')
+        return redirect(url_for('panel'))
+
+
+# ============ CATÁLOGO DE REFERENCIA ============
+
+catalogo_ref = catalogo.Catalogo()
+_catalogo_sincronizado = 0.0
+_catalogo_lock = threading.Lock()
+# Revisión siguiente a todas las existentes (la escritura serializa el cálculo en SQLite)
+_SQL_SIGUIENTE_REVISION = '(SELECT COALESCE(MAX(revision), 0) + 1 FROM catalogo_articulo)'
+
+
+def _articulo(fila):
+    return catalogo.Articulo(
+        fila.id, fila.tipo, fila.marca or '', fila.modelo or '', fila.clave, fila.valor_referencia, fila.aceptados,
+        fila.suma_aceptado / fila.aceptados if fila.aceptados else None, fila.revision,
+    )
+
+
+def _catalogo(forzar=False):
+    """Trie del catálogo; cada sincronización lee solo las filas con revisión nueva"""
+    global _catalogo_sincronizado
+    if forzar or time.monotonic() - _catalogo_sincronizado >= app.config['CATALOGO_REFRESCO_SEGUNDOS']:
+        with _catalogo_lock:
+            tabla = CatalogoArticulo.__table__
+            with db.engine.connect() as conn:
+                filas = conn.execute(tabla.select().where(tabla.c.revision > catalogo_ref.revision)).all()
+            catalogo_ref.actualizar(_articulo(fila) for fila in filas)
+            _catalogo_sincronizado = time.monotonic()
+    return catalogo_ref
+
+
+def guardar_en_catalogo(articulos):
+    """Alta o actualización por clave normalizada de artículos (tipo, marca, modelo, valor_referencia)"""
+    ahora = datetime.now(timezone.utc).isoformat()
+    filas = [(catalogo.clave(tipo, marca, modelo), tipo, marca, modelo, float(valor), ahora)
+             for tipo, marca, modelo, valor in articulos]
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(catalogo.SQL_GUARDAR, filas)
+    _catalogo(forzar=True)
+
+
+def _registrar_aceptado(catalogo_id, valor_estimado):
+    """Sumar un empeño aceptado al historial del artículo del catálogo"""
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            'UPDATE catalogo_articulo SET aceptados = aceptados + 1, suma_aceptado = suma_aceptado + ?, '
+            f'revision = {_SQL_SIGUIENTE_REVISION}, updated_at = ? WHERE id = ?',
+            (valor_estimado, datetime.now(timezone.utc).isoformat(), catalogo_id))
+
+
+@app.route('/api/catalogo')
+@login_required
+def api_catalogo():
+    """Autocompletado del catálogo: ?q=<texto>&k=8"""
+    k = min(max(request.args.get('k', 8, type=int) or 8, 1), catalogo.SUGERENCIAS_POR_NODO)
+    articulos = _catalogo().sugerir(request.args.get('q', ''), k)
+    return jsonify({'articulos': [{
+        'id': a.id, 'tipo': a.tipo, 'marca': a.marca, 'modelo': a.modelo,
+        'valor_referencia': a.valor_referencia, 'aceptados': a.aceptados,
+        'valor_aceptado_promedio': a.valor_aceptado_promedio,
+    } for a in articulos]})
+
+
+@app.route('/admin/catalogo', methods=['POST'])
+@admin_required
+@idempotente
+def admin_catalogo():
+    """Alta o actualización de un artículo del catálogo de referencia"""
+    tipo = sanitizar_input(request.form.get('tipo', ''), 120)
+    marca = sanitizar_input(request.form.get('marca', ''), 120)
+    modelo = sanitizar_input(request.form.get('modelo', ''), 120)
+    try:
+        valor = float(request.form.get('valor_referencia', 0))
+    except (ValueError, TypeError):
+        valor = 0
+    if not catalogo.normalizar(tipo) or valor <= 0:
+        flash('El tipo y un valor de referencia mayor a 0 son obligatorios', 'error')
+        return redirect(url_for('admin_panel'))
+
+    try:
+        guardar_en_catalogo([(tipo, marca, modelo, valor)])
+    except Exception as e:
+        logger.error(f"Error guardando artículo de catálogo: {e}")
+        flash('Error guardando el artículo', 'error')
+        return redirect(url_for('admin_panel'))
+    logger.info(f"Admin {session.get('admin_username')} guardó en catálogo {catalogo.clave(tipo, marca, modelo)}: ${valor:,.0f}")
+    flash(f'Artículo guardado en el catálogo: {tipo} {marca} {modelo}'.strip(), 'success')
+    return redirect(url_for('admin_panel'))
+
+
+def _valores_cotizacion(valor_ref, estado):
+    """(valor_ref, estado en 0..1) validados; ValueError con el mensaje para el usuario"""
+    try:
+        valor_ref = float(valor_ref)
+        estado = float(estado)
+    except (ValueError, TypeError):
+        raise ValueError('Valores numéricos inválidos')
+    estado = estado / 100.0 if estado > 1 else estado
+    if valor_ref <= 0:
+        raise ValueError('El valor de referencia debe ser mayor a 0')
+    if estado < 0 or estado > 1:
+        raise ValueError('El estado debe estar entre 0% y 100%')
+    return valor_ref, estado
+
+
+def _factor_precios_modelo():
+    """IPC de hoy / IPC de la fecha de los precios de entrenamiento del modelo IA"""
+    fecha = app.config['COTIZADOR_FECHA_PRECIOS']
+    if not fecha:
+        return 1.0
+    base = datetime.fromisoformat(fecha).replace(tzinfo=timezone.utc)
+    return float(_serie('ipc').factor(_dia(base), _dia(datetime.now(timezone.utc))))
+
+
+def _estimar_valor(valor_ref, estado):
+    """Valor estimado por el modelo IA (trabajo de CPU), acotado a un rango razonable"""
+    try:
+        # El modelo predice en pesos de sus datos de entrenamiento: el valor de hoy se lleva a
+        # esos pesos y la predicción se trae de vuelta a pesos de hoy
+        factor = _factor_precios_modelo()
+        valor_estimado = int(obtener_modelo_ia().predecir(valor_ref / factor, estado) * factor)
+    except Exception as e:
+        logger.warning(f"Error en predicción IA: {e}")
+        valor_estimado = int(valor_ref * (0.5 + estado * 0.3))
+    
+    # Validar rango razonable
+    if valor_estimado > valor_ref * 0.8 or valor_estimado < valor_ref * 0.3:
+        valor_estimado = int(valor_ref * (0.5 + estado * 0.3))
+    return valor_estimado
 
 
 @app.route('/precotizar', methods=['POST'])
+@idempotente
 def precotizar():
     if not usuario_activo:
         flash('Debe iniciar sesión', 'error')
         return redirect(url_for('index'))
     
+    # Si el usuario acepta la cotización: una sola búsqueda por clave primaria
+    if 'aceptar' in request.form:
+        return _aceptar_cotizacion(request.form.get('cotizacion_id') or session.get('cotizacion_id'))
+    
     tipo = sanitizar_input(request.form.get('tipo', ''), 120)
     descripcion = sanitizar_input(request.form.get('descripcion', ''), 500)
     
-    try:
-        valor_ref = float(request.form.get('valor_ref', 0))
-        estado_input = float(request.form.get('estado', 0))
-        estado = estado_input / 100.0 if estado_input > 1 else estado_input
-        
-        if valor_ref <= 0:
-            flash('El valor de referencia debe ser mayor a 0', 'error')
+    # Artículo del catálogo: búsqueda por ID en memoria, de ahí salen el valor de referencia y los textos
+    articulo = None
+    catalogo_id = request.form.get('catalogo_id', type=int)
+    if catalogo_id:
+        articulo = _catalogo().obtener(catalogo_id) or _catalogo(forzar=True).obtener(catalogo_id)
+        if articulo is None:
+            flash('El artículo del catálogo no existe', 'error')
             return redirect(url_for('panel'))
-        
-        if estado < 0 or estado > 1:
-            flash('El estado debe estar entre 0% y 100%', 'error')
-            return redirect(url_for('panel'))
-            
-    except (ValueError, TypeError):
-        flash('Valores numéricos inválidos', 'error')
+        tipo = tipo or articulo.tipo
+        descripcion = descripcion or f'{articulo.marca} {articulo.modelo}'.strip() or articulo.tipo
+    
+    try:
+        valor_ref, estado = _valores_cotizacion(
+            request.form.get('valor_ref') or (articulo.valor_referencia if articulo else 0),
+            request.form.get('estado', 0))
+    except ValueError as e:
+        flash(str(e), 'error')
         return redirect(url_for('panel'))
     
     if not tipo or not descripcion:
         flash('Tipo y descripción son obligatorios', 'error')
         return redirect(url_for('panel'))
     
-    entrada = pd.DataFrame({'valor_referencia': [valor_ref], 'estado': [estado]})
+    valor_estimado = _estimar_valor(valor_ref, estado)
     
     try:
-        valor_estimado = int(modelo_ia.predict(entrada)[0])
+        cotizacion_id = _guardar_cotizacion({
+            'user_id': _user_id_activo(),
+            'tipo': tipo,
+            'descripcion': descripcion,
+            'valor_ref': valor_ref,
+            'estado': estado,
+            'valor_estimado': valor_estimado,
+            'catalogo_id': articulo.id if articulo else None,
+        })
+        session['cotizacion_id'] = cotizacion_id
     except Exception as e:
-        logger.warning(f"Error en predicción IA: {e}")
-        valor_estimado = int(valor_ref * (0.5 + estado * 0.3))
-    
-    # Validar rango razonable
-    if valor_estimado > valor_ref * 0.8 or valor_estimado < valor_ref * 0.3:
-        valor_estimado = int(valor_ref * (0.5 + estado * 0.3))
-    
-    session['ultima_cotizacion'] = {
-        'tipo': tipo,
-        'descripcion': descripcion,
-        'valor_ref': valor_ref,
-        'estado': estado,
-        'valor_estimado': valor_estimado,
-        'fecha_cotizacion': datetime.now(timezone.utc).isoformat()
-    }
-    
-    # Si el usuario acepta la cotización
-    if 'aceptar' in request.form:
-        datos = session.get('ultima_cotizacion')
-        if not datos:
-            flash('No se encontró la última cotización', 'error')
-            return redirect(url_for('panel'))
-        
-        try:
-            user_id = None
-            if isinstance(usuario_activo, User):
-                user_id = usuario_activo.id
-            else:
-                u = User.query.filter_by(dni=usuario_activo.get('dni')).first()
-                user_id = u.id if u else None
-            
-            if user_id is None:
-                flash('Usuario inválido', 'error')
-                return redirect(url_for('panel'))
-            
-            nuevo = Empeno(
-                user_id=user_id,
-                tipo=datos['tipo'],
-                descripcion=datos['descripcion'],
-                valor_estimado=datos['valor_estimado'],
-                valor_inicial=datos['valor_estimado'],
-                created_at=datetime.now(timezone.utc).isoformat(),
-                term_days=LOAN_TERM_DAYS,
-                renovaciones=0,
-                estado='activo',
-                interes_acumulado=0.0
-            )
-            db.session.add(nuevo)
-            db.session.commit()
-            session.pop('ultima_cotizacion', None)
-            
-            logger.info(f"Empeño registrado: ID {nuevo.id}, User: {user_id}, Valor: ${datos['valor_estimado']}")
-            flash(f'Empeño registrado exitosamente. ID: {nuevo.id}', 'success')
-            # Redirigir al formulario para agendar cita asociada al empeño recién creado
-            return redirect(url_for('agendar_cita_form', empeno_id=nuevo.id))
-            
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"Error guardando empeño: {e}")
-            flash('Error guardando el empeño', 'error')
-            return redirect(url_for('panel'))
+        db.session.rollback()
+        logger.error(f"Error guardando cotización: {e}")
+        flash('Error guardando la cotización', 'error')
+        return redirect(url_for('panel'))
     
     estado_percent = int(estado * 100)
     return render_template(
         'resultado.html',
+        cotizacion_id=cotizacion_id,
         tipo=tipo,
         descripcion=descripcion,
         valor_ref=valor_ref,
@@ -838,8 +2148,118 @@ def precotizar():
     )
 
 
+def _cotizacion_api(datos):
+    """(cuerpo, estado HTTP) de una estimación sin guardar: valor_ref, estado y catalogo_id opcional"""
+    articulo = None
+    try:
+        catalogo_id = int(datos.get('catalogo_id') or 0)
+    except (ValueError, TypeError):
+        return {'error': 'Artículo del catálogo inválido'}, 400
+    if catalogo_id:
+        articulo = _catalogo().obtener(catalogo_id) or _catalogo(forzar=True).obtener(catalogo_id)
+        if articulo is None:
+            return {'error': 'El artículo del catálogo no existe'}, 404
+    try:
+        valor_ref, estado = _valores_cotizacion(
+            datos.get('valor_ref') or (articulo.valor_referencia if articulo else 0), datos.get('estado', 0))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {
+        'valor_ref': valor_ref,
+        'estado': estado,
+        'valor_estimado': _estimar_valor(valor_ref, estado),
+        'catalogo_id': articulo.id if articulo else None,
+    }, 200
+
+
+@app.route('/api/cotizar', methods=['POST'])
+def api_cotizar():
+    """Estimación rápida (JSON o formulario) sin crear la pre-cotización"""
+    if not usuario_activo:
+        return jsonify({'error': 'Debe iniciar sesión'}), 401
+    cuerpo, estado = _cotizacion_api(request.get_json(silent=True) or request.form)
+    return jsonify(cuerpo), estado
+
+
+# ============ AGENDA DE TASACIONES ============
+
+_agendas = {}
+_agendas_lock = threading.Lock()
+
+
+def _tasadores_sucursal(sucursal):
+    """Cantidad de tasadores según AGENDA_TASADORES ('2' o 'central:3,norte:2')"""
+    tasadores = 1
+    for parte in app.config['AGENDA_TASADORES'].split(','):
+        nombre, _, cantidad = parte.strip().rpartition(':')
+        if cantidad.isdigit() and (not nombre or nombre.strip().lower() == sucursal):
+            tasadores = int(cantidad)
+            if nombre:
+                break
+    return tasadores
+
+
+def _citas_activas(fecha=None):
+    """(fecha, hora, tasador) de las citas que ocupan turno, de un día o desde hoy"""
+    query = db.session.query(Cita.fecha, Cita.hora, Cita.tasador).filter(Cita.estado.in_(ESTADOS_CITA_ACTIVOS))
+    if fecha:
+        return query.filter(Cita.fecha == fecha).all()
+    return query.filter(Cita.fecha >= datetime.now(timezone.utc).date().isoformat()).all()
+
+
+def _agenda_sucursal():
+    """Agenda en memoria de la sucursal actual; se carga desde las citas activas la primera vez"""
+    sucursal = _sucursal_actual() or SUCURSAL_PRINCIPAL
+    agenda_suc = _agendas.get(sucursal)
+    if agenda_suc is None:
+        with _agendas_lock:
+            agenda_suc = _agendas.get(sucursal)
+            if agenda_suc is None:
+                agenda_suc = agenda.Agenda(
+                    _tasadores_sucursal(sucursal),
+                    app.config['AGENDA_APERTURA'],
+                    app.config['AGENDA_CIERRE'],
+                    app.config['AGENDA_DURACION_MIN'],
+                    [int(d) for d in app.config['AGENDA_DIAS'].split(',') if d.strip().isdigit()],
+                )
+                for fecha, hora, tasador in _citas_activas():
+                    try:
+                        agenda_suc.ocupar(agenda.parsear_dia(fecha), hora, tasador)
+                    except ValueError:
+                        continue  # Citas antiguas con fecha/hora en otro formato
+                _agendas[sucursal] = agenda_suc
+    return agenda_suc
+
+
+def _describir_turnos(turnos):
+    return ', '.join(f'{dia.isoformat()} {hora}' for dia, hora, _ in turnos)
+
+
+def _turnos_api(agenda_suc, args):
+    """Próximos turnos libres de una agenda a partir de ?desde=YYYY-MM-DD&k=5"""
+    manana = datetime.now(timezone.utc).date() + timedelta(days=1)
+    try:
+        desde = max(agenda.parsear_dia(args.get('desde', '')), manana)
+    except ValueError:
+        desde = manana
+    try:
+        k = min(max(int(args.get('k') or 5), 1), 50)
+    except ValueError:
+        k = 5
+    return {'turnos': [{'fecha': dia.isoformat(), 'hora': hora, 'tasador': tasador}
+                       for dia, hora, tasador in agenda_suc.siguientes_libres(desde, k=k)]}
+
+
+@app.route('/api/turnos')
+@login_required
+def api_turnos():
+    """Próximos turnos libres de la sucursal: ?desde=YYYY-MM-DD&k=5"""
+    return jsonify(_turnos_api(_agenda_sucursal(), request.args))
+
+
 @app.route('/agendar_cita', methods=['POST'])
 @login_required
+@idempotente
 def agendar_cita():
     """Agendar una cita para evaluación de empeño"""
     try:
@@ -853,35 +2273,74 @@ def agendar_cita():
             flash(f'Fecha inválida: {msg_fecha}', 'error')
             return redirect(url_for('panel'))
         
-        # Validar hora
-        hora_valida, msg_hora = validar_hora_cita(hora_str)
-        if not hora_valida:
-            flash(f'Hora inválida: {msg_hora}', 'error')
-            return redirect(url_for('panel'))
-        
-        # Prevención de doble-reserva: no permitir otra cita pendiente/confirmada en mismo slot
-        existente = Cita.query.filter_by(fecha=fecha_str, hora=hora_str).filter(Cita.estado.in_(['pendiente', 'confirmada'])).first()
-        if existente:
-            flash('Ya existe una cita en esa fecha y hora. Por favor, elija otra hora.', 'error')
+        def _volver():
             # Si venimos desde un empeño específico, volver al formulario de agendado
             try:
                 return redirect(url_for('agendar_cita_form', empeno_id=int(empeno_id))) if empeno_id else redirect(url_for('panel'))
             except Exception:
                 return redirect(url_for('panel'))
 
+        agenda_suc = _agenda_sucursal()
+        dia = agenda.parsear_dia(fecha_str)
+        fecha_str = dia.isoformat()
+
+        if not hora_str:
+            # Sin hora: primer turno libre a partir de la fecha elegida
+            turno = agenda_suc.primer_libre(dia)
+            if turno is None:
+                flash('No hay turnos libres en el próximo año', 'error')
+                return _volver()
+            dia, hora_str, _ = turno
+            fecha_str = dia.isoformat()
+        else:
+            # Validar hora
+            hora_valida, msg_hora = validar_hora_cita(hora_str)
+            if not hora_valida:
+                flash(f'Hora inválida: {msg_hora}', 'error')
+                return redirect(url_for('panel'))
+            hora_str = agenda.formato_hora(agenda.minutos(hora_str))  # '9:00' -> '09:00'
+            if not agenda_suc.es_dia_habil(dia) or agenda_suc.indice(hora_str) is None:
+                flash(f"Fuera del horario de atención: turnos de {app.config['AGENDA_DURACION_MIN']} minutos "
+                      f"entre {app.config['AGENDA_APERTURA']} y {app.config['AGENDA_CIERRE']}. "
+                      f"Próximos turnos: {_describir_turnos(agenda_suc.siguientes_libres(dia, hora_str, k=3))}", 'error')
+                return _volver()
+
+        # Asignar un tasador libre en ese turno (la capacidad es la cantidad de tasadores)
+        tasador = agenda_suc.ocupar(dia, hora_str)
+        if tasador is None:
+            flash('No hay tasadores libres en esa fecha y hora. Próximos turnos: '
+                  f'{_describir_turnos(agenda_suc.siguientes_libres(dia, hora_str, k=3))}', 'error')
+            return _volver()
+
         # Crear la cita
         nueva_cita = Cita(
             user_id=usuario_activo.id,
             empeno_id=int(empeno_id) if empeno_id else None,
             fecha=fecha_str,
             hora=hora_str,
-            estado='pendiente'
+            estado='pendiente',
+            tasador=tasador
         )
 
-        db.session.add(nueva_cita)
-        db.session.commit()
+        try:
+            db.session.add(nueva_cita)
+            _actualizar_resumen(nueva_cita.user_id)
+            db.session.commit()
+        except IntegrityError:
+            # Otro proceso tomó el turno (índice único): se relee el día desde la base
+            db.session.rollback()
+            agenda_suc.recargar_dia(dia, [(h, t) for _, h, t in _citas_activas(fecha_str)])
+            flash('Ese turno se acaba de ocupar. Próximos turnos: '
+                  f'{_describir_turnos(agenda_suc.siguientes_libres(dia, hora_str, k=3))}', 'error')
+            return _volver()
+        except Exception:
+            agenda_suc.liberar(dia, hora_str, tasador)
+            raise
+        dashboard.notificar('cita', id=nueva_cita.id, fecha=fecha_str, hora=hora_str, estado='pendiente',
+                            sucursal=_sucursal_actual())
         
-        logger.info(f"Cita agendada: ID {nueva_cita.id}, Usuario: {usuario_activo.dni}, Fecha: {fecha_str}, Hora: {hora_str}")
+        logger.info(f"Cita agendada: ID {nueva_cita.id}, Usuario: {usuario_activo.dni}, Fecha: {fecha_str}, "
+                    f"Hora: {hora_str}, Tasador: {tasador}")
         flash(f'Cita agendada exitosamente para {fecha_str} a las {hora_str}', 'success')
         return redirect(url_for('panel'))
         
@@ -902,7 +2361,9 @@ def agendar_cita_form(empeno_id):
         return redirect(url_for('panel'))
 
     # Pasar datos del empeño a la plantilla
-    return render_template('agendar_cita.html', usuario=usuario_activo, empeno=empeno)
+    horario = {'apertura': app.config['AGENDA_APERTURA'], 'cierre': app.config['AGENDA_CIERRE'],
+               'duracion': app.config['AGENDA_DURACION_MIN']}
+    return render_template('agendar_cita.html', usuario=usuario_activo, empeno=empeno, horario=horario)
 
 
 @app.route('/_shutdown', methods=['POST', 'GET'])
@@ -916,45 +2377,81 @@ def _shutdown():
 
 # ============ NUEVAS FUNCIONALIDADES ============
 
-@app.route('/reportes')
-@admin_required
-def reportes():
-    """Vista de reportes y estadísticas avanzadas"""
-    # Estadísticas generales
-    total_empenos = Empeno.query.count()
-    total_activos = Empeno.query.filter_by(estado='activo').count()
-    total_pagados = Empeno.query.filter_by(estado='pagado').count()
-    total_usuarios = User.query.count()
+def _sumas_en_pesos_de_hoy(sql):
+    """Sumas de los montos de `sql` (filas: día desde epoch, montos... agrupadas por día) con
+    cada día llevado a pesos de hoy por el IPC: una fila por día, no por empeño"""
+    import numpy as np
+    resultado = db.session.execute(text(sql))
+    columnas = len(resultado.keys())
+    matriz = np.array([tuple(f) for f in resultado], dtype=np.float64).reshape(-1, columnas)
+    hoy = _dia(datetime.now(timezone.utc))
+    dias = np.where(np.isnan(matriz[:, 0]), hoy, matriz[:, 0])
+    montos = ajustar_por_inflacion(np.nan_to_num(matriz[:, 1:]), dias[:, None], hoy)
+    return montos.sum(axis=0).tolist()
+
+
+def _reporte_sucursal():
+    """Agregados de reportes de la sucursal actual (tablas activas + archivo histórico)"""
+    empenos = _tabla_historica('empeno', ['id', 'user_id', 'tipo', 'estado', 'valor_estimado'])
+    pagos = _tabla_historica('paid_log', ['time', 'monto_pagado', 'interes_pagado'])
+    reporte = _stats_sucursal()
     
-    # Suma total de valores
-    suma_activos = db.session.query(db.func.sum(Empeno.valor_estimado)).filter_by(estado='activo').scalar() or 0
-    suma_pagados_log = db.session.query(db.func.sum(PaidLog.monto_pagado)).scalar() or 0
-    suma_intereses = db.session.query(db.func.sum(PaidLog.interes_pagado)).scalar() or 0
+    # Suma total de valores (los activos nunca se archivan)
+    reporte['suma_activos'] = db.session.query(db.func.sum(Empeno.valor_estimado)).filter_by(estado='activo').scalar() or 0
+    reporte['suma_pagados'], reporte['suma_intereses'] = db.session.execute(text(
+        f'SELECT COALESCE(SUM(monto_pagado), 0), COALESCE(SUM(interes_pagado), 0) FROM {pagos}'
+    )).one()
+    
+    # Los mismos montos en pesos de hoy (capital activo desde su creación o última renovación)
+    reporte['suma_activos_hoy'], = _sumas_en_pesos_de_hoy(
+        'SELECT CAST(julianday(created_at) - 2440587.5 AS INTEGER) AS dia, SUM(valor_estimado) '
+        "FROM empeno WHERE estado = 'activo' GROUP BY dia")
+    reporte['suma_pagados_hoy'], reporte['suma_intereses_hoy'] = _sumas_en_pesos_de_hoy(
+        'SELECT CAST(julianday(time) - 2440587.5 AS INTEGER) AS dia, SUM(monto_pagado), SUM(interes_pagado) '
+        f'FROM {pagos} GROUP BY dia')
     
     # Top 5 usuarios con más empeños
-    top_usuarios = db.session.query(
-        User.nombre,
-        User.dni,
-        db.func.count(Empeno.id).label('total')
-    ).join(Empeno).group_by(User.id).order_by(db.desc('total')).limit(5).all()
-    
-    # Empeños por tipo
-    empenos_por_tipo = db.session.query(
-        Empeno.tipo,
-        db.func.count(Empeno.id).label('total')
-    ).group_by(Empeno.tipo).order_by(db.desc('total')).all()
+    reporte['top_usuarios'] = [dict(fila._mapping) for fila in db.session.execute(text(
+        f'SELECT u.nombre, u.dni, COUNT(e.id) AS total FROM {empenos} e '
+        f'JOIN "user" u ON u.id = e.user_id GROUP BY u.id ORDER BY total DESC LIMIT 5'
+    ))]
     
+    # Empeños por tipo (se agrupan por tipo normalizado al combinar las sucursales)
+    reporte['empenos_por_tipo'] = [tuple(fila) for fila in db.session.execute(text(
+        f'SELECT tipo, COUNT(id) AS total, COALESCE(SUM(valor_estimado), 0) FROM {empenos} GROUP BY tipo'
+    ))]
+    return reporte
+
+
+@app.route('/reportes')
+@admin_required
+def reportes():
+    """Vista de reportes y estadísticas avanzadas"""
+    # Cada sucursal calcula su parte en paralelo y aquí se combinan
     stats = {
-        'total_empenos': total_empenos,
-        'total_activos': total_activos,
-        'total_pagados': total_pagados,
-        'total_usuarios': total_usuarios,
-        'suma_activos': suma_activos,
-        'suma_pagados': suma_pagados_log,
-        'suma_intereses': suma_intereses,
-        'top_usuarios': top_usuarios,
-        'empenos_por_tipo': empenos_por_tipo
+        'total_empenos': 0, 'total_activos': 0, 'total_pagados': 0, 'total_usuarios': 0,
+        'suma_activos': 0, 'suma_pagados': 0, 'suma_intereses': 0,
+        'suma_activos_hoy': 0, 'suma_pagados_hoy': 0, 'suma_intereses_hoy': 0,
     }
+    top_usuarios = []
+    por_tipo = {}
+    for parcial in en_todas_las_sucursales(_reporte_sucursal).values():
+        for clave in stats:
+            stats[clave] += parcial[clave]
+        top_usuarios.extend(parcial['top_usuarios'])
+        for tipo, total, valor in parcial['empenos_por_tipo']:
+            # 'Joya', 'joya ' y 'JOYA' son la misma categoría; se muestra la escritura más usada
+            categoria = por_tipo.setdefault(catalogo.normalizar(tipo), {'tipo': tipo, 'total': 0, 'valor_total': 0, 'mayor': 0})
+            if total > categoria['mayor']:
+                categoria['tipo'], categoria['mayor'] = tipo, total
+            categoria['total'] += total
+            categoria['valor_total'] += valor
+    
+    stats['top_usuarios'] = sorted(top_usuarios, key=lambda u: u['total'], reverse=True)[:5]
+    stats['empenos_por_tipo'] = [
+        {'tipo': c['tipo'], 'total': c['total'], 'valor_promedio': c['valor_total'] / c['total']}
+        for c in sorted(por_tipo.values(), key=lambda c: c['total'], reverse=True)
+    ]
     
     return render_template('reportes.html', usuario=usuario_activo, stats=stats)
 
@@ -963,6 +2460,7 @@ def reportes():
 @admin_required
 def exportar(tipo):
     """Exportar datos a CSV"""
+    import pandas as pd
     try:
         if tipo == 'usuarios':
             usuarios = User.query.all()
@@ -987,6 +2485,13 @@ def exportar(tipo):
                     'created_at': e.created_at
                 })
             df = pd.DataFrame(data)
+            if not df.empty:
+                # Valor en pesos de hoy: una sola consulta vectorizada al IPC para todo el archivo
+                creados = pd.to_datetime(df['created_at'], utc=True, errors='coerce', format='ISO8601')
+                hoy = _dia(datetime.now(timezone.utc))
+                dias = ((creados - pd.Timestamp(0, tz='UTC')).dt.total_seconds() / 86400.0).fillna(hoy)
+                df['valor_estimado_hoy'] = ajustar_por_inflacion(
+                    df['valor_estimado'].fillna(0).to_numpy(dtype=float), dias.to_numpy(), hoy).round()
             filename = f'empenos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
             
         elif tipo == 'pagos':
@@ -1021,8 +2526,200 @@ def exportar(tipo):
         return redirect(url_for('admin_panel'))
 
 
+# ============ RIESGO DE CARTERA ============
+
+RIESGO_LOTE = 50000  # Puntajes guardados por transacción
+
+# Cartera activa en el orden de riesgo.COLUMNAS_CARTERA (fecha de creación en segundos epoch)
+_SQL_CARTERA_RIESGO = (
+    'SELECT id, user_id, (julianday(created_at) - 2440587.5) * 86400.0, '
+    f'COALESCE(term_days, {LOAN_TERM_DAYS}), COALESCE(renovaciones, 0), COALESCE(valor_inicial, valor_estimado, 0) '
+    "FROM main.empeno WHERE estado = 'activo'"
+)
+# Historial de cada cliente (activo + archivo); un empeño caducó si está 'vencido' o sigue activo
+# con el plazo cumplido. Se une a la cartera en NumPy: dos recorridos secuenciales en lugar de un
+# JOIN que busca los empeños de cada cliente por índice
+_SQL_HISTORIAL_RIESGO = (
+    "SELECT user_id, COUNT(*), SUM(estado = 'pagado'), SUM(estado = 'vencido' OR (estado = 'activo' AND "
+    f"CAST(julianday(?) - julianday(created_at) AS INTEGER) > COALESCE(term_days, {LOAN_TERM_DAYS}))) "
+    f"FROM {_tabla_historica('empeno', ['user_id', 'estado', 'created_at', 'term_days'])} GROUP BY user_id"
+)
+_COLUMNAS_RIESGO = ('empeno_id', 'user_id', 'puntaje', 'dias_a_vencer', 'renovaciones', 'interes_capital',
+                    'caducados_previos', 'capital', 'cobro_esperado')
+_riesgo_lock = threading.Lock()
+
+
+def _guardar_riesgo(engine, filas, calculado):
+    """Reemplazar todos los puntajes de la base: se cargan por lotes en una tabla nueva sin
+    índices y se intercambia con la actual en una transacción breve (los lectores nunca ven
+    una cartera a medio guardar y no se mantienen índices fila por fila)"""
+    with engine.begin() as conn:
+        ddl = conn.exec_driver_sql(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'riesgo_empeno'").scalar()
+        indices = [fila[0] for fila in conn.exec_driver_sql(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = 'riesgo_empeno' "
+            'AND sql IS NOT NULL')]
+        conn.exec_driver_sql('DROP TABLE IF EXISTS main.riesgo_empeno_nuevo')
+        # Mismas columnas y restricciones que la tabla actual (el nombre puede estar entre comillas)
+        conn.exec_driver_sql('CREATE TABLE main.riesgo_empeno_nuevo ' + ddl[ddl.index('('):])
+    insertar = (f'INSERT INTO main.riesgo_empeno_nuevo ({", ".join(_COLUMNAS_RIESGO)}, calculado_at) '
+                f'VALUES ({", ".join("?" * len(_COLUMNAS_RIESGO))}, ?)')
+    for inicio in range(0, len(filas), RIESGO_LOTE):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(insertar, [fila + (calculado,) for fila in filas[inicio:inicio + RIESGO_LOTE]])
+    with engine.begin() as conn:
+        conn.exec_driver_sql('DROP TABLE main.riesgo_empeno')
+        conn.exec_driver_sql('ALTER TABLE main.riesgo_empeno_nuevo RENAME TO riesgo_empeno')
+        for indice in indices:
+            conn.exec_driver_sql(indice)
+
+
+def _columnas_riesgo(conn, ahora):
+    """Cartera activa en columnas NumPy con el historial del cliente y el interés acumulado
+    por unidad de capital según las series de tasas (0 si la fecha no se pudo leer)"""
+    import numpy as np
+    import riesgo
+    columnas = riesgo.columnas_desde_filas(
+        conn.exec_driver_sql(_SQL_CARTERA_RIESGO).fetchall(),
+        conn.exec_driver_sql(_SQL_HISTORIAL_RIESGO, (ahora.isoformat(),)).fetchall())
+    hoy = _dia(ahora)
+    creado = columnas['creado'] / 86400.0
+    columnas['interes_capital'] = np.where(
+        np.isnan(creado), 0.0,
+        intereses_acumulados(np.nan_to_num(creado, nan=hoy), 1.0, columnas['renovaciones'], hoy))
+    return columnas
+
+
+def calcular_riesgo(procesos=None, bloque=None):
+    """Recalcular el riesgo de caducidad de todos los empeños activos de la sucursal actual.
+
+    La cartera se lee en columnas, se puntúa por bloques (en `procesos` procesos si hay
+    más de uno) y reemplaza a los puntajes anteriores, incluidos los de empeños que ya no
+    están activos. Devuelve la cantidad de empeños puntuados.
+    """
+    procesos = procesos or app.config['RIESGO_PROCESOS'] or os.cpu_count() or 1
+    bloque = bloque or app.config['RIESGO_BLOQUE']
+    engine = _engine_sucursal(_sucursal_actual())
+    with _riesgo_lock:
+        t0 = time.perf_counter()
+        ahora = datetime.now(timezone.utc)
+        calculado = ahora.isoformat()
+        with engine.connect() as conn:
+            columnas = _columnas_riesgo(conn, ahora)
+        import riesgo
+        puntajes = riesgo.puntuar_en_paralelo(columnas, ahora.timestamp(), procesos, bloque)
+        filas = list(zip(*(puntajes[c].tolist() for c in _COLUMNAS_RIESGO)))
+        _guardar_riesgo(engine, filas, calculado)
+    logger.info(f"Riesgo de cartera ({_sucursal_actual() or SUCURSAL_PRINCIPAL}): {len(filas)} empeños "
+                f"puntuados en {time.perf_counter() - t0:.1f}s")
+    return len(filas)
+
+
+def _hilo_riesgo(espera_inicial=900):
+    """Recálculo periódico del riesgo de cartera en segundo plano (lanzador de escritorio)"""
+    time.sleep(espera_inicial)
+    while True:
+        try:
+            en_todas_las_sucursales(calcular_riesgo)
+        except Exception as e:
+            logger.error(f"Error calculando el riesgo de cartera: {e}")
+        time.sleep(app.config['RIESGO_INTERVALO_HORAS'] * 3600)
+
+
+@app.route('/admin/riesgo')
+@admin_required
+def riesgo_cartera():
+    """Empeños activos de la sucursal con más riesgo de caducar: ?umbral=0.6&limite=200"""
+    umbral = request.args.get('umbral', app.config['RIESGO_UMBRAL'], type=float)
+    limite = min(max(request.args.get('limite', 200, type=int) or 200, 1), 1000)
+    # Rango sobre el índice de puntaje: no depende del tamaño de la cartera
+    en_riesgo = db.session.execute(text(
+        'SELECT r.empeno_id, r.puntaje, r.dias_a_vencer, r.renovaciones, r.interes_capital, r.caducados_previos, '
+        'r.cobro_esperado, e.tipo, e.descripcion, e.valor_estimado, u.nombre, u.dni '
+        'FROM riesgo_empeno r JOIN empeno e ON e.id = r.empeno_id LEFT JOIN "user" u ON u.id = r.user_id '
+        'WHERE r.puntaje >= :umbral ORDER BY r.puntaje DESC LIMIT :limite'
+    ), {'umbral': umbral, 'limite': limite}).all()
+    resumen = db.session.execute(text(
+        'SELECT COUNT(*) AS cantidad, COALESCE(SUM(capital), 0) AS capital, '
+        'COALESCE(SUM(cobro_esperado), 0) AS cobro_esperado FROM riesgo_empeno WHERE puntaje >= :umbral'
+    ), {'umbral': umbral}).one()
+    # Todas las filas son de la misma corrida
+    calculado = db.session.query(RiesgoEmpeno.calculado_at).limit(1).scalar()
+    return render_template('riesgo.html', usuario=usuario_activo, en_riesgo=en_riesgo, resumen=resumen,
+                           umbral=umbral, limite=limite, calculado=calculado)
+
+
+@app.route('/admin/riesgo', methods=['POST'])
+@admin_required
+@idempotente
+def recalcular_riesgo():
+    """Recalcular ahora el riesgo de la cartera de la sucursal"""
+    try:
+        total = calcular_riesgo()
+    except Exception as e:
+        logger.error(f"Error calculando el riesgo de cartera: {e}")
+        flash('Error calculando el riesgo de la cartera', 'error')
+        return redirect(url_for('riesgo_cartera'))
+    logger.info(f"Admin {session.get('admin_username')} recalculó el riesgo de cartera ({total} empeños)")
+    flash(f'Riesgo recalculado para {total} empeños activos', 'success')
+    return redirect(url_for('riesgo_cartera'))
+
+
+# ============ IMPORTACIÓN MASIVA ============
+
+def importar_csv(tipo, ruta, sucursal=None):
+    """Importar un CSV de usuarios o empeños a la base de la sucursal indicada
+    (el catálogo es global y va siempre a la base principal)"""
+    import importador
+    sucursal = sucursal or _sucursal_actual() or SUCURSAL_PRINCIPAL
+    engine = _engine_sucursal(sucursal)
+    if tipo == 'catalogo':
+        resultado = importador.importar_catalogo(db.engine, ruta)
+        _catalogo(forzar=True)
+        sucursal = SUCURSAL_PRINCIPAL
+    elif tipo == 'usuarios':
+        resultado = importador.importar_usuarios(engine, ruta, PATRONES_VALIDACION, sucursal)
+    elif tipo == 'empenos':
+        resultado = importador.importar_empenos(engine, ruta, sucursal, LOAN_TERM_DAYS)
+    else:
+        raise ValueError(f"Tipo de importación desconocido: {tipo}")
+    dashboard.notificar()
+    logger.info(f"Importación de {tipo} ({sucursal}): {resultado['importados']} importados, "
+                f"{resultado['rechazados']} rechazados en {resultado['segundos']:.1f}s")
+    return resultado
+
+
+@app.route('/admin/importar', methods=['POST'])
+@admin_required
+@idempotente
+def admin_importar():
+    """Importar usuarios o empeños desde un CSV subido por el administrador"""
+    tipo = request.form.get('tipo', '')
+    archivo = request.files.get('archivo')
+    if tipo not in ('usuarios', 'empenos', 'catalogo') or not archivo or not archivo.filename:
+        flash('Seleccioná el tipo y un archivo CSV', 'error')
+        return redirect(url_for('admin_panel'))
+
+    carpeta = os.path.join(app.instance_path, 'importaciones')
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f"{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    archivo.save(ruta)
+    try:
+        resultado = importar_csv(tipo, ruta)
+    except Exception as e:
+        logger.error(f"Error importando {tipo}: {e}")
+        flash(f'Error al importar: {e}', 'error')
+        return redirect(url_for('admin_panel'))
+
+    flash(f"Importación de {tipo}: {resultado['importados']} filas importadas de {resultado['leidos']}", 'success')
+    if resultado['rechazados']:
+        flash(f"{resultado['rechazados']} filas rechazadas; detalle en {resultado['ruta_rechazados']}", 'warning')
+    return redirect(url_for('admin_panel'))
+
+
 @app.route('/admin/crear', methods=['POST'])
 @admin_required
+@idempotente
 def crear_admin():
     """Crear nuevo administrador"""
     username = sanitizar_input(request.form.get('username', ''), 64)
@@ -1060,16 +2757,118 @@ def crear_admin():
 @admin_required
 def api_stats():
     """API endpoint para estadísticas (para futuros dashboards dinámicos)"""
-    total_empenos = Empeno.query.count()
-    total_activos = Empeno.query.filter_by(estado='activo').count()
-    total_pagados = Empeno.query.filter_by(estado='pagado').count()
-    
-    return jsonify({
-        'total_empenos': total_empenos,
-        'total_activos': total_activos,
-        'total_pagados': total_pagados,
+    return jsonify(_respuesta_stats(_stats_globales()))
+
+
+def _respuesta_stats(stats):
+    return {
+        'total_empenos': stats['total_empenos'],
+        'total_activos': stats['total_activos'],
+        'total_pagados': stats['total_pagados'],
         'timestamp': datetime.now(timezone.utc).isoformat()
-    })
+    }
+
+
+# Listados JSON paginados por id descendente (?despues=<último id recibido>&limite=N). Son SQL
+# plano para que el servidor ASGI (asgi.py) ejecute las mismas consultas sobre aiosqlite
+LIMITE_API = 200
+SQL_API_EMPENOS = (
+    'SELECT id, tipo, descripcion, valor_estimado, valor_inicial, created_at, term_days, renovaciones, estado, '
+    '(SELECT MAX(time) FROM paid_log WHERE paid_log.empeno_id = empeno.id) AS pagado_at '
+    'FROM empeno WHERE id < :despues{filtro} ORDER BY id DESC LIMIT :limite'
+)
+SQL_API_CITAS = ('SELECT id, empeno_id, fecha, hora, estado, tasador, created_at FROM cita '
+                 'WHERE id < :despues{filtro} ORDER BY id DESC LIMIT :limite')
+
+
+def _usuario_api():
+    """ID del usuario logueado, None para el admin (toda la sucursal) o False sin sesión"""
+    if isinstance(usuario_activo, User):
+        return usuario_activo.id
+    if usuario_activo and usuario_activo.get('is_admin'):
+        return None
+    return False
+
+
+def _consulta_listado(sql, args, user_id):
+    """(SQL, parámetros) de un listado JSON a partir de ?despues=&limite="""
+    try:
+        despues = int(args.get('despues') or 0)
+        limite = int(args.get('limite') or EMPENOS_POR_PAGINA)
+    except (ValueError, TypeError):
+        despues, limite = 0, EMPENOS_POR_PAGINA
+    parametros = {'despues': despues if despues > 0 else sys.maxsize, 'limite': min(max(limite, 1), LIMITE_API)}
+    if user_id is None:
+        return sql.format(filtro=''), parametros
+    return sql.format(filtro=' AND user_id = :user_id'), {**parametros, 'user_id': user_id}
+
+
+def _empeno_api(fila):
+    """Empeño del listado JSON (dict con las columnas de SQL_API_EMPENOS) con interés y vencimiento"""
+    detalle = _detalle_empeno(SimpleNamespace(**fila), fila['pagado_at'])._asdict()
+    for campo in ('dni', 'nombre_usuario', 'border_color', 'border_class'):
+        del detalle[campo]
+    return detalle
+
+
+def _pagina_api(clave, items, limite):
+    """{clave: items, 'siguiente': id para ?despues= (None en la última página)}"""
+    return {clave: items, 'siguiente': items[-1]['id'] if len(items) == limite else None}
+
+
+@app.route('/api/empenos')
+def api_empenos():
+    """Empeños de la sucursal (admin) o del usuario logueado: ?despues=<id>&limite=20"""
+    user_id = _usuario_api()
+    if user_id is False:
+        return jsonify({'error': 'Debe iniciar sesión'}), 401
+    sql, parametros = _consulta_listado(SQL_API_EMPENOS, request.args, user_id)
+    filas = db.session.execute(text(sql), parametros).mappings().all()
+    return jsonify(_pagina_api('empenos', [_empeno_api(dict(f)) for f in filas], parametros['limite']))
+
+
+@app.route('/api/citas')
+def api_citas():
+    """Citas de la sucursal (admin) o del usuario logueado: ?despues=<id>&limite=20"""
+    user_id = _usuario_api()
+    if user_id is False:
+        return jsonify({'error': 'Debe iniciar sesión'}), 401
+    sql, parametros = _consulta_listado(SQL_API_CITAS, request.args, user_id)
+    filas = db.session.execute(text(sql), parametros).mappings().all()
+    return jsonify(_pagina_api('citas', [dict(f) for f in filas], parametros['limite']))
+
+
+@app.route('/api/admision')
+@admin_required
+def api_admision():
+    """Métricas del control de admisión: en curso, en cola, cola máxima y rechazos por limitador"""
+    return jsonify(control_admision.estado())
+
+
+@app.route('/api/stats/stream')
+@admin_required
+def api_stats_stream():
+    """Server-Sent Events: estado inicial y luego solo cambios de estadísticas y actividad nueva"""
+    cola, inicial = dashboard.suscribir()
+
+    def _mensajes():
+        try:
+            yield 'retry: 5000\n\n' + inicial
+            while True:
+                try:
+                    mensaje = cola.get(timeout=DASHBOARD_KEEPALIVE)
+                except queue.Empty:
+                    # Comentario SSE: mantiene viva la conexión y detecta clientes desconectados
+                    yield ': keepalive\n\n'
+                    continue
+                if mensaje is None:
+                    return
+                yield mensaje
+        finally:
+            dashboard.desuscribir(cola)
+
+    return Response(_mensajes(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 # Manejadores de errores
@@ -1086,27 +2885,112 @@ def server_error(e):
     return redirect(url_for('index'))
 
 
+# Servidor WSGI del lanzador de escritorio y evento que indica que ya acepta conexiones
+_servidor = None
+_servidor_listo = threading.Event()
+
+
 def _open_browser_when_ready(url: str, timeout: int = 30):
-    end = time.time() + timeout
-    while time.time() < end:
-        try:
-            with urllib.request.urlopen(url, timeout=1):
-                webbrowser.open(url)
-                return True
-        except Exception:
-            time.sleep(0.5)
+    import webbrowser
+    # Espera la señal del hilo del servidor en lugar de sondear la URL
+    listo = _servidor_listo.wait(timeout)
     try:
         webbrowser.open(url)
     except Exception:
         pass
+    return listo
+
+
+def _precalentar():
+    """Cargar el modelo IA y el catálogo en segundo plano una vez que el servidor ya responde"""
+    _servidor_listo.wait()
+    try:
+        obtener_modelo_ia()
+    except Exception as e:
+        logger.warning(f"No se pudo precargar el modelo IA: {e}")
+    try:
+        with app.app_context():
+            _catalogo(forzar=True)
+    except Exception as e:
+        logger.warning(f"No se pudo precargar el catálogo: {e}")
+
+
+def _cmd_archivar(args):
+    """python app_empenos_web.py archivar [meses]"""
+    resultados = en_todas_las_sucursales(archivar_liquidados, int(args[0]) if args else None)
+    for sucursal, total in resultados.items():
+        print(f"{sucursal}: {total} empeños archivados")
+
+
+def _cmd_importar(args):
+    """python app_empenos_web.py importar usuarios|empenos|catalogo archivo.csv [sucursal]"""
+    if len(args) < 2:
+        print(_cmd_importar.__doc__)
+        sys.exit(2)
+    sucursal = _elegir_sucursal(args[2]) if len(args) > 2 else SUCURSAL_PRINCIPAL
+    with _EnSucursal(sucursal):
+        r = importar_csv(args[0], args[1], sucursal)
+    print(f"{sucursal}: {r['leidos']} leídos, {r['importados']} importados, "
+          f"{r['rechazados']} rechazados en {r['segundos']:.1f}s")
+    if r['ruta_rechazados']:
+        print(f"Rechazos: {r['ruta_rechazados']}")
+
+
+def _cmd_riesgo(args):
+    """python app_empenos_web.py riesgo [procesos]"""
+    resultados = en_todas_las_sucursales(calcular_riesgo, int(args[0]) if args else None)
+    for sucursal, total in resultados.items():
+        print(f"{sucursal}: {total} empeños puntuados")
+
+
+def _cmd_mantenimiento(args):
+    """python app_empenos_web.py mantenimiento [informe]"""
+    with app.app_context():
+        if args and args[0] == 'informe':
+            entradas = mantenimiento.leer_informe(os.path.join(_carpeta_datos(), 'mantenimiento.jsonl'))
+        else:
+            entradas = ejecutar_mantenimiento(forzar=True)
+    for e in entradas:
+        detalle = e.get('error') or e.get('omitido') or f"{e.get('segundos', 0):8.2f}s"
+        print(f"{e['fecha'][:19]}  {os.path.basename(e['base']):<22} {e['operacion']:<18} {detalle:>10}  "
+              f"{e['bytes_antes'] / 1e6:8.2f} MB -> {e['bytes_despues'] / 1e6:8.2f} MB")
+
+
+# Subcomandos de línea de comandos (sin argumentos se inicia el servidor)
+_SUBCOMANDOS = {
+    'archivar': _cmd_archivar,
+    'importar': _cmd_importar,
+    'mantenimiento': _cmd_mantenimiento,
+    'riesgo': _cmd_riesgo,
+}
 
 
 if __name__ == '__main__':
+    # El cálculo de riesgo usa procesos 'spawn'; en el ejecutable de PyInstaller los atiende este mismo binario
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] in _SUBCOMANDOS:
+        _SUBCOMANDOS[sys.argv[1]](sys.argv[2:])
+        sys.exit(0)
+    import webbrowser
     _app_url = 'http://127.0.0.1:5000'
     def _run_server():
-        app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False, threaded=True)
+        global _servidor
+        from werkzeug.serving import make_server
+        _servidor = make_server('127.0.0.1', 5000, app, threaded=True)
+        _servidor_listo.set()
+        _servidor.serve_forever()
     server_thread = threading.Thread(target=_run_server, daemon=True)
     server_thread.start()
+    threading.Thread(target=_precalentar, daemon=True).start()
+    threading.Thread(target=_hilo_archivado, daemon=True).start()
+    threading.Thread(target=_hilo_mantenimiento, daemon=True).start()
+    threading.Thread(target=_hilo_riesgo, daemon=True).start()
+    try:
+        import pystray
+        from PIL import Image, ImageDraw
+        _HAS_PYSTRAY = True
+    except Exception:
+        _HAS_PYSTRAY = False
     if _HAS_PYSTRAY:
         def _make_icon_image(size=64, color1=(30,144,255,255), color2=(255,255,255,0)):
             img = Image.new('RGBA', (size, size), color2)
@@ -1122,8 +3006,10 @@ if __name__ == '__main__':
             except Exception:
                 pass
         def _shutdown(_: pystray.Icon, item=None):
+            # Detener el servidor en el mismo proceso (sin ruta HTTP que cualquier página pueda invocar)
             try:
-                urllib.request.urlopen(_app_url + '/_shutdown', data=b'', timeout=2)
+                if _servidor is not None:
+                    _servidor.shutdown()
             except Exception:
                 pass
             try:
@@ -0,0 +1,372 @@
+"""asgi.py
+Servidor ASGI opcional. Las rutas JSON de solo lectura más pedidas (/api/stats,
+/api/empenos, /api/citas, /api/turnos) se atienden con manejadores async sobre
+aiosqlite: mientras una consulta espera a SQLite, el event loop sigue atendiendo
+otras conexiones, así que los clientes simultáneos no cuestan un hilo cada uno.
+/api/cotizar corre la predicción del modelo IA (CPU) en un pool de hilos aparte
+para no frenar el event loop. El stream SSE del panel admin (/api/stats/stream) se
+sirve en el event loop: cada cliente abierto espera su cola sin ocupar un hilo. El
+resto de la app (HTML, formularios) es la misma app Flask, servida a través de
+WsgiToAsgi en un pool de ASGI_HILOS_FLASK hilos.
+
+Las consultas, la autenticación (usuario activo global) y el armado de las
+respuestas son los de app_empenos_web.py; la sucursal se lee de la cookie de
+sesión firmada de Flask. Sin permisos, estas rutas responden 401 en JSON.
+
+Uso:
+    uvicorn asgi:app --host 127.0.0.1 --port 5000
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qsl
+
+import aiosqlite
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from itsdangerous import BadSignature
+from werkzeug.http import parse_accept_header
+
+import app_empenos_web as web
+import compresion
+import eventos
+
+logger = logging.getLogger(__name__)
+
+MAX_CUERPO = 64 * 1024  # Bytes máximos del cuerpo de un POST JSON
+
+
+class _Conexiones:
+    """Pool de conexiones aiosqlite a la base de una sucursal, con el archivo histórico adjunto"""
+
+    def __init__(self, ruta, tamano):
+        self.ruta = ruta
+        self.tamano = max(int(tamano), 1)
+        self._libres = asyncio.LifoQueue()
+        self._abiertas = []
+        self._creadas = 0
+
+    async def _abrir(self):
+        conn = await aiosqlite.connect(self.ruta)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute('ATTACH DATABASE ? AS archivo', (web._ruta_archivo(self.ruta),))
+        return conn
+
+    @contextlib.asynccontextmanager
+    async def conexion(self):
+        if self._libres.empty() and self._creadas < self.tamano:
+            self._creadas += 1
+            try:
+                conn = await self._abrir()
+            except Exception:
+                self._creadas -= 1
+                raise
+            self._abiertas.append(conn)
+        else:
+            conn = await self._libres.get()
+        try:
+            yield conn
+        finally:
+            self._libres.put_nowait(conn)
+
+    async def consultar(self, sql, parametros=()):
+        async with self.conexion() as conn:
+            async with conn.execute(sql, parametros) as cursor:
+                return await cursor.fetchall()
+
+    async def cerrar(self):
+        for conn in self._abiertas:
+            await conn.close()
+        self._abiertas.clear()
+
+
+_pools = {}
+_pool_prediccion = ThreadPoolExecutor(max_workers=max(web.app.config['ASGI_HILOS_PREDICCION'], 1),
+                                      thread_name_prefix='prediccion')
+
+
+def _ruta_base(sucursal):
+    """Archivo SQLite de la sucursal; la base se crea/migra la primera vez, igual que en Flask"""
+    with web.app.app_context():
+        return web._engine_sucursal(sucursal).url.database
+
+
+async def _pool(sucursal):
+    pool = _pools.get(sucursal)
+    if pool is None:
+        ruta = await asyncio.get_running_loop().run_in_executor(None, _ruta_base, sucursal)
+        pool = _pools.setdefault(sucursal, _Conexiones(ruta, web.app.config['ASGI_CONEXIONES']))
+    return pool
+
+
+# ============ SESIÓN Y REQUEST ============
+
+def _headers(scope):
+    return {nombre.decode('latin-1').lower(): valor.decode('latin-1') for nombre, valor in scope['headers']}
+
+
+def _sesion(headers):
+    """Sesión de Flask (cookie firmada) del request; {} si falta o no es válida"""
+    cookies = SimpleCookie()
+    try:
+        cookies.load(headers.get('cookie', ''))
+    except CookieError:
+        return {}
+    morsel = cookies.get(web.app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return {}
+    serializador = web.app.session_interface.get_signing_serializer(web.app)
+    try:
+        return serializador.loads(morsel.value, max_age=int(web.app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def _sucursal(sesion, args):
+    """Misma regla que _fijar_sucursal, sin guardar el cambio de sucursal del admin en la sesión"""
+    if sesion.get('is_admin') and args.get('sucursal'):
+        return web._elegir_sucursal(args['sucursal'])
+    return web._elegir_sucursal(sesion.get('sucursal'))
+
+
+async def _leer_cuerpo(receive):
+    """Cuerpo completo del request, o None si supera MAX_CUERPO"""
+    partes, total = [], 0
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] != 'http.request':
+            return b''
+        partes.append(mensaje.get('body', b''))
+        total += len(partes[-1])
+        if total > MAX_CUERPO:
+            return None
+        if not mensaje.get('more_body'):
+            return b''.join(partes)
+
+
+def _datos_formulario(headers, cuerpo):
+    """Campos de un cuerpo JSON o application/x-www-form-urlencoded"""
+    if headers.get('content-type', '').startswith('application/json'):
+        try:
+            datos = json.loads(cuerpo or b'{}')
+        except ValueError:
+            return {}
+        return datos if isinstance(datos, dict) else {}
+    return dict(parse_qsl(cuerpo.decode('utf-8', 'replace')))
+
+
+async def _responder(send, headers, estado, cuerpo):
+    datos = json.dumps(cuerpo, ensure_ascii=False).encode()
+    encabezados = [(b'content-type', b'application/json'), (b'vary', b'Accept-Encoding')]
+    minimo = web.app.config['COMPRESION_MINIMO']
+    if minimo and len(datos) >= minimo:
+        codificacion = compresion.elegir_codificacion(
+            parse_accept_header(headers.get('accept-encoding', '')))
+        if codificacion:
+            datos = compresion.comprimir(datos, codificacion, web.app.config['COMPRESION_NIVEL'])
+            encabezados.append((b'content-encoding', codificacion.encode()))
+    encabezados.append((b'content-length', str(len(datos)).encode()))
+    await send({'type': 'http.response.start', 'status': estado, 'headers': encabezados})
+    await send({'type': 'http.response.body', 'body': datos})
+
+
+# ============ MANEJADORES ASYNC ============
+
+_SIN_SESION = (401, {'error': 'Debe iniciar sesión'})
+_SIN_PERMISOS = (401, {'error': 'Acceso restringido. Requiere permisos de administrador.'})
+
+
+async def _stats_sucursal(sucursal):
+    pool = await _pool(sucursal)
+    async with pool.conexion() as conn:
+        async with conn.execute(web.SQL_STATS_EMPENOS) as cursor:
+            empenos = tuple(await cursor.fetchone())
+        async with conn.execute(web.SQL_TOTAL_USUARIOS) as cursor:
+            usuarios = (await cursor.fetchone())[0]
+    return web._armar_stats(empenos, usuarios)
+
+
+async def _api_stats(sucursal, args, datos):
+    if web._usuario_api() is not None:
+        return _SIN_PERMISOS
+    # Todas las sucursales a la vez: cada consulta corre en el hilo de su conexión
+    parciales = await asyncio.gather(*(_stats_sucursal(s) for s in web.SUCURSALES))
+    return 200, web._respuesta_stats(web._sumar_stats(parciales))
+
+
+async def _listado(sucursal, args, sql, clave, convertir):
+    user_id = web._usuario_api()
+    if user_id is False:
+        return _SIN_SESION
+    consulta, parametros = web._consulta_listado(sql, args, user_id)
+    filas = await (await _pool(sucursal)).consultar(consulta, parametros)
+    return 200, web._pagina_api(clave, [convertir(dict(fila)) for fila in filas], parametros['limite'])
+
+
+async def _api_empenos(sucursal, args, datos):
+    return await _listado(sucursal, args, web.SQL_API_EMPENOS, 'empenos', web._empeno_api)
+
+
+async def _api_citas(sucursal, args, datos):
+    return await _listado(sucursal, args, web.SQL_API_CITAS, 'citas', dict)
+
+
+def _cargar_agenda(sucursal):
+    with web._EnSucursal(sucursal):
+        return web._agenda_sucursal()
+
+
+async def _api_turnos(sucursal, args, datos):
+    if not isinstance(web.usuario_activo, web.User):
+        return _SIN_SESION
+    agenda_suc = web._agendas.get(sucursal)
+    if agenda_suc is None:
+        # Solo la primera vez por sucursal: la agenda se arma desde las citas activas
+        agenda_suc = await asyncio.get_running_loop().run_in_executor(None, _cargar_agenda, sucursal)
+    return 200, web._turnos_api(agenda_suc, args)
+
+
+def _cotizar(datos):
+    with web.app.app_context():
+        return web._cotizacion_api(datos)
+
+
+async def _api_cotizar(sucursal, args, datos):
+    if not web.usuario_activo:
+        return _SIN_SESION
+    cuerpo, estado = await asyncio.get_running_loop().run_in_executor(_pool_prediccion, _cotizar, datos)
+    return estado, cuerpo
+
+
+_RUTAS = {
+    ('GET', '/api/stats'): _api_stats,
+    ('GET', '/api/empenos'): _api_empenos,
+    ('GET', '/api/citas'): _api_citas,
+    ('GET', '/api/turnos'): _api_turnos,
+    ('POST', '/api/cotizar'): _api_cotizar,
+}
+
+
+# ============ SSE DEL PANEL ADMIN ============
+
+async def _esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _stats_stream(scope, receive, send):
+    """Mismo stream que api_stats_stream de Flask, como corrutina: estado inicial y luego
+    los cambios que difunde web.dashboard"""
+    web._marcar_actividad()
+    if web._usuario_api() is not None:
+        await _responder(send, _headers(scope), *_SIN_PERMISOS)
+        return
+    loop = asyncio.get_running_loop()
+    # suscribir() puede calcular el estado inicial (consultas): fuera del event loop
+    cola, inicial = await loop.run_in_executor(
+        _pool_flask, web.dashboard.suscribir, functools.partial(eventos.ColaAsync, loop))
+    desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+        mensaje = 'retry: 5000\n\n' + inicial
+        while mensaje is not None:
+            await send({'type': 'http.response.body', 'body': mensaje.encode(), 'more_body': True})
+            espera = asyncio.ensure_future(cola.esperar(web.DASHBOARD_KEEPALIVE))
+            await asyncio.wait((espera, desconexion), return_when=asyncio.FIRST_COMPLETED)
+            if desconexion.done():
+                espera.cancel()
+                return
+            try:
+                mensaje = espera.result()
+            except TimeoutError:
+                # Comentario SSE: mantiene viva la conexión y detecta clientes desconectados
+                mensaje = ': keepalive\n\n'
+        # Cliente lento desconectado por el publicador: EventSource reconecta solo
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        desconexion.cancel()
+        web.dashboard.desuscribir(cola)
+
+
+_RUTAS_STREAMING = {
+    ('GET', '/api/stats/stream'): _stats_stream,
+}
+
+
+# ============ APLICACIÓN ASGI ============
+
+# asgiref corre cada llamada WSGI con thread_sensitive=True, es decir en un único hilo
+# compartido: un request lento frenaría a todos los demás. Acá cada request de Flask
+# toma un hilo de un pool propio.
+_pool_flask = ThreadPoolExecutor(max_workers=max(web.app.config['ASGI_HILOS_FLASK'], 1),
+                                 thread_name_prefix='flask')
+
+
+class _InstanciaFlask(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                 executor=_pool_flask)
+
+
+class _FlaskEnPool(WsgiToAsgi):
+    """WsgiToAsgi que atiende cada request en un hilo de _pool_flask"""
+
+    async def __call__(self, scope, receive, send):
+        await _InstanciaFlask(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+_flask = _FlaskEnPool(web.app)
+
+
+async def _ciclo_de_vida(receive, send):
+    """Arranque: precargar modelo IA y catálogo; cierre: cerrar conexiones y el pool de predicción"""
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            web._servidor_listo.set()
+            threading.Thread(target=web._precalentar, daemon=True).start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            for pool in list(_pools.values()):
+                await pool.cerrar()
+            _pool_prediccion.shutdown(wait=False)
+            _pool_flask.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _ciclo_de_vida(receive, send)
+        return
+    ruta = (scope.get('method'), scope.get('path'))
+    if scope['type'] == 'http' and ruta in _RUTAS_STREAMING:
+        await _RUTAS_STREAMING[ruta](scope, receive, send)
+        return
+    manejador = _RUTAS.get(ruta) if scope['type'] == 'http' else None
+    if manejador is None:
+        await _flask(scope, receive, send)
+        return
+
+    web._marcar_actividad()
+    headers = _headers(scope)
+    args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+    datos = {}
+    if scope['method'] == 'POST':
+        cuerpo = await _leer_cuerpo(receive)
+        if cuerpo is None:
+            await _responder(send, headers, 413, {'error': 'Cuerpo demasiado grande'})
+            return
+        datos = _datos_formulario(headers, cuerpo)
+    try:
+        estado, respuesta = await manejador(_sucursal(_sesion(headers), args), args, datos)
+    except Exception as e:
+        logger.error(f"Error en {scope['method']} {scope['path']} (ASGI): {e}")
+        estado, respuesta = 500, {'error': 'Error interno del servidor'}
+    await _responder(send, headers, estado, respuesta)
@@ -0,0 +1,107 @@
+"""bench_agenda.py
+Mide la agenda de tasaciones con un año de citas: latencia de reservar el primer turno
+libre y de sugerir los próximos K turnos con los bitmaps por día, contra buscar el turno
+consultando la tabla de citas turno por turno (índice sobre fecha, hora, tasador).
+
+Uso:
+    python benchmarks/bench_agenda.py [--tasadores 3] [--ocupacion 0.8] [--consultas 2000] [--k 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    return (statistics.median(tiempos), tiempos[int(len(tiempos) * 0.99)], tiempos[-1])
+
+
+def _primer_libre_sql(conn, agenda_suc, desde, max_dias=366):
+    """Búsqueda equivalente sin agenda en memoria: una consulta por turno candidato"""
+    for d in range(max_dias):
+        dia = desde + timedelta(days=d)
+        if not agenda_suc.es_dia_habil(dia):
+            continue
+        fecha = dia.isoformat()
+        for i in range(agenda_suc.turnos_por_dia):
+            hora = agenda_suc.hora(i)
+            ocupados = conn.execute("SELECT COUNT(*) FROM cita WHERE fecha = ? AND hora = ? "
+                                    "AND estado IN ('pendiente', 'confirmada')", (fecha, hora)).fetchone()[0]
+            if ocupados < agenda_suc.tasadores:
+                return dia, hora
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tasadores', type=int, default=3)
+    parser.add_argument('--ocupacion', type=float, default=0.8, help='fracción de turnos reservados')
+    parser.add_argument('--consultas', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, RAIZ)
+    import agenda
+
+    rnd = random.Random(0)
+    agenda_suc = agenda.Agenda(args.tasadores)
+    hoy = date.today() + timedelta(days=1)
+    dias = [hoy + timedelta(days=d) for d in range(366)]
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE cita (id INTEGER PRIMARY KEY, fecha TEXT, hora TEXT, estado TEXT, tasador INTEGER)')
+    conn.execute("CREATE UNIQUE INDEX ux_cita_turno_activo ON cita (fecha, hora, tasador) "
+                 "WHERE estado IN ('pendiente', 'confirmada')")
+
+    # Un año de citas con la ocupación pedida (los primeros días quedan llenos, como en la realidad)
+    filas = []
+    t0 = time.perf_counter()
+    for n, dia in enumerate(dias):
+        if not agenda_suc.es_dia_habil(dia):
+            continue
+        ocupacion = 1.0 if n < 14 else args.ocupacion
+        for i in range(agenda_suc.turnos_por_dia):
+            for _ in range(agenda_suc.tasadores):
+                if rnd.random() < ocupacion:
+                    hora = agenda_suc.hora(i)
+                    tasador = agenda_suc.ocupar(dia, hora)
+                    filas.append((dia.isoformat(), hora, 'pendiente', tasador))
+    carga = time.perf_counter() - t0
+    conn.executemany('INSERT INTO cita (fecha, hora, estado, tasador) VALUES (?, ?, ?, ?)', filas)
+    conn.commit()
+    print(f"{len(filas)} citas en {len(dias)} días, {args.tasadores} tasadores, "
+          f"{agenda_suc.turnos_por_dia} turnos/día; carga de la agenda {carga * 1000:.0f} ms")
+
+    # Todas las búsquedas parten de la misma ocupación: cada reserva se libera al medirla
+    desdes = [rnd.choice(dias[:30]) for _ in range(args.consultas)]
+    resultados = {f'siguientes_libres(k={args.k})': [], 'reservar primer libre': [], 'primer libre por SQL': []}
+    for n, desde in enumerate(desdes):
+        t = time.perf_counter()
+        agenda_suc.siguientes_libres(desde, k=args.k)
+        resultados[f'siguientes_libres(k={args.k})'].append((time.perf_counter() - t) * 1e6)
+
+        t = time.perf_counter()
+        dia, hora, _ = agenda_suc.primer_libre(desde)
+        tasador = agenda_suc.ocupar(dia, hora)
+        resultados['reservar primer libre'].append((time.perf_counter() - t) * 1e6)
+        agenda_suc.liberar(dia, hora, tasador)
+
+        if n % 10 == 0:
+            t = time.perf_counter()
+            _primer_libre_sql(conn, agenda_suc, desde)
+            resultados['primer libre por SQL'].append((time.perf_counter() - t) * 1e6)
+
+    print(f"{'operación':<26}{'mediana µs':>12}{'p99 µs':>12}{'máx µs':>12}")
+    for nombre, tiempos in resultados.items():
+        mediana, p99, maximo = _percentiles(tiempos)
+        print(f"{nombre:<26}{mediana:>12.1f}{p99:>12.1f}{maximo:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
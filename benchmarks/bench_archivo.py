@@ -0,0 +1,100 @@
+"""bench_archivo.py
+Mide el efecto del archivado hot/cold: filas y tamaño de las tablas activas y
+latencia de las consultas del panel admin y de reportes antes y después de
+archivar los empeños liquidados.
+
+Uso:
+    python benchmarks/bench_archivo.py [--empenos 100000] [--liquidados 0.85]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _cronometrar(funcion, repeticiones=5):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--empenos', type=int, default=100000)
+    parser.add_argument('--liquidados', type=float, default=0.85,
+                        help='fracción de empeños pagados hace más de un año')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    rng = random.Random(0)
+    ahora = datetime.now(timezone.utc)
+    viejo = (ahora - timedelta(days=800)).isoformat()
+    reciente = (ahora - timedelta(days=5)).isoformat()
+    with m.app.app_context():
+        with m.db.engine.begin() as conn:
+            conn.exec_driver_sql('INSERT INTO "user" (id, nombre, dni) VALUES (1, ?, ?)', ('Bench', '20000000'))
+            filas, pagos = [], []
+            for i in range(1, args.empenos + 1):
+                liquidado = rng.random() < args.liquidados
+                filas.append((i, 1, rng.choice(['Joya', 'Electrónico', 'Herramienta']), 'bench',
+                              100000, 100000, viejo if liquidado else reciente, 30, 0,
+                              'pagado' if liquidado else 'activo', 0.0))
+                if liquidado:
+                    pagos.append((i, True, viejo, 100000, 5000.0))
+            conn.exec_driver_sql(
+                'INSERT INTO empeno (id, user_id, tipo, descripcion, valor_estimado, valor_inicial, '
+                'created_at, term_days, renovaciones, estado, interes_acumulado) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', filas)
+            conn.exec_driver_sql(
+                'INSERT INTO paid_log (empeno_id, by_admin, time, monto_pagado, interes_pagado) '
+                'VALUES (?, ?, ?, ?, ?)', pagos)
+
+        consultas = {
+            'listado admin (activos)': lambda: m.Empeno.query.filter_by(estado='activo').all(),
+            'listado admin (todos)': lambda: m.Empeno.query.all(),
+            'conteo activos': lambda: m.Empeno.query.filter_by(estado='activo').count(),
+            'stats globales (hot+archivo)': m._stats_globales,
+        }
+
+        def _medir(etiqueta):
+            filas_hot = m.Empeno.query.count()
+            print(f"\n[{etiqueta}] filas empeno activas: {filas_hot:,}  "
+                  f"tamaño data: {os.path.getsize(os.path.join(directorio, 'bench.db')) / 1e6:.1f} MB")
+            resultado = {}
+            for nombre, consulta in consultas.items():
+                resultado[nombre] = _cronometrar(consulta)
+                m.db.session.expunge_all()
+                print(f"  {nombre:<30} {resultado[nombre]:8.1f} ms")
+            return resultado
+
+        antes = _medir('antes')
+        t0 = time.perf_counter()
+        archivados = m.archivar_liquidados(meses=12)
+        duracion = time.perf_counter() - t0
+        with m.db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM main')
+        print(f"\nArchivados {archivados:,} empeños en {duracion:.1f}s")
+        despues = _medir('después')
+
+        print("\nReducción de latencia:")
+        for nombre in consultas:
+            print(f"  {nombre:<30} x{antes[nombre] / max(despues[nombre], 1e-6):.1f}")
+
+
+if __name__ == '__main__':
+    main()
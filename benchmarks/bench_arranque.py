@@ -0,0 +1,78 @@
+"""bench_arranque.py
+Mide el arranque en frío de app_empenos_web con `python -X importtime`:
+tiempo total de import y los módulos que más tardan en cargarse.
+Script local (no se ejecuta en CI).
+
+Uso:
+    python benchmarks/bench_arranque.py [--repeticiones 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _importar_en_frio(cwd):
+    """Importa la app en un proceso nuevo; devuelve (segundos, líneas de importtime)"""
+    codigo = f"import sys; sys.path.insert(0, {RAIZ!r}); import app_empenos_web"
+    t0 = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo],
+        capture_output=True, text=True, cwd=cwd, check=True,
+    )
+    return time.perf_counter() - t0, salida.stderr.splitlines()
+
+
+def _parsear_importtime(lineas):
+    """Devuelve [(acumulado_us, nivel, modulo)]; nivel 0 = import de primer nivel"""
+    resultado = []
+    for linea in lineas:
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, modulo = linea.split('|')
+        # Cada nivel de anidamiento agrega dos espacios de indentación
+        nivel = (len(modulo) - len(modulo.lstrip()) - 1) // 2
+        resultado.append((int(acumulado.strip()), nivel, modulo.strip()))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    # Directorio temporal como cwd para no ensuciar el log del proyecto
+    cwd = tempfile.mkdtemp()
+    tiempos = []
+    lineas = []
+    for _ in range(args.repeticiones):
+        segundos, lineas = _importar_en_frio(cwd)
+        tiempos.append(segundos)
+
+    print(f"Arranque (import + esquema) en {args.repeticiones} ejecuciones:")
+    print(f"  mediana {statistics.median(tiempos) * 1000:.0f} ms, "
+          f"mínimo {min(tiempos) * 1000:.0f} ms, máximo {max(tiempos) * 1000:.0f} ms")
+
+    imports = _parsear_importtime(lineas)
+    total_app = next((a for a, n, m in imports if n == 0 and m == 'app_empenos_web'), 0)
+    print(f"\nimport app_empenos_web: {total_app / 1000:.1f} ms (última ejecución)")
+    print("Imports directos más lentos:")
+    directos = [(acumulado, modulo) for acumulado, nivel, modulo in imports if nivel == 1]
+    for acumulado, modulo in sorted(directos, reverse=True)[:args.top]:
+        print(f"  {acumulado / 1000:>8.1f} ms  {modulo}")
+
+    print("\nDependencias pesadas:")
+    cargados = {modulo.split('.')[0] for _, _, modulo in imports}
+    for pesado in ('pandas', 'sklearn', 'numpy', 'pystray', 'PIL'):
+        estado = 'CARGADO' if pesado in cargados else 'diferido'
+        print(f"  {pesado:<8} {estado}")
+
+
+if __name__ == '__main__':
+    main()
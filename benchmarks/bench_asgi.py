@@ -0,0 +1,244 @@
+"""bench_asgi.py
+Compara el servidor con hilos (werkzeug) contra el servidor ASGI (uvicorn + asgi.py)
+en las rutas JSON de solo lectura y /api/cotizar: con N conexiones simultáneas mide
+respuestas por segundo, latencia, errores, y memoria (RSS) e hilos del proceso servidor.
+La última ronda de cada servidor deja abiertos --clientes-sse streams del panel admin
+(/api/stats/stream) mientras pide rutas atendidas por Flask (HTML y JSON): un stream
+abierto no debe frenar al resto de la app.
+
+Uso:
+    python benchmarks/bench_asgi.py [--conexiones 50,200,500,1000] [--segundos 8] [--empenos 50000]
+                                    [--clientes-sse 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT_CLIENTE = 10.0  # Segundos que un cliente espera la respuesta completa
+
+# Mezcla de requests: listados paginados, estadísticas y estimaciones (CPU)
+CUERPO_COTIZAR = json.dumps({'valor_ref': 150000, 'estado': 80}).encode()
+PEDIDOS = [
+    b'GET /api/empenos?limite=20 HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n',
+    b'GET /api/empenos?limite=20&despues=25000 HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n',
+    b'GET /api/citas?limite=20 HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n',
+    b'GET /api/stats HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n',
+    b'POST /api/cotizar HTTP/1.1\r\nHost: bench\r\nConnection: close\r\nContent-Type: application/json\r\n'
+    + f'Content-Length: {len(CUERPO_COTIZAR)}\r\n\r\n'.encode() + CUERPO_COTIZAR,
+]
+# Rutas que no tienen manejador async: las atiende la app Flask en los dos servidores
+PEDIDOS_FLASK = [
+    b'GET / HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n',
+    b'GET /api/admision HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n',
+]
+PEDIDO_SSE = b'GET /api/stats/stream HTTP/1.1\r\nHost: bench\r\n\r\n'
+
+
+def _servir(args):
+    """Proceso servidor: la app con el admin logueado (usuario activo global), con hilos o ASGI"""
+    os.chdir(args.directorio)
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    m.app.test_client().post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'admin'})
+    m.obtener_modelo_ia()
+    if args.servidor == 'hilos':
+        from werkzeug.serving import make_server
+        servidor = make_server('127.0.0.1', args.puerto, m.app, threaded=True)
+        print('listo', flush=True)
+        servidor.serve_forever()
+    else:
+        import uvicorn
+        import asgi
+        print('listo', flush=True)
+        uvicorn.run(asgi.app, host='127.0.0.1', port=args.puerto, log_level='error', backlog=2048)
+
+
+def _memoria(pid):
+    """(RSS en MB, hilos) del proceso, leídos de /proc"""
+    campos = {}
+    with open(f'/proc/{pid}/status') as f:
+        for linea in f:
+            nombre, _, valor = linea.partition(':')
+            campos[nombre] = valor.split()
+    return int(campos['VmRSS'][0]) / 1024, int(campos['Threads'][0])
+
+
+async def _pedir(puerto, pedido):
+    """(estado HTTP o 'timeout'/'error', segundos) con una conexión nueva por request"""
+    t0 = time.perf_counter()
+    try:
+        async with asyncio.timeout(TIMEOUT_CLIENTE):
+            lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+            escritor.write(pedido)
+            await escritor.drain()
+            respuesta = await lector.read()
+            escritor.close()
+        estado = int(respuesta.split(b' ', 2)[1]) if respuesta else 'error'
+    except TimeoutError:
+        estado = 'timeout'
+    except (OSError, ValueError, IndexError):
+        estado = 'error'
+    return estado, time.perf_counter() - t0
+
+
+async def _ronda(puerto, conexiones, segundos, pedidos=PEDIDOS):
+    fin = time.monotonic() + segundos
+    estados, latencias = Counter(), []
+
+    async def _cliente(n):
+        i = n
+        while time.monotonic() < fin:
+            estado, duracion = await _pedir(puerto, pedidos[i % len(pedidos)])
+            estados[estado] += 1
+            if estado == 200:
+                latencias.append(duracion * 1000)
+            i += 1
+
+    await asyncio.gather(*(_cliente(n) for n in range(conexiones)))
+    return estados, latencias
+
+
+async def _ronda_con_sse(puerto, conexiones, segundos, clientes_sse):
+    """Ronda de rutas Flask con `clientes_sse` streams SSE abiertos; devuelve además los bytes
+    que recibió cada stream (deben llegar el estado inicial y los keepalives)"""
+    streams, recibidos = [], [0] * clientes_sse
+    for _ in range(clientes_sse):
+        lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+        escritor.write(PEDIDO_SSE)
+        await escritor.drain()
+        streams.append((lector, escritor))
+
+    async def _leer(n, lector):
+        while datos := await lector.read(4096):
+            recibidos[n] += len(datos)
+    lectores = [asyncio.ensure_future(_leer(n, lector)) for n, (lector, _) in enumerate(streams)]
+    await asyncio.sleep(0.5)  # Que los streams estén abiertos antes de empezar
+    try:
+        estados, latencias = await _ronda(puerto, conexiones, segundos, PEDIDOS_FLASK)
+    finally:
+        for tarea in lectores:
+            tarea.cancel()
+        for _, escritor in streams:
+            escritor.close()
+    return estados, latencias, recibidos
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _preparar_datos(directorio, args):
+    """Crear la base con usuarios, empeños y citas (en un proceso aparte del servidor)"""
+    os.chdir(directorio)
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+    rng = random.Random(0)
+    ahora = datetime.now(timezone.utc)
+    usuarios = max(args.empenos // 10, 1)
+    with m.app.app_context():
+        with m.db.engine.begin() as conn:
+            conn.exec_driver_sql('INSERT INTO "user" (id, nombre, dni) VALUES (?, ?, ?)',
+                                 [(i, f'Cliente {i}', str(20000000 + i)) for i in range(1, usuarios + 1)])
+            conn.exec_driver_sql(
+                'INSERT INTO empeno (user_id, tipo, descripcion, valor_estimado, valor_inicial, '
+                'created_at, term_days, renovaciones, estado, interes_acumulado) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(rng.randint(1, usuarios), rng.choice(['Joya', 'Electrónico', 'Herramienta']),
+                  'artículo de prueba para el benchmark', 100000, 100000,
+                  (ahora - timedelta(days=rng.randint(0, 60))).isoformat(), 30, 0,
+                  rng.choice(['activo', 'activo', 'pagado']), 0.0)
+                 for _ in range(args.empenos)])
+            conn.exec_driver_sql(
+                'INSERT INTO cita (user_id, empeno_id, fecha, hora, estado, tasador) VALUES (?, ?, ?, ?, ?, ?)',
+                [(rng.randint(1, usuarios), rng.randint(1, args.empenos),
+                  (ahora + timedelta(days=rng.randint(1, 90))).date().isoformat(),
+                  f'{rng.randint(9, 17):02d}:{rng.choice((0, 30)):02d}', 'pendiente', None)
+                 for _ in range(args.empenos // 10)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--conexiones', default='50,200,500,1000', help='conexiones simultáneas por ronda')
+    parser.add_argument('--segundos', type=float, default=8)
+    parser.add_argument('--empenos', type=int, default=50000)
+    parser.add_argument('--clientes-sse', type=int, default=5, help='streams SSE abiertos en la ronda de rutas Flask')
+    parser.add_argument('--servidor', choices=('hilos', 'asgi'), help=argparse.SUPPRESS)
+    parser.add_argument('--puerto', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--directorio', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.servidor:
+        _servir(args)
+        return
+
+    directorio = tempfile.mkdtemp()
+    entorno = {**os.environ, 'DATABASE_URL': 'sqlite:///' + os.path.join(directorio, 'bench.db'),
+               'COTIZADOR_BACKEND': os.environ.get('COTIZADOR_BACKEND', 'compilado'),
+               # Se comparan los servidores en sí: sin el control de admisión de la app Flask
+               'ADMISION_ACTIVA': os.environ.get('ADMISION_ACTIVA', '0')}
+    os.environ.update(entorno)
+    _preparar_datos(directorio, args)
+    print(f"{args.empenos} empeños, {args.empenos // 10} citas; rondas de {args.segundos:.0f}s, "
+          f"una conexión nueva por request, timeout del cliente {TIMEOUT_CLIENTE:.0f}s")
+    print(f"{'servidor':<8}{'conexiones':>11}{'resp/s':>9}{'mediana ms':>12}{'p99 ms':>9}"
+          f"{'RSS máx MB':>12}{'hilos máx':>11}  errores")
+
+    for servidor in ('hilos', 'asgi'):
+        puerto = _puerto_libre()
+        proceso = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--servidor', servidor, '--puerto', str(puerto),
+             '--directorio', directorio], env=entorno, stdout=subprocess.PIPE, text=True)
+        proceso.stdout.readline()
+        time.sleep(1.0)
+        try:
+            rondas = [(str(c), lambda c=int(c): _ronda(puerto, c, args.segundos))
+                      for c in args.conexiones.split(',')]
+            conexiones_flask = int(args.conexiones.split(',')[0])
+            rondas.append((f'{conexiones_flask}+{args.clientes_sse}sse', lambda: _ronda_con_sse(
+                puerto, conexiones_flask, args.segundos, args.clientes_sse)))
+            for nombre, ronda in rondas:
+                muestras, detener = [], threading.Event()
+
+                def _muestrear():
+                    while not detener.is_set():
+                        muestras.append(_memoria(proceso.pid))
+                        time.sleep(0.1)
+                muestreo = threading.Thread(target=_muestrear)
+                muestreo.start()
+                estados, latencias, *sse = asyncio.run(ronda())
+                detener.set()
+                muestreo.join()
+                latencias.sort()
+                errores = {estado: n for estado, n in estados.items() if estado != 200}
+                mediana = statistics.median(latencias) if latencias else float('nan')
+                p99 = latencias[int(len(latencias) * 0.99)] if latencias else float('nan')
+                extra = f"  SSE: bytes por stream {sse[0]}" if sse else ''
+                print(f"{servidor:<8}{nombre:>11}{len(latencias) / args.segundos:>9.0f}{mediana:>12.1f}"
+                      f"{p99:>9.1f}{max(m for m, _ in muestras):>12.1f}{max(h for _, h in muestras):>11}  "
+                      f"{errores or '-'}{extra}")
+                time.sleep(1.0)
+        finally:
+            proceso.terminate()
+            proceso.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""bench_catalogo.py
+Mide el catálogo de precios de referencia: armado y memoria del trie, latencia del
+autocompletado y de la actualización incremental, contra resolver la sugerencia en
+SQLite (rango sobre la clave indexada y LIKE '%texto%' sobre el nombre).
+
+Uso:
+    python benchmarks/bench_catalogo.py [--articulos 100000] [--consultas 5000]
+"""
+import argparse
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIPOS = ['Celular', 'Notebook', 'Televisor', 'Joya', 'Reloj', 'Consola', 'Bicicleta', 'Herramienta',
+         'Cámara', 'Tablet', 'Guitarra', 'Electrodoméstico']
+MARCAS = ['Samsung', 'Apple', 'Motorola', 'Xiaomi', 'Lenovo', 'HP', 'Dell', 'Sony', 'LG', 'Philips', 'Bosch',
+          'Makita', 'Nikon', 'Canon', 'Fender', 'Yamaha', 'Casio', 'Seiko', 'Trek', 'Oro 18k']
+SILABAS = ['ga', 'la', 'xy', 'pro', 'max', 'ul', 'tra', 'no', 'te', 'ai', 'ze', 'ro', 'li', 'fe', 'vo']
+
+
+def _percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    return (statistics.median(tiempos), tiempos[int(len(tiempos) * 0.99)], tiempos[-1])
+
+
+def _medir(funcion, argumentos):
+    tiempos = []
+    for argumento in argumentos:
+        t = time.perf_counter()
+        funcion(argumento)
+        tiempos.append((time.perf_counter() - t) * 1e6)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--articulos', type=int, default=100000)
+    parser.add_argument('--consultas', type=int, default=5000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, RAIZ)
+    import catalogo
+
+    rnd = random.Random(0)
+    ahora = datetime.now(timezone.utc).isoformat()
+    filas, claves = [], set()
+    while len(filas) < args.articulos:
+        tipo, marca = rnd.choice(TIPOS), rnd.choice(MARCAS)
+        modelo = ''.join(rnd.choice(SILABAS) for _ in range(rnd.randint(2, 3))).capitalize() + f' {rnd.randint(1, 999)}'
+        clave = catalogo.clave(tipo, marca, modelo)
+        if clave not in claves:
+            claves.add(clave)
+            filas.append((clave, tipo, marca, modelo, float(rnd.randint(10, 2000) * 1000), ahora))
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE catalogo_articulo (id INTEGER PRIMARY KEY, clave VARCHAR(370) NOT NULL UNIQUE, '
+                 'tipo VARCHAR(120), marca VARCHAR(120), modelo VARCHAR(120), valor_referencia FLOAT, '
+                 'aceptados INTEGER NOT NULL DEFAULT 0, suma_aceptado FLOAT NOT NULL DEFAULT 0, '
+                 'revision INTEGER, updated_at VARCHAR(64))')
+    conn.execute('CREATE INDEX ix_catalogo_articulo_revision ON catalogo_articulo (revision)')
+    t0 = time.perf_counter()
+    with conn:
+        conn.executemany(catalogo.SQL_GUARDAR, filas)
+        # Historial de aceptados sesgado: unos pocos artículos concentran la mayoría
+        conn.executemany('UPDATE catalogo_articulo SET aceptados = ? WHERE id = ?',
+                         [(int(rnd.paretovariate(1.2)), i) for i in range(1, args.articulos + 1)])
+    print(f"{args.articulos} artículos guardados en SQLite en {time.perf_counter() - t0:.1f}s")
+
+    memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    indice = catalogo.Catalogo()
+    indice.actualizar(catalogo.Articulo(i, t, m, mo, c, v, a, None, r) for i, c, t, m, mo, v, a, r in conn.execute(
+        'SELECT id, clave, tipo, marca, modelo, valor_referencia, aceptados, revision FROM catalogo_articulo'))
+    armado = time.perf_counter() - t0
+    memoria = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memoria) * 1024  # ru_maxrss en KB (Linux)
+    print(f"Trie armado en {armado:.1f}s, ~{memoria / 1e6:.0f} MB de memoria")
+
+    # Prefijos reales de 1 a 24 caracteres, empezando en cualquier palabra del nombre
+    consultas = []
+    for _ in range(args.consultas):
+        _, tipo, marca, modelo, _, _ = rnd.choice(filas)
+        texto = rnd.choice([f'{tipo} {marca} {modelo}', f'{marca} {modelo}', modelo])
+        consultas.append(catalogo.normalizar(texto)[:rnd.randint(1, 24)])
+
+    resultados = {'trie sugerir(k=8)': _medir(lambda q: indice.sugerir(q, 8), consultas)}
+    resultados['SQL rango sobre clave'] = _medir(lambda q: conn.execute(
+        'SELECT id FROM catalogo_articulo WHERE clave >= ? AND clave < ? ORDER BY aceptados DESC LIMIT 8',
+        (q, q + '￿')).fetchall(), consultas[:max(1, args.consultas // 10)])
+    resultados["SQL LIKE '%texto%'"] = _medir(lambda q: conn.execute(
+        "SELECT id FROM catalogo_articulo WHERE (tipo || ' ' || marca || ' ' || modelo) LIKE ? "
+        'ORDER BY aceptados DESC LIMIT 8', (f'%{q}%',)).fetchall(), consultas[:max(1, args.consultas // 50)])
+
+    # Actualización incremental: un empeño aceptado cambia el ranking de un artículo
+    def _aceptar(articulo_id):
+        a = indice.obtener(articulo_id)
+        indice.actualizar([a._replace(aceptados=a.aceptados + 1, revision=indice.revision + 1)])
+    resultados['actualizar 1 artículo'] = _medir(_aceptar, [rnd.randint(1, args.articulos)
+                                                            for _ in range(args.consultas)])
+    resultados['obtener por id (cotizar)'] = _medir(indice.obtener, [rnd.randint(1, args.articulos)
+                                                                    for _ in range(args.consultas)])
+
+    print(f"{'operación':<28}{'mediana µs':>12}{'p99 µs':>12}{'máx µs':>12}")
+    for nombre, tiempos in resultados.items():
+        mediana, p99, maximo = _percentiles(tiempos)
+        print(f"{nombre:<28}{mediana:>12.1f}{p99:>12.1f}{maximo:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""bench_compresion.py
+Mide los bytes enviados por admin.html, panel.html y reportes.html sin comprimir,
+con gzip y con brotli, y el tiempo del primer render en un proceso nuevo (worker
+en frío) con y sin la caché de bytecode de Jinja en disco.
+
+Uso:
+    python benchmarks/bench_compresion.py [--empenos 2000]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLANTILLAS = ('admin.html', 'panel.html', 'reportes.html')
+
+# Proceso hijo: importa la app y mide solo la carga (compilación o lectura de caché) de cada plantilla
+_PRIMER_RENDER = """
+import sys, time, logging
+sys.path.insert(0, {raiz!r})
+import app_empenos_web as m
+logging.getLogger(m.__name__).setLevel(logging.WARNING)
+for nombre in {plantillas!r}:
+    t0 = time.perf_counter()
+    m.app.jinja_env.get_template(nombre)
+    print(nombre, (time.perf_counter() - t0) * 1000)
+"""
+
+
+def _primer_render(directorio, cache):
+    entorno = dict(os.environ, JINJA_CACHE_DIR=cache)
+    salida = subprocess.run([sys.executable, '-c', _PRIMER_RENDER.format(raiz=RAIZ, plantillas=PLANTILLAS)],
+                            cwd=directorio, env=entorno, capture_output=True, text=True, check=True).stdout
+    return {nombre: float(ms) for nombre, ms in (linea.split() for linea in salida.splitlines())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--empenos', type=int, default=2000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    import compresion
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    rng = random.Random(0)
+    ahora = datetime.now(timezone.utc)
+    cliente = m.app.test_client()
+    cliente.post('/registrar', data={'nombre': 'Cliente Bench', 'dni': '20000001'})
+    with m.app.app_context():
+        user_id = m.User.query.filter_by(dni='20000001').first().id
+        with m.db.engine.begin() as conn:
+            conn.exec_driver_sql(
+                'INSERT INTO empeno (user_id, tipo, descripcion, valor_estimado, valor_inicial, '
+                'created_at, term_days, renovaciones, estado, interes_acumulado) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(user_id, rng.choice(['Joya', 'Electrónico', 'Herramienta']), 'artículo de prueba',
+                  rng.randint(10000, 500000), 100000, (ahora - timedelta(days=rng.randint(0, 60))).isoformat(),
+                  30, 0, 'activo', 0.0) for _ in range(args.empenos)])
+
+    # usuario_activo es global en la app: cada cliente inicia sesión justo antes de medir su página
+    admin = m.app.test_client()
+    paginas = (
+        ('panel.html', cliente, '/panel', lambda: cliente.post('/login', data={'dni': '20000001'})),
+        ('admin.html', admin, '/admin_panel',
+         lambda: admin.post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'admin'})),
+        ('reportes.html', admin, '/reportes', lambda: None),
+    )
+
+    print("Bytes enviados:")
+    for plantilla, c, url, iniciar_sesion in paginas:
+        iniciar_sesion()
+        c.get(url)  # descarta los mensajes flash del login
+        tamanos = []
+        for codificacion in ('identity',) + compresion.codificaciones_disponibles():
+            tamanos.append((codificacion, len(c.get(url, headers={'Accept-Encoding': codificacion}).get_data())))
+        base = tamanos[0][1]
+        print(f"  {plantilla:<14} " + "  ".join(
+            f"{cod}: {n / 1024:8.1f} KB ({n / base:5.1%})" for cod, n in tamanos))
+
+    print("\nPrimer render en un worker nuevo (carga de plantilla, ms):")
+    cache = os.path.join(directorio, 'jinja_cache')
+    sin_cache = _primer_render(directorio, '')
+    _primer_render(directorio, cache)  # llena la caché
+    con_cache = _primer_render(directorio, cache)
+    for plantilla in PLANTILLAS:
+        print(f"  {plantilla:<14} sin caché {sin_cache[plantilla]:7.2f}  con caché {con_cache[plantilla]:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""bench_cotizador.py
+Compara los backends de cotización (bosque, compilado, lineal):
+tiempo de carga en frío, memoria, latencia p50/p99 de predicción y
+paridad de precisión contra el RandomForest original.
+
+Uso:
+    python benchmarks/bench_cotizador.py [--iteraciones 5000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+BACKENDS = ['bosque', 'compilado', 'lineal']
+
+
+def _medir_carga(nombre, ruta_compilado):
+    """Ejecutado en un proceso hijo: importa y construye el backend desde cero"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    import cotizador
+    cotizador.crear_backend(nombre, ruta_compilado=ruta_compilado)
+    carga_ms = (time.perf_counter() - t0) * 1000
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({'carga_ms': carga_ms, 'memoria_kb': pico / 1024}))
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iteraciones', type=int, default=5000)
+    parser.add_argument('--hijo', help=argparse.SUPPRESS)
+    parser.add_argument('--ruta', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        _medir_carga(args.hijo, args.ruta)
+        return
+
+    import numpy as np
+    import cotizador
+
+    ruta = os.path.join(tempfile.mkdtemp(), 'modelo_compilado.npz')
+    # Primera construcción del compilado (exporta el .npz); no se mide
+    cotizador.crear_backend('compilado', ruta_compilado=ruta)
+
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(10000, 400000, 2000), rng.uniform(0, 1, 2000)])
+    referencia = cotizador.crear_backend('bosque').predecir_lote(X)
+
+    print(f"{'backend':<10} {'carga ms':>9} {'mem KB':>9} {'p50 us':>8} {'p99 us':>8} {'MAE vs bosque':>14}")
+    for nombre in BACKENDS:
+        salida = subprocess.run(
+            [sys.executable, __file__, '--hijo', nombre, '--ruta', ruta],
+            capture_output=True, text=True, check=True, cwd=RAIZ,
+        )
+        carga = json.loads(salida.stdout.strip().splitlines()[-1])
+
+        backend = cotizador.crear_backend(nombre, ruta_compilado=ruta)
+        muestras = X[rng.integers(0, len(X), args.iteraciones)]
+        tiempos = []
+        for valor_ref, estado in muestras:
+            t0 = time.perf_counter_ns()
+            backend.predecir(valor_ref, estado)
+            tiempos.append((time.perf_counter_ns() - t0) / 1000)
+
+        mae = float(np.abs(backend.predecir_lote(X) - referencia).mean())
+        print(f"{nombre:<10} {carga['carga_ms']:>9.1f} {carga['memoria_kb']:>9.0f} "
+              f"{_percentil(tiempos, 0.50):>8.1f} {_percentil(tiempos, 0.99):>8.1f} {mae:>14.2f}")
+
+    compilado = cotizador.crear_backend('compilado', ruta_compilado=ruta)
+    assert np.allclose(compilado.predecir_lote(X), referencia), 'El backend compilado difiere del bosque'
+    print('Paridad compilado/bosque: OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""bench_importador.py
+Mide el rendimiento de la importación masiva: genera un CSV de usuarios y otro de
+empeños (con un porcentaje de filas inválidas y DNIs duplicados), los importa con
+importador.py y reporta filas por segundo y cantidad de rechazos.
+
+Uso:
+    python benchmarks/bench_importador.py [--usuarios 100000] [--empenos 300000] [--invalidos 0.02]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _generar(directorio, usuarios, empenos, invalidos, rng):
+    ruta_usuarios = os.path.join(directorio, 'usuarios.csv')
+    ruta_empenos = os.path.join(directorio, 'empenos.csv')
+    dnis = [str(10000000 + i) for i in range(usuarios)]
+    with open(ruta_usuarios, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['nombre', 'dni', 'email', 'telefono'])
+        for i, dni in enumerate(dnis):
+            r = rng.random()
+            if r < invalidos / 2:
+                dni = 'X' + dni  # DNI inválido
+            elif r < invalidos:
+                dni = dnis[max(i - 1, 0)]  # DNI repetido
+            w.writerow([f'Cliente {i}', dni, f'cliente{i}@mail.com', '11-5555-0000'])
+    ahora = datetime.now(timezone.utc)
+    with open(ruta_empenos, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['dni', 'tipo', 'descripcion', 'valor_estimado', 'created_at', 'estado'])
+        for i in range(empenos):
+            valor = rng.randint(10000, 500000) if rng.random() >= invalidos else -1
+            w.writerow([rng.choice(dnis), rng.choice(['Joya', 'Electrónico', 'Herramienta']), 'importado',
+                        valor, (ahora - timedelta(days=rng.randint(0, 900))).isoformat(),
+                        rng.choice(['activo', 'pagado', 'pagado', 'vencido'])])
+    return ruta_usuarios, ruta_empenos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--usuarios', type=int, default=100000)
+    parser.add_argument('--empenos', type=int, default=300000)
+    parser.add_argument('--invalidos', type=float, default=0.02,
+                        help='fracción de filas inválidas o duplicadas')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    ruta_usuarios, ruta_empenos = _generar(directorio, args.usuarios, args.empenos,
+                                           args.invalidos, random.Random(0))
+    with m.app.app_context():
+        for tipo, ruta in (('usuarios', ruta_usuarios), ('empenos', ruta_empenos)):
+            r = m.importar_csv(tipo, ruta)
+            print(f"{tipo:<9} {r['leidos']:>9,} leídos  {r['importados']:>9,} importados  "
+                  f"{r['rechazados']:>7,} rechazados  {r['segundos']:6.2f}s  "
+                  f"({r['leidos'] / max(r['segundos'], 1e-9):,.0f} filas/s)")
+
+
+if __name__ == '__main__':
+    main()
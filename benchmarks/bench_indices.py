@@ -0,0 +1,125 @@
+"""bench_indices.py
+Mide el costo de ajustar por inflación y calcular el interés con tasas variables
+para 100.000 empeños: buscando el índice en la base para cada empeño, con una
+búsqueda binaria por empeño (bisect) en listas en memoria, con
+calcular_interes_acumulado() fila por fila, y con las series en memoria de
+indices.py sobre arreglos NumPy (una sola llamada para toda la cartera).
+
+Uso:
+    python benchmarks/bench_indices.py [--empenos 100000] [--anios 5]
+"""
+import argparse
+import bisect
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _cronometrar(funcion, *args):
+    t0 = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - t0
+
+
+def _escribir_series(directorio, anios, rng):
+    """IPC diario con ~100% anual e inflación variable, y una tasa diaria que cambia cada mes"""
+    hoy = date.today()
+    inicio = hoy - timedelta(days=365 * anios)
+    ipc, tasa, nivel = [], [], 100.0
+    for n in range((hoy - inicio).days + 1):
+        fecha = inicio + timedelta(days=n)
+        nivel *= 1 + rng.uniform(0.0005, 0.0035)
+        ipc.append((fecha.isoformat(), nivel))
+        if fecha.day == 1 or n == 0:
+            tasa.append((fecha.isoformat(), round(rng.uniform(0.001, 0.004), 5)))
+    for nombre, filas in (('ipc', ipc), ('tasa_diaria', tasa)):
+        with open(os.path.join(directorio, f'{nombre}.csv'), 'w') as f:
+            f.write('fecha,valor\n')
+            f.writelines(f'{fecha},{valor}\n' for fecha, valor in filas)
+    return ipc, tasa
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--empenos', type=int, default=100000)
+    parser.add_argument('--anios', type=int, default=5, help='años de historia de las series')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    carpeta_indices = os.path.join(directorio, 'indices')
+    os.makedirs(carpeta_indices)
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    os.environ['INDICES_DIR'] = carpeta_indices
+    rng = random.Random(0)
+    ipc, tasa = _escribir_series(carpeta_indices, args.anios, rng)
+
+    sys.path.insert(0, RAIZ)
+    import logging
+    import numpy as np
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    ahora = datetime.now(timezone.utc)
+    creados = [ahora - timedelta(days=rng.uniform(0, 365 * args.anios - 1)) for _ in range(args.empenos)]
+    creados_iso = [c.isoformat() for c in creados]
+    valores = [rng.randint(10, 500) * 1000 for _ in range(args.empenos)]
+    print(f"{args.empenos} empeños; IPC de {len(ipc)} días y tasa diaria de {len(tasa)} tramos")
+
+    resultados = []
+
+    # 1) Índice buscado en la base para cada empeño (dos consultas por empeño)
+    base = sqlite3.connect(os.path.join(directorio, 'indices.db'))
+    base.execute('CREATE TABLE indice (serie TEXT, fecha TEXT, valor REAL, PRIMARY KEY (serie, fecha))')
+    base.executemany("INSERT INTO indice VALUES ('ipc', ?, ?)", ipc)
+    base.commit()
+    consulta = "SELECT valor FROM indice WHERE serie = 'ipc' AND fecha <= ? ORDER BY fecha DESC LIMIT 1"
+
+    def _por_consulta():
+        hoy = base.execute(consulta, (ahora.date().isoformat(),)).fetchone()[0]
+        return [v * hoy / base.execute(consulta, (c[:10],)).fetchone()[0] for c, v in zip(creados_iso, valores)]
+    ajustados_db, segundos = _cronometrar(_por_consulta)
+    resultados.append(('IPC: consulta a la base por empeño', segundos))
+
+    # 2) Búsqueda binaria por empeño en listas en memoria
+    fechas_ipc, niveles = [f for f, _ in ipc], [v for _, v in ipc]
+
+    def _por_bisect():
+        hoy = niveles[bisect.bisect_right(fechas_ipc, ahora.date().isoformat()) - 1]
+        return [v * hoy / niveles[bisect.bisect_right(fechas_ipc, c[:10]) - 1] for c, v in zip(creados_iso, valores)]
+    _, segundos = _cronometrar(_por_bisect)
+    resultados.append(('IPC: bisect por empeño', segundos))
+
+    # 3) Series de indices.py sobre toda la cartera
+    serie_ipc = m._serie('ipc')
+    dias = np.array([m._dia(c) for c in creados])
+    capital = np.array(valores, dtype=np.float64)
+    ajustados, segundos = _cronometrar(lambda: capital * serie_ipc.factor(dias, m._dia(ahora)))
+    resultados.append(('IPC: vectorizado (indices.py)', segundos))
+    diferencia = np.max(np.abs(ajustados - np.array(ajustados_db)))
+
+    # Interés: la fórmula anterior con tasas fijas, calcular_interes_acumulado() por fila con las
+    # series y el cálculo vectorizado
+    def _tasa_fija():
+        return [v * m.INTERES_DIARIO * (ahora - datetime.fromisoformat(c)).days for c, v in zip(creados_iso, valores)]
+    _, segundos = _cronometrar(_tasa_fija)
+    resultados.append(('interés: por fila, tasa fija (anterior)', segundos))
+    _, segundos = _cronometrar(lambda: [m.calcular_interes_acumulado(c, v) for c, v in zip(creados_iso, valores)])
+    resultados.append(('interés: por fila', segundos))
+    _, segundos = _cronometrar(lambda: m.intereses_acumulados(dias, capital, np.zeros(len(dias)), m._dia(ahora)))
+    resultados.append(('interés: vectorizado', segundos))
+
+    print(f"diferencia máxima base vs. vectorizado: {diferencia:.6f}")
+    print(f"{'paso':<42}{'segundos':>10}{'µs/empeño':>12}")
+    for nombre, segundos in resultados:
+        print(f"{nombre:<42}{segundos:>10.3f}{segundos * 1e6 / args.empenos:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""bench_listados.py
+Mide el panel admin renderizado en streaming contra el render completo en memoria:
+tiempo hasta el primer byte, tiempo total y pico de memoria de Python por request.
+La base incluye citas, renovaciones y pagos, así que también comprueba que el panel
+completo se genera sin errores.
+
+Uso:
+    python benchmarks/bench_listados.py [--empenos 20000] [--usuarios 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _medir(generar_respuesta):
+    """(ms hasta el primer bloque, ms totales, MB pico, bytes) de una respuesta"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    iterador = iter(generar_respuesta())
+    primero = next(iterador)
+    ttfb = time.perf_counter() - t0
+    total = len(primero) + sum(len(b) for b in iterador)
+    duracion = time.perf_counter() - t0
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ttfb * 1000, duracion * 1000, pico / 1e6, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--empenos', type=int, default=20000)
+    parser.add_argument('--usuarios', type=int, default=2000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    rng = random.Random(0)
+    ahora = datetime.now(timezone.utc)
+    with m.app.app_context():
+        with m.db.engine.begin() as conn:
+            conn.exec_driver_sql('INSERT INTO "user" (id, nombre, dni) VALUES (?, ?, ?)',
+                                 [(i, f'Cliente {i}', str(20000000 + i)) for i in range(1, args.usuarios + 1)])
+            conn.exec_driver_sql(
+                'INSERT INTO empeno (user_id, tipo, descripcion, valor_estimado, valor_inicial, '
+                'created_at, term_days, renovaciones, estado, interes_acumulado) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(rng.randint(1, args.usuarios), rng.choice(['Joya', 'Electrónico', 'Herramienta']),
+                  'artículo de prueba para el benchmark', 100000, 100000,
+                  (ahora - timedelta(days=rng.randint(0, 60))).isoformat(), 30, 0, 'activo', 0.0)
+                 for _ in range(args.empenos)])
+            conn.exec_driver_sql(
+                'INSERT INTO cita (user_id, empeno_id, fecha, hora, estado, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(rng.randint(1, args.usuarios), i, (ahora + timedelta(days=i)).date().isoformat(), '10:00',
+                  rng.choice(['pendiente', 'confirmada']), ahora.isoformat()) for i in range(1, 101)])
+            conn.exec_driver_sql(
+                'INSERT INTO renovation_log (empeno_id, by, by_admin, time, old, new) VALUES (?, ?, ?, ?, ?, ?)',
+                [(i, str(20000000 + i), False, ahora.isoformat(), 100000, 105000) for i in range(1, 51)])
+            conn.exec_driver_sql(
+                'INSERT INTO paid_log (empeno_id, by_admin, time, monto_pagado, interes_pagado) VALUES (?, ?, ?, ?, ?)',
+                [(i, True, ahora.isoformat(), 100000, 3000.0) for i in range(51, 101)])
+
+    cliente = m.app.test_client()
+    cliente.post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'admin'})
+
+    def _streaming():
+        return cliente.get('/admin_panel', buffered=False).response
+
+    def _en_memoria():
+        # Referencia: listas completas y render_template, como antes del streaming
+        with m.app.test_request_context('/admin_panel'):
+            m.g.sucursal = m.SUCURSAL_PRINCIPAL
+            contexto = dict(
+                usuario=None, usuarios=list(m._filas_usuarios()), total_usuarios=args.usuarios,
+                empenos=list(m._filas_empenos_admin([])), total_empenos=args.empenos,
+                citas=[], renovaciones_log=[], pagos_log=[], stats=m._stats_globales(),
+                search_query='', estado_filter='')
+            return [m.render_template('admin.html', **contexto)]
+
+    # El panel completo, con citas y logs, tiene que generarse entero (el streaming corre con la
+    # vista ya terminada y su sesión cerrada)
+    respuesta = cliente.get('/admin_panel')
+    assert respuesta.status_code == 200 and respuesta.data.count(b'name="cita_id"') > 0, 'el panel admin falló'
+
+    for nombre, funcion in (('en memoria', _en_memoria), ('streaming', _streaming)):
+        ttfb, total, pico, tamano = _medir(funcion)
+        print(f"{nombre:<11} primer byte {ttfb:8.1f} ms  total {total:8.1f} ms  "
+              f"pico memoria {pico:7.1f} MB  ({tamano / 1e6:.1f} MB HTML)")
+
+
+if __name__ == '__main__':
+    main()
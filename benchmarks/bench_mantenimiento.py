@@ -0,0 +1,93 @@
+"""bench_mantenimiento.py
+Mide el mantenimiento en línea sobre una base con muchos logs borrados: duración del
+respaldo por pasos contra la copia en un solo paso y la latencia máxima de un escritor
+concurrente en cada caso; páginas y bytes recuperados por el vacío incremental.
+
+Uso:
+    python benchmarks/bench_mantenimiento.py [--filas 300000] [--paginas 256] [--intervalo 0.02]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _escritor(ruta, detener, latencias, intervalo):
+    """Inserta una fila cada `intervalo` segundos y registra cuánto tarda cada commit"""
+    conn = sqlite3.connect(ruta, timeout=30)
+    while not detener.is_set():
+        t0 = time.perf_counter()
+        with conn:
+            conn.execute("INSERT INTO paid_log (empeno_id, by_admin, time, monto_pagado, interes_pagado) "
+                         "VALUES (1, 1, 'bench', 1, 0.0)")
+        latencias.append((time.perf_counter() - t0) * 1000)
+        time.sleep(intervalo)
+    conn.close()
+
+
+def _con_escritor(ruta, funcion, intervalo):
+    detener, latencias = threading.Event(), []
+    hilo = threading.Thread(target=_escritor, args=(ruta, detener, latencias, intervalo))
+    hilo.start()
+    time.sleep(0.05)
+    try:
+        resultado = funcion()
+    finally:
+        detener.set()
+        hilo.join()
+    return resultado, max(latencias), len(latencias)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--filas', type=int, default=300000)
+    parser.add_argument('--paginas', type=int, default=256)
+    parser.add_argument('--intervalo', type=float, default=0.02, help='segundos entre escrituras concurrentes')
+    args = parser.parse_args()
+
+    sys.path.insert(0, RAIZ)
+    import mantenimiento
+
+    directorio = tempfile.mkdtemp()
+    ruta = os.path.join(directorio, 'bench.db')
+    conn = sqlite3.connect(ruta)
+    conn.execute('CREATE TABLE paid_log (id INTEGER PRIMARY KEY, empeno_id INTEGER, by_admin BOOLEAN, '
+                 'time VARCHAR(64), monto_pagado INTEGER, interes_pagado FLOAT)')
+    with conn:
+        conn.executemany('INSERT INTO paid_log (empeno_id, by_admin, time, monto_pagado, interes_pagado) '
+                         'VALUES (?, 1, ?, 100000, 5000.0)',
+                         ((i, f'2024-01-01T00:00:{i % 60:02d}+00:00 ' + 'x' * 100) for i in range(args.filas)))
+    conn.close()
+    carpeta = os.path.join(directorio, 'respaldos')
+    print(f"Base: {os.path.getsize(ruta) / 1e6:.1f} MB")
+
+    # Primera pasada: convierte la base a auto_vacuum=INCREMENTAL (VACUUM completo)
+    mantenimiento.compactar(ruta)
+
+    for nombre, paginas in ((f'por pasos ({args.paginas} páginas)', args.paginas), ('un solo paso', -1)):
+        r, maxima, commits = _con_escritor(ruta, lambda: mantenimiento.respaldar(ruta, carpeta, paginas), args.intervalo)
+        print(f"Respaldo {nombre:<26} {r['segundos']:6.2f}s  modo {r['modo']:<11} reinicios {r['reinicios']}  "
+              f"escritor: {commits} commits, latencia máx {maxima:7.1f} ms")
+
+    conn = sqlite3.connect(ruta)
+    with conn:
+        # Como el archivado: se borra el tramo más viejo, que libera páginas enteras
+        conn.execute('DELETE FROM paid_log WHERE id <= ?', (args.filas // 2,))
+    conn.close()
+    antes = os.path.getsize(ruta)
+    r, maxima, _ = _con_escritor(ruta, lambda: mantenimiento.compactar(ruta, max_paginas=10**9),
+                                 args.intervalo)
+    print(f"Vacío incremental: {r['paginas_libres']:,} páginas libres -> {r['paginas_libres_despues']:,} "
+          f"en {r['segundos']:.2f}s; {antes / 1e6:.1f} MB -> {os.path.getsize(ruta) / 1e6:.1f} MB; "
+          f"escritor latencia máx {maxima:.1f} ms")
+    r = mantenimiento.optimizar(ruta)
+    print(f"{r['operacion']}: {r['segundos']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""bench_riesgo.py
+Mide el cálculo por lotes del riesgo de cartera con un millón de empeños activos:
+lectura en columnas, puntaje vectorial en un proceso y en un pool de procesos,
+guardado de los puntajes y consulta de la vista "en riesgo", contra calcular fila
+por fila con _days_left() y calcular_interes_acumulado().
+
+Uso:
+    python benchmarks/bench_riesgo.py [--empenos 1000000] [--procesos 4] [--bloque 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _cronometrar(funcion, *args):
+    t0 = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--empenos', type=int, default=1000000, help='empeños activos')
+    parser.add_argument('--procesos', type=int, default=max(os.cpu_count() or 1, 2))
+    parser.add_argument('--bloque', type=int, default=200000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    sys.path.insert(0, RAIZ)
+    import logging
+    import riesgo
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    rng = random.Random(0)
+    ahora = datetime.now(timezone.utc)
+    usuarios = max(args.empenos // 10, 1)
+    historicos = args.empenos // 5
+    t0 = time.perf_counter()
+    with m.app.app_context():
+        with m.db.engine.begin() as conn:
+            conn.exec_driver_sql('INSERT INTO "user" (id, nombre, dni) VALUES (?, ?, ?)',
+                                 [(i, f'Cliente {i}', str(20000000 + i)) for i in range(1, usuarios + 1)])
+            conn.exec_driver_sql(
+                'INSERT INTO empeno (user_id, tipo, descripcion, valor_estimado, valor_inicial, '
+                'created_at, term_days, renovaciones, estado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(rng.randint(1, usuarios), 'Joya', 'artículo de prueba', valor, valor,
+                  (ahora - timedelta(days=rng.randint(0, 45), seconds=rng.randint(0, 86399))).isoformat(),
+                  30, rng.choice((0, 0, 0, 1, 2)), estado)
+                 for valor, estado in ((rng.randint(10, 500) * 1000, 'activo' if i < args.empenos else
+                                        rng.choice(('pagado', 'pagado', 'pagado', 'vencido')))
+                                       for i in range(args.empenos + historicos))])
+    print(f"{args.empenos} empeños activos + {historicos} históricos de {usuarios} clientes "
+          f"generados en {time.perf_counter() - t0:.0f}s")
+
+    resultados = []
+    with m._EnSucursal(m.SUCURSAL_PRINCIPAL):
+        # Referencia: el cálculo fila por fila que haría un reporte con las funciones actuales
+        muestra = m.db.session.execute(m.text(
+            "SELECT created_at, term_days, valor_inicial, renovaciones FROM empeno WHERE estado = 'activo' "
+            'LIMIT 20000')).all()
+
+        def _fila_por_fila():
+            for creado, plazo, valor, renovaciones in muestra:
+                m._days_left(creado, plazo)
+                m.calcular_interes_acumulado(creado, valor, renovaciones)
+        _, segundos = _cronometrar(_fila_por_fila)
+        resultados.append(('fila por fila (estimado)', segundos * args.empenos / len(muestra)))
+
+        def _leer():
+            with m.db.engine.connect() as conn:
+                return m._columnas_riesgo(conn, ahora)
+        columnas, segundos = _cronometrar(_leer)
+        resultados.append(('leer cartera en columnas', segundos))
+
+        _, segundos = _cronometrar(riesgo.puntuar_en_paralelo, columnas, ahora.timestamp(), 1, args.bloque)
+        resultados.append(('puntuar (1 proceso)', segundos))
+        _, segundos = _cronometrar(riesgo.puntuar_en_paralelo, columnas, ahora.timestamp(), args.procesos,
+                                   args.bloque)
+        resultados.append((f'puntuar ({args.procesos} procesos)', segundos))
+
+        total, segundos = _cronometrar(m.calcular_riesgo, 1, args.bloque)
+        resultados.append(('calcular_riesgo completo', segundos))
+        _, segundos = _cronometrar(m.calcular_riesgo, 1, args.bloque)
+        resultados.append(('recalcular (reemplaza)', segundos))
+
+    cliente = m.app.test_client()
+    cliente.post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'admin'})
+    respuesta, segundos = _cronometrar(cliente.get, '/admin/riesgo')
+    resultados.append((f'vista en riesgo (HTTP {respuesta.status_code})', segundos))
+
+    print(f"{total} empeños puntuados ({os.cpu_count()} CPU)")
+    print(f"{'paso':<30}{'segundos':>10}")
+    for nombre, segundos in resultados:
+        print(f"{nombre:<30}{segundos:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""carga_admision.py
+Prueba de carga local del control de admisión: muchos clientes piden /reportes
+(con un costo de CPU simulado, como un reporte sobre un archivo grande) mientras
+unos pocos clientes piden pre-cotizaciones. Compara latencia y timeouts de las
+cotizaciones con el control de admisión apagado y encendido.
+
+Uso:
+    python benchmarks/carga_admision.py [--reportes 32] [--clientes 4] [--segundos 10] [--costo-ms 150]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from functools import wraps
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT_CLIENTE = 5.0  # Segundos que un cliente espera una cotización antes de abandonar
+
+
+def _con_costo(vista, segundos):
+    """Envuelve la vista con trabajo de CPU en Python (retiene el GIL, como el render de un reporte)"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        fin = time.perf_counter() + segundos
+        while time.perf_counter() < fin:
+            pass
+        return vista(*args, **kwargs)
+    return envoltura
+
+
+def _pedir(url, datos=None, timeout=TIMEOUT_CLIENTE):
+    """(estado HTTP o 'timeout'/'error', segundos)"""
+    t0 = time.perf_counter()
+    try:
+        cuerpo = urllib.parse.urlencode(datos).encode() if datos else None
+        with urllib.request.urlopen(url, data=cuerpo, timeout=timeout) as respuesta:
+            respuesta.read()
+            estado = respuesta.status
+    except urllib.error.HTTPError as e:
+        estado = e.code
+    except (TimeoutError, urllib.error.URLError) as e:
+        estado = 'timeout' if 'timed out' in str(e) else 'error'
+    return estado, time.perf_counter() - t0
+
+
+def _ronda(base, args):
+    detener = threading.Event()
+    lock = threading.Lock()
+    reportes, cotizaciones, latencias = Counter(), Counter(), []
+
+    def _reportes():
+        while not detener.is_set():
+            estado, _ = _pedir(base + '/reportes', timeout=30)
+            with lock:
+                reportes[estado] += 1
+            if estado == 503:
+                time.sleep(0.05)
+
+    def _cotizaciones():
+        while not detener.is_set():
+            estado, segundos = _pedir(base + '/precotizar', {
+                'tipo': 'Joya', 'descripcion': 'carga', 'valor_ref': '150000', 'estado': '80'})
+            with lock:
+                cotizaciones[estado] += 1
+                if estado == 200:
+                    latencias.append(segundos * 1000)
+            time.sleep(0.02)
+
+    hilos = ([threading.Thread(target=_reportes) for _ in range(args.reportes)] +
+             [threading.Thread(target=_cotizaciones) for _ in range(args.clientes)])
+    for hilo in hilos:
+        hilo.start()
+    time.sleep(args.segundos)
+    detener.set()
+    for hilo in hilos:
+        hilo.join()
+    return reportes, cotizaciones, latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--reportes', type=int, default=32, help='clientes pidiendo /reportes sin pausa')
+    parser.add_argument('--clientes', type=int, default=4, help='clientes pidiendo cotizaciones')
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--costo-ms', type=float, default=150, help='CPU simulada por reporte')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    sys.path.insert(0, RAIZ)
+    import logging
+    import admision
+    import app_empenos_web as m
+    from werkzeug.serving import make_server
+    # Los rechazos por saturación son esperables en esta prueba
+    logging.getLogger(m.__name__).setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    m.app.view_functions['reportes'] = _con_costo(m.app.view_functions['reportes'], args.costo_ms / 1000)
+    # El usuario activo es global en la app: con el admin logueado sirven /reportes y /precotizar
+    m.app.test_client().post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'admin'})
+
+    servidor = make_server('127.0.0.1', 0, m.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{servidor.server_port}'
+    print(f"{args.reportes} clientes de reportes ({args.costo_ms:.0f} ms de CPU c/u) + {args.clientes} de "
+          f"cotizaciones durante {args.segundos:.0f}s; timeout del cliente {TIMEOUT_CLIENTE:.0f}s")
+
+    for activa in (False, True):
+        m.app.config['ADMISION_ACTIVA'] = activa
+        m.control_admision = admision.Admision(
+            m.app.config['ADMISION_LIMITE'], m.app.config['ADMISION_COLA'],
+            {grupo: int(limite) for grupo, limite in m._pares_config(m.app.config['ADMISION_LIMITES_RUTA']).items()},
+            {clase: int(ms) / 1000 for clase, ms in m._pares_config(m.app.config['ADMISION_ESPERA_MS']).items()},
+        )
+        reportes, cotizaciones, latencias = _ronda(base, args)
+        latencias.sort()
+        print(f"\nAdmisión {'encendida' if activa else 'apagada'}:")
+        if latencias:
+            print(f"  cotizaciones OK {len(latencias)}  mediana {statistics.median(latencias):7.0f} ms  "
+                  f"p99 {latencias[int(len(latencias) * 0.99)]:7.0f} ms")
+        print(f"  cotizaciones por estado: {dict(cotizaciones)}")
+        print(f"  reportes por estado:     {dict(reportes)}")
+        if activa:
+            for nombre, estado in m.control_admision.estado().items():
+                print(f"  limitador {nombre:<12} cola máx {estado['cola_maxima']:3}  admitidos {estado['admitidos']:5}  "
+                      f"rechazados {estado['rechazados']}")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
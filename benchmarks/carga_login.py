@@ -0,0 +1,107 @@
+"""carga_login.py
+Prueba de carga local: inunda /admin_login con contraseñas incorrectas desde
+varias IPs y mide la latencia de requests legítimos (inicio y login de cliente)
+antes y durante la inundación.
+
+Uso:
+    python benchmarks/carga_login.py [--atacantes 16] [--segundos 10] [--sin-limites]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+CLIENTES = 500
+
+
+def _medir_legitimos(cliente, segundos, latencias, desde=0):
+    """Cada iteración es un cliente distinto (DNI e IP propios) que entra una vez"""
+    fin = time.time() + segundos
+    i = desde
+    while time.time() < fin:
+        dni = str(30000000 + i % CLIENTES)
+        t0 = time.perf_counter()
+        cliente.get('/')
+        cliente.post('/login', data={'dni': dni}, environ_base={'REMOTE_ADDR': f'10.0.{i // 250 % 250}.{i % 250 + 1}'})
+        latencias.append((time.perf_counter() - t0) * 1000)
+        i += 1
+        time.sleep(0.05)
+    return i
+
+
+def _atacar(app, indice, fin, resultados, lock):
+    cliente = app.test_client()
+    ip = f'192.168.{indice // 250}.{indice % 250 + 1}'
+    while time.time() < fin:
+        respuesta = cliente.post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'incorrecta'},
+                                 environ_base={'REMOTE_ADDR': ip})
+        with cliente.session_transaction() as ses:
+            mensajes = [m for _, m in ses.pop('_flashes', [])]
+        clave = 'bloqueado' if any('Demasiados' in m for m in mensajes) else \
+            'ocupado' if any('ocupado' in m for m in mensajes) else 'verificado'
+        with lock:
+            resultados[clave] = resultados.get(clave, 0) + 1
+        respuesta.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--atacantes', type=int, default=16)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--sin-limites', action='store_true',
+                        help='desactiva throttling y cola acotada para comparar')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'carga.db')
+    if args.sin_limites:
+        os.environ['LOGIN_RAFAGA'] = '1000000'
+        os.environ['HASH_WORKERS'] = str(args.atacantes)
+        os.environ['HASH_COLA'] = str(args.atacantes)
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.ERROR)
+
+    with m.app.app_context():
+        m.db.session.add_all([m.User(nombre=f'Cliente {i}', dni=str(30000000 + i)) for i in range(CLIENTES)])
+        m.db.session.commit()
+    cliente = m.app.test_client()
+
+    base = []
+    siguiente = _medir_legitimos(cliente, min(3.0, args.segundos), base)
+
+    resultados, lock = {}, threading.Lock()
+    fin = time.time() + args.segundos
+    hilos = [threading.Thread(target=_atacar, args=(m.app, i, fin, resultados, lock))
+             for i in range(args.atacantes)]
+    for h in hilos:
+        h.start()
+    durante = []
+    _medir_legitimos(cliente, args.segundos, durante, desde=siguiente)
+    for h in hilos:
+        h.join()
+
+    print(f"Modo: {'sin límites' if args.sin_limites else 'throttling + pool acotado'}, "
+          f"{args.atacantes} atacantes, {args.segundos:.0f}s")
+    print(f"Legítimos sin carga:   p50 {_percentil(base, .5):7.1f} ms  p99 {_percentil(base, .99):7.1f} ms")
+    print(f"Legítimos con ataque:  p50 {_percentil(durante, .5):7.1f} ms  p99 {_percentil(durante, .99):7.1f} ms")
+    total = sum(resultados.values()) or 1
+    for clave in ('verificado', 'ocupado', 'bloqueado'):
+        n = resultados.get(clave, 0)
+        print(f"Intentos {clave:<10} {n:>7} ({n * 100 / total:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
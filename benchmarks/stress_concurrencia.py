@@ -0,0 +1,113 @@
+"""stress_concurrencia.py
+Prueba de estrés de concurrencia optimista sobre Empeno: varios hilos renuevan el
+mismo empeño a la vez y luego compiten por pagarlo. Verifica que no se pierdan
+actualizaciones (valor, renovaciones, logs y versión consistentes) y que el pago
+se registre una sola vez.
+
+Uso:
+    python benchmarks/stress_concurrencia.py [--hilos 8] [--renovaciones 25]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _en_paralelo(hilos, funcion):
+    barrera = threading.Barrier(hilos)
+    resultados = Counter()
+    lock = threading.Lock()
+
+    def _trabajo(i):
+        barrera.wait()
+        for resultado in funcion(i):
+            with lock:
+                resultados[resultado] += 1
+    trabajadores = [threading.Thread(target=_trabajo, args=(i,)) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--renovaciones', type=int, default=25, help='renovaciones por hilo')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.chdir(directorio)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    os.environ['LOGIN_RAFAGA'] = str(args.hilos * 2)  # todos los clientes inician sesión desde 127.0.0.1
+    sys.path.insert(0, RAIZ)
+    import logging
+    import app_empenos_web as m
+    logging.getLogger(m.__name__).setLevel(logging.WARNING)
+
+    with m.app.app_context():
+        usuario = m.User(nombre='Stress', dni='20000000')
+        m.db.session.add(usuario)
+        m.db.session.flush()
+        empeno = m.Empeno(user_id=usuario.id, tipo='Joya', descripcion='stress', valor_estimado=100000,
+                          valor_inicial=100000, created_at=m.datetime.now(m.timezone.utc).isoformat(),
+                          term_days=30, renovaciones=0, estado='activo', interes_acumulado=0.0)
+        m.db.session.add(empeno)
+        m.db.session.commit()
+        emp_id = empeno.id
+
+    clientes = [m.app.test_client() for _ in range(args.hilos)]
+    for c in clientes:
+        c.post('/admin_login', data={'admin_user': 'admin', 'admin_pass': 'admin'})
+
+    def _resultado(c):
+        with c.session_transaction() as s:
+            categorias = [categoria for categoria, _ in s.pop('_flashes', [])]
+        return categorias[-1] if categorias else 'sin_mensaje'
+
+    def _renovar(i):
+        for _ in range(args.renovaciones):
+            clientes[i].post('/renovar_empeno', data={'id': emp_id})
+            yield _resultado(clientes[i])
+
+    def _pagar(i):
+        clientes[i].post('/marcar_pagado', data={'id': emp_id})
+        yield _resultado(clientes[i])
+
+    t0 = time.perf_counter()
+    renovaciones = _en_paralelo(args.hilos, _renovar)
+    duracion = time.perf_counter() - t0
+    pagos = _en_paralelo(args.hilos, _pagar)
+
+    with m.app.app_context():
+        e = m.db.session.get(m.Empeno, emp_id)
+        logs = m.RenovationLog.query.filter_by(empeno_id=emp_id).count()
+        pagos_log = m.PaidLog.query.filter_by(empeno_id=emp_id).count()
+        esperado = 100000
+        for _ in range(e.renovaciones):
+            esperado = int(esperado * (1 + m.INTERES_RENOVACION))
+
+    total = args.hilos * args.renovaciones
+    # 'error' = conflicto que agotó los reintentos (REINTENTOS_CONCURRENCIA) y se informó al usuario
+    print(f"Renovaciones: {total} pedidas en {duracion:.1f}s -> {dict(renovaciones)}")
+    print(f"  empeño.renovaciones={e.renovaciones}  RenovationLog={logs}  version={e.version}")
+    print(f"Pagos concurrentes: {dict(pagos)} -> PaidLog={pagos_log}, estado={e.estado}")
+    controles = {
+        'cada renovación exitosa quedó aplicada': renovaciones['success'] == e.renovaciones == logs,
+        'valor = cadena de renovaciones': e.valor_estimado == esperado,
+        'versión = 1 + renovaciones + pago': e.version == 1 + e.renovaciones + 1,
+        'un solo pago registrado': pagos['success'] == 1 and pagos_log == 1,
+    }
+    for nombre, ok in controles.items():
+        print(f"  [{'OK' if ok else 'FALLA'}] {nombre}")
+    sys.exit(0 if all(controles.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""catalogo.py
+Catálogo de precios de referencia (tipo / marca / modelo) con autocompletado.
+Los textos se normalizan (minúsculas, sin acentos ni signos) para que "Electrónico",
+" electronico" y "ELECTRÓNICO" no fragmenten las estadísticas ni el catálogo.
+El autocompletado usa un trie en memoria: cada nodo guarda solo los mejores
+`por_nodo` artículos (más aceptados primero), así que una sugerencia cuesta
+recorrer el prefijo y no depende del tamaño del catálogo. Las ramas poco pobladas
+quedan como cubetas de hasta `limite_cubeta` textos que se filtran al consultar y
+se dividen en hijos al llenarse (burst trie): la memoria crece con el catálogo y
+no con el largo de los nombres.
+"""
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+SUGERENCIAS_POR_NODO = 10
+LIMITE_CUBETA = 64
+
+# Alta o actualización por clave normalizada; cada fila recibe una revisión mayor que todas las
+# anteriores, que es lo que permite sincronizar el trie leyendo solo lo cambiado
+SQL_GUARDAR = (
+    'INSERT INTO catalogo_articulo (clave, tipo, marca, modelo, valor_referencia, aceptados, suma_aceptado, '
+    'revision, updated_at) VALUES (?, ?, ?, ?, ?, 0, 0.0, '
+    '(SELECT COALESCE(MAX(revision), 0) + 1 FROM catalogo_articulo), ?) '
+    'ON CONFLICT (clave) DO UPDATE SET tipo = excluded.tipo, marca = excluded.marca, modelo = excluded.modelo, '
+    'valor_referencia = excluded.valor_referencia, revision = excluded.revision, updated_at = excluded.updated_at'
+)
+
+Articulo = namedtuple('Articulo', [
+    'id', 'tipo', 'marca', 'modelo', 'clave', 'valor_referencia', 'aceptados', 'valor_aceptado_promedio', 'revision',
+])
+
+
+def normalizar(texto):
+    """'  Celular  Samsung-Galaxy ' -> 'celular samsung galaxy'"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', texto))
+
+
+def clave(tipo, marca='', modelo=''):
+    """Clave única normalizada 'tipo|marca|modelo'; el prefijo 'tipo|' agrupa una categoría"""
+    return '|'.join(normalizar(parte) for parte in (tipo, marca, modelo))
+
+
+def _sufijos(articulo):
+    """Textos indexados: el nombre completo y cada sufijo que empieza en una palabra,
+    para que 'galaxy' encuentre 'celular samsung galaxy s21'"""
+    palabras = normalizar(f'{articulo.tipo} {articulo.marca} {articulo.modelo}').split()
+    return [' '.join(palabras[i:]) for i in range(len(palabras))]
+
+
+class _Nodo:
+    __slots__ = ('hijos', 'ids', 'cubeta')
+
+    def __init__(self):
+        self.hijos = {}
+        self.ids = []  # Los mejores `por_nodo` artículos bajo este prefijo
+        self.cubeta = set()  # (texto, id) hasta que el nodo se divide; después None
+
+
+class Catalogo:
+    """Índice de prefijos del catálogo, actualizable de a un artículo"""
+
+    def __init__(self, por_nodo=SUGERENCIAS_POR_NODO, limite_cubeta=LIMITE_CUBETA):
+        self.por_nodo = por_nodo
+        self.limite_cubeta = limite_cubeta
+        self.revision = 0  # Mayor revisión de la base ya incorporada
+        self._raiz = _Nodo()
+        self._articulos = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._articulos)
+
+    def obtener(self, articulo_id):
+        return self._articulos.get(articulo_id)
+
+    def _orden(self, articulo_id):
+        articulo = self._articulos[articulo_id]
+        return (-articulo.aceptados, articulo.clave)
+
+    def _dividir(self, nodo, profundidad, tocados):
+        """Repartir la cubeta llena entre hijos por el siguiente carácter"""
+        cubeta, nodo.cubeta = nodo.cubeta, None
+        for texto, articulo_id in cubeta:
+            if len(texto) > profundidad:
+                hijo = nodo.hijos.setdefault(texto[profundidad], _Nodo())
+                hijo.ids.append(articulo_id)
+                hijo.cubeta.add((texto, articulo_id))
+                tocados[id(hijo)] = hijo
+        for hijo in nodo.hijos.values():
+            if hijo.cubeta is not None and len(hijo.cubeta) > self.limite_cubeta:
+                self._dividir(hijo, profundidad + 1, tocados)
+
+    def _insertar(self, texto, articulo_id, tocados):
+        nodo, profundidad = self._raiz, 0
+        while True:
+            nodo.ids.append(articulo_id)
+            tocados[id(nodo)] = nodo
+            if nodo.cubeta is not None:
+                nodo.cubeta.add((texto, articulo_id))
+                if len(nodo.cubeta) > self.limite_cubeta:
+                    self._dividir(nodo, profundidad, tocados)
+                return
+            if profundidad == len(texto):
+                return
+            hijo = nodo.hijos.get(texto[profundidad])
+            if hijo is None:
+                hijo = nodo.hijos[texto[profundidad]] = _Nodo()
+            nodo = hijo
+            profundidad += 1
+
+    def actualizar(self, articulos):
+        """Incorporar artículos nuevos o modificados (p. ej. filas con revisión mayor a `self.revision`).
+
+        Cada nodo tocado se reordena una sola vez por llamada, así que cargar todo el
+        catálogo de una vez no reordena los nodos por cada artículo.
+        """
+        with self._lock:
+            tocados = {}
+            for articulo in articulos:
+                self._articulos[articulo.id] = articulo
+                self.revision = max(self.revision, articulo.revision or 0)
+                for texto in _sufijos(articulo):
+                    self._insertar(texto, articulo.id, tocados)
+            for nodo in tocados.values():
+                nodo.ids = sorted(dict.fromkeys(nodo.ids), key=self._orden)[:self.por_nodo]
+
+    def sugerir(self, texto, k=SUGERENCIAS_POR_NODO):
+        """Hasta `k` artículos cuyo nombre (o una palabra del nombre en adelante) empieza con `texto`"""
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        with self._lock:
+            nodo = self._raiz
+            for caracter in prefijo:
+                if nodo.cubeta is not None:
+                    # Rama sin dividir: filtrar sus pocos textos
+                    ids = {i for texto_indexado, i in nodo.cubeta if texto_indexado.startswith(prefijo)}
+                    return [self._articulos[i] for i in sorted(ids, key=self._orden)[:k]]
+                nodo = nodo.hijos.get(caracter)
+                if nodo is None:
+                    return []
+            return [self._articulos[i] for i in nodo.ids[:k]]
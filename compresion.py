@@ -0,0 +1,59 @@
+"""compresion.py
+Compresión de respuestas HTTP con gzip (siempre disponible) o brotli (si está
+instalado el paquete `brotli`). Las respuestas completas se comprimen de una vez;
+las generadas en streaming se comprimen bloque a bloque con flush, para que el
+navegador siga recibiendo el HTML a medida que se produce.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+# Tipos de contenido que vale la pena comprimir (imágenes, xlsx, etc. ya vienen comprimidos)
+TIPOS_COMPRIMIBLES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+
+def codificaciones_disponibles():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def elegir_codificacion(accept_encodings):
+    """Mejor codificación aceptada por el cliente (werkzeug `request.accept_encodings`) o None"""
+    return accept_encodings.best_match(codificaciones_disponibles())
+
+
+def comprimir(datos, codificacion, nivel=6):
+    """Comprimir un cuerpo completo"""
+    if codificacion == 'br':
+        # Calidad de brotli (0-11) proporcional al nivel de gzip (1-9)
+        return brotli.compress(datos, quality=min(11, nivel))
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    return compresor.compress(datos) + compresor.flush()
+
+
+def comprimir_flujo(bloques, codificacion, nivel=6):
+    """Comprimir un cuerpo en streaming, con un flush por bloque recibido"""
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=min(11, nivel))
+        procesar, vaciar, terminar = compresor.process, compresor.flush, compresor.finish
+    else:
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+        procesar, terminar = compresor.compress, compresor.flush
+        vaciar = lambda: compresor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+    try:
+        for bloque in bloques:
+            if isinstance(bloque, str):
+                bloque = bloque.encode('utf-8')
+            salida = procesar(bloque) + vaciar()
+            if salida:
+                yield salida
+        yield terminar()
+    finally:
+        cerrar = getattr(bloques, 'close', None)
+        if cerrar is not None:
+            cerrar()
@@ -0,0 +1,189 @@
+"""cotizador.py
+Backends de cotización para el modelo IA.
+- 'bosque': RandomForestRegressor de scikit-learn (comportamiento original).
+- 'compilado': los árboles del bosque exportados a arrays planos de NumPy y
+  evaluados con un recorrido vectorizado (no necesita sklearn para cargar).
+- 'lineal': regresión lineal por mínimos cuadrados sobre las dos variables.
+Se elige con la variable de entorno COTIZADOR_BACKEND.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Dataset inline de entrenamiento (valor_referencia, estado) -> valor_empeno
+DATOS_ENTRENAMIENTO = {
+    'valor_referencia': [150000, 300000, 80000, 180000, 250000],
+    'estado': [0.8, 1.0, 0.5, 0.7, 0.9],
+    'valor_empeno': [90000, 210000, 40000, 95000, 150000],
+}
+
+BACKEND_POR_DEFECTO = 'bosque'
+
+# Parámetros del bosque que entrena entrenar_bosque() (parte de la huella del .npz)
+PARAMETROS_BOSQUE = {'random_state': 0}
+
+
+def _matriz_entrenamiento():
+    X = np.column_stack([
+        np.asarray(DATOS_ENTRENAMIENTO['valor_referencia'], dtype=np.float64),
+        np.asarray(DATOS_ENTRENAMIENTO['estado'], dtype=np.float64),
+    ])
+    y = np.asarray(DATOS_ENTRENAMIENTO['valor_empeno'], dtype=np.float64)
+    return X, y
+
+
+def huella_entrenamiento():
+    """Hash de los datos de entrenamiento y los parámetros del bosque: identifica el .npz"""
+    contenido = json.dumps({'datos': DATOS_ENTRENAMIENTO, 'parametros': PARAMETROS_BOSQUE}, sort_keys=True)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def entrenar_bosque():
+    """Entrenar el RandomForestRegressor original (import diferido de sklearn)"""
+    from sklearn.ensemble import RandomForestRegressor
+    X, y = _matriz_entrenamiento()
+    modelo = RandomForestRegressor(**PARAMETROS_BOSQUE)
+    modelo.fit(X, y)
+    return modelo
+
+
+class BackendBosque:
+    """Backend original: RandomForestRegressor de scikit-learn"""
+    nombre = 'bosque'
+
+    def __init__(self, modelo=None):
+        self.modelo = modelo if modelo is not None else entrenar_bosque()
+
+    def predecir(self, valor_ref, estado):
+        return float(self.modelo.predict(np.array([[valor_ref, estado]], dtype=np.float64))[0])
+
+    def predecir_lote(self, X):
+        return self.modelo.predict(np.asarray(X, dtype=np.float64))
+
+
+class BackendArbolesCompilados:
+    """Bosque exportado a arrays planos y evaluado sin sklearn.
+
+    Todos los árboles se concatenan en un único juego de arrays (hijo izq/der,
+    variable, umbral, valor); `raices` guarda el nodo inicial de cada árbol.
+    Las hojas apuntan a sí mismas, así que el recorrido es un bucle de
+    `profundidad` pasos sobre una matriz (muestras x árboles) de índices.
+    """
+    nombre = 'compilado'
+
+    def __init__(self, izquierdo, derecho, variable, umbral, valor, raices, profundidad, huella=None):
+        self.huella = huella  # huella_entrenamiento() del bosque exportado
+        self.izquierdo = izquierdo
+        self.derecho = derecho
+        self.variable = variable
+        self.umbral = umbral
+        self.valor = valor
+        self.raices = raices
+        self.profundidad = int(profundidad)
+
+    @classmethod
+    def desde_bosque(cls, modelo, huella=None):
+        izq, der, var, umb, val, raices = [], [], [], [], [], []
+        offset = 0
+        profundidad = 0
+        for estimador in modelo.estimators_:
+            arbol = estimador.tree_
+            n = arbol.node_count
+            hoja = arbol.children_left < 0
+            idx = np.arange(n, dtype=np.int32) + offset
+            izq.append(np.where(hoja, idx, arbol.children_left + offset).astype(np.int32))
+            der.append(np.where(hoja, idx, arbol.children_right + offset).astype(np.int32))
+            # En las hojas la variable es 0 para poder indexar sin ramas
+            var.append(np.where(hoja, 0, arbol.feature).astype(np.int32))
+            umb.append(arbol.threshold.astype(np.float64))
+            val.append(arbol.value[:, 0, 0].astype(np.float64))
+            raices.append(offset)
+            offset += n
+            profundidad = max(profundidad, arbol.max_depth)
+        return cls(
+            np.concatenate(izq), np.concatenate(der), np.concatenate(var),
+            np.concatenate(umb), np.concatenate(val),
+            np.asarray(raices, dtype=np.int32), profundidad, huella,
+        )
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as z:
+            huella = str(z['huella']) if 'huella' in z.files else None
+            return cls(z['izquierdo'], z['derecho'], z['variable'], z['umbral'],
+                       z['valor'], z['raices'], int(z['profundidad']), huella)
+
+    def guardar(self, ruta):
+        np.savez(ruta, izquierdo=self.izquierdo, derecho=self.derecho, variable=self.variable,
+                 umbral=self.umbral, valor=self.valor, raices=self.raices,
+                 profundidad=np.int32(self.profundidad), huella=np.str_(self.huella or ''))
+
+    def predecir_lote(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        filas = np.arange(X.shape[0])[:, None]
+        nodos = np.broadcast_to(self.raices, (X.shape[0], self.raices.shape[0])).copy()
+        for _ in range(self.profundidad):
+            ir_izq = X[filas, self.variable[nodos]] <= self.umbral[nodos]
+            nodos = np.where(ir_izq, self.izquierdo[nodos], self.derecho[nodos])
+        return self.valor[nodos].mean(axis=1)
+
+    def predecir(self, valor_ref, estado):
+        x = np.array([valor_ref, estado], dtype=np.float64)
+        nodos = self.raices
+        for _ in range(self.profundidad):
+            ir_izq = x[self.variable[nodos]] <= self.umbral[nodos]
+            nodos = np.where(ir_izq, self.izquierdo[nodos], self.derecho[nodos])
+        return float(self.valor[nodos].mean())
+
+
+class BackendLineal:
+    """Regresión lineal: valor = b0 + b1*valor_ref + b2*estado + b3*valor_ref*estado"""
+    nombre = 'lineal'
+
+    def __init__(self, coeficientes=None):
+        if coeficientes is None:
+            X, y = _matriz_entrenamiento()
+            coeficientes, *_ = np.linalg.lstsq(self._diseno(X), y, rcond=None)
+        self.b0, self.b1, self.b2, self.b3 = (float(c) for c in coeficientes)
+
+    @staticmethod
+    def _diseno(X):
+        return np.column_stack([np.ones(len(X)), X[:, 0], X[:, 1], X[:, 0] * X[:, 1]])
+
+    def predecir(self, valor_ref, estado):
+        return self.b0 + self.b1 * valor_ref + self.b2 * estado + self.b3 * valor_ref * estado
+
+    def predecir_lote(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return self._diseno(X) @ np.array([self.b0, self.b1, self.b2, self.b3])
+
+
+def crear_backend(nombre=None, ruta_compilado=None):
+    """Crear el backend de cotización configurado.
+
+    Para 'compilado' se reutiliza `ruta_compilado` (.npz) si existe y su huella
+    coincide con los datos y parámetros actuales; si no (o si el archivo no se puede
+    leer), se entrena el bosque, se exporta y se guarda para los próximos arranques.
+    """
+    nombre = (nombre or BACKEND_POR_DEFECTO).strip().lower()
+    if nombre == 'bosque':
+        return BackendBosque()
+    if nombre == 'compilado':
+        huella = huella_entrenamiento()
+        if ruta_compilado and os.path.exists(ruta_compilado):
+            try:
+                backend = BackendArbolesCompilados.cargar(ruta_compilado)
+            except (OSError, ValueError, KeyError):
+                backend = None
+            if backend is not None and backend.huella == huella:
+                return backend
+        backend = BackendArbolesCompilados.desde_bosque(entrenar_bosque(), huella)
+        if ruta_compilado:
+            os.makedirs(os.path.dirname(ruta_compilado) or '.', exist_ok=True)
+            backend.guardar(ruta_compilado)
+        return backend
+    if nombre == 'lineal':
+        return BackendLineal()
+    raise ValueError(f"Backend de cotización desconocido: {nombre}")
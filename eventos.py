@@ -0,0 +1,135 @@
+"""eventos.py
+Publicador de Server-Sent Events para el panel admin en vivo.
+Las rutas de escritura llaman a `notificar()` (barato, no bloquea); un único hilo
+publicador agrupa los cambios pendientes, recalcula el estado una sola vez y envía
+a todos los suscriptores solo las claves que cambiaron, más los eventos de
+actividad (empeños y citas nuevas). Con N paneles abiertos el costo es un cálculo
+por ráfaga de cambios, no N consultas por intervalo de sondeo.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def formatear_sse(evento, datos, id_evento=None):
+    """Mensaje en formato text/event-stream"""
+    cabecera = f'id: {id_evento}\n' if id_evento is not None else ''
+    return f'{cabecera}event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n'
+
+
+class ColaAsync(queue.Queue):
+    """Cola de suscriptor para un event loop de asyncio: el hilo publicador deposita como
+    en cualquier cola y avisa al loop; el consumidor espera con `await esperar()` sin
+    ocupar un hilo por cliente"""
+
+    def __init__(self, loop, maxsize=0):
+        super().__init__(maxsize)
+        self._loop = loop
+        self._hay = asyncio.Event()
+
+    def _put(self, item):
+        super()._put(item)
+        try:
+            self._loop.call_soon_threadsafe(self._hay.set)
+        except RuntimeError:
+            pass  # Loop cerrado: el servidor se está apagando
+
+    async def esperar(self, timeout):
+        """Próximo mensaje; TimeoutError si no llega ninguno en `timeout` segundos"""
+        while True:
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                pass
+            self._hay.clear()
+            if self.empty():
+                await asyncio.wait_for(self._hay.wait(), timeout)
+
+
+class Publicador:
+    """Difunde el estado calculado por `calcular_estado()` y la actividad a colas de suscriptores"""
+
+    def __init__(self, calcular_estado, max_cola=100):
+        self.calcular_estado = calcular_estado
+        self.max_cola = max_cola
+        self._suscriptores = set()
+        self._pendientes = queue.Queue()
+        self._lock = threading.RLock()
+        self._estado = None  # None = desconocido (sin suscriptores no se mantiene al día)
+        self._secuencia = 0
+        self._hilo = None
+
+    def _asegurar_hilo(self):
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._bucle, name='publicador-sse', daemon=True)
+                    self._hilo.start()
+
+    def notificar(self, evento=None, **datos):
+        """Registrar un cambio; `evento` ('empeno', 'cita', ...) se reenvía como actividad"""
+        if not self._suscriptores:
+            self._estado = None
+            return
+        self._asegurar_hilo()
+        self._pendientes.put((evento, datos))
+
+    def suscribir(self, crear_cola=queue.Queue):
+        """Nueva cola de suscriptor y el mensaje inicial con el estado completo.
+
+        `crear_cola(maxsize=...)` permite otra cola compatible con queue.Queue (p. ej. ColaAsync).
+        """
+        self._asegurar_hilo()
+        with self._lock:
+            if self._estado is None:
+                self._estado = self.calcular_estado()
+            cola = crear_cola(maxsize=self.max_cola)
+            self._suscriptores.add(cola)
+            self._secuencia += 1
+            return cola, formatear_sse('stats', self._estado, self._secuencia)
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores.discard(cola)
+
+    def _difundir(self, mensaje):
+        for cola in list(self._suscriptores):
+            try:
+                cola.put_nowait(mensaje)
+            except queue.Full:
+                # Cliente lento: se lo desconecta (EventSource reconecta y recibe el estado completo)
+                self.desuscribir(cola)
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait(None)
+
+    def _bucle(self):
+        while True:
+            actividad = [self._pendientes.get()]
+            # Agrupar la ráfaga de cambios que llegó mientras tanto en un solo cálculo
+            while True:
+                try:
+                    actividad.append(self._pendientes.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._suscriptores:
+                continue
+            try:
+                estado = self.calcular_estado()
+            except Exception as e:
+                logger.error(f"Error calculando el estado del panel en vivo: {e}")
+                continue
+            with self._lock:
+                anterior, self._estado = self._estado or {}, estado
+                for evento, datos in actividad:
+                    if evento:
+                        self._secuencia += 1
+                        self._difundir(formatear_sse(evento, datos, self._secuencia))
+                cambios = {k: v for k, v in estado.items() if anterior.get(k) != v}
+                if cambios:
+                    self._secuencia += 1
+                    self._difundir(formatear_sse('stats', cambios, self._secuencia))
@@ -0,0 +1,227 @@
+"""importador.py
+Importación masiva de libros de empeños heredados (usuarios y empeños) y del
+catálogo de precios de referencia desde CSV.
+Lee el archivo por lotes con pandas, valida cada lote de forma vectorizada con
+las mismas expresiones regulares que validar_dni/validar_email/validar_telefono,
+descarta DNIs duplicados e inserta con executemany, una transacción por lote.
+Las filas rechazadas se escriben en un CSV aparte con la línea y el motivo.
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import catalogo
+
+COLUMNAS_USUARIOS = ('nombre', 'dni', 'email', 'telefono')
+COLUMNAS_EMPENOS = ('dni', 'tipo', 'descripcion', 'valor_estimado', 'valor_inicial',
+                    'created_at', 'term_days', 'renovaciones', 'estado', 'pagado_at')
+COLUMNAS_CATALOGO = ('tipo', 'marca', 'modelo', 'valor_referencia')
+REQUERIDAS_USUARIOS = ('nombre', 'dni')
+REQUERIDAS_EMPENOS = ('dni', 'tipo', 'valor_estimado')
+REQUERIDAS_CATALOGO = ('tipo', 'valor_referencia')
+ESTADOS_VALIDOS = ('activo', 'pagado', 'vencido')
+TAMANO_LOTE = 50000
+
+
+def _leer_lotes(ruta, columnas, requeridas, tamano_lote):
+    """Leer el CSV por lotes como texto, normalizando encabezados y espacios"""
+    linea = 2  # La línea 1 es el encabezado
+    lector = pd.read_csv(ruta, dtype=str, keep_default_na=False, chunksize=tamano_lote,
+                         encoding='utf-8-sig')
+    for lote in lector:
+        lote.columns = [str(c).strip().lower() for c in lote.columns]
+        faltantes = [c for c in requeridas if c not in lote.columns]
+        if faltantes:
+            raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+        for columna in columnas:
+            lote[columna] = lote[columna].str.strip() if columna in lote.columns else ''
+        lote = lote[list(columnas)].copy()
+        lote.insert(0, 'linea', range(linea, linea + len(lote)))
+        linea += len(lote)
+        yield lote
+
+
+def _marcar(motivo, mascara, texto):
+    """Registrar el primer motivo de rechazo de cada fila"""
+    return motivo.mask(mascara & (motivo == ''), texto)
+
+
+class _Rechazos:
+    """Acumula las filas rechazadas en un CSV (se crea solo si hay rechazos)"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.total = 0
+
+    def agregar(self, filas, motivo):
+        if filas.empty:
+            return
+        filas = filas.assign(motivo=motivo[filas.index])
+        filas.to_csv(self.ruta, mode='a', header=self.total == 0, index=False, encoding='utf-8')
+        self.total += len(filas)
+
+
+def _resultado(tipo, leidos, importados, rechazos, t0):
+    return {
+        'tipo': tipo,
+        'leidos': leidos,
+        'importados': importados,
+        'rechazados': rechazos.total,
+        'ruta_rechazados': rechazos.ruta if rechazos.total else None,
+        'segundos': time.perf_counter() - t0,
+    }
+
+
+def importar_usuarios(engine, ruta, patrones, sucursal, tamano_lote=TAMANO_LOTE, ruta_rechazados=None):
+    """Importar usuarios (nombre, dni, email, telefono); los DNIs ya existentes se rechazan"""
+    t0 = time.perf_counter()
+    rechazos = _Rechazos(ruta_rechazados or os.path.splitext(ruta)[0] + '_rechazados.csv')
+    with engine.connect() as conn:
+        vistos = {fila[0] for fila in conn.exec_driver_sql('SELECT dni FROM "user"')}
+    ahora = datetime.now(timezone.utc).isoformat()
+    leidos = importados = 0
+
+    for lote in _leer_lotes(ruta, COLUMNAS_USUARIOS, REQUERIDAS_USUARIOS, tamano_lote):
+        leidos += len(lote)
+        motivo = pd.Series('', index=lote.index)
+        motivo = _marcar(motivo, lote['nombre'] == '', 'nombre vacío')
+        motivo = _marcar(motivo, ~lote['dni'].str.match(patrones['dni']), 'DNI inválido')
+        motivo = _marcar(motivo, (lote['email'] != '') & ~lote['email'].str.match(patrones['email']), 'email inválido')
+        motivo = _marcar(motivo, (lote['telefono'] != '') & ~lote['telefono'].str.match(patrones['telefono']),
+                         'teléfono inválido')
+        motivo = _marcar(motivo, lote['dni'].isin(vistos) | lote['dni'].duplicated(), 'DNI duplicado')
+
+        validos = lote[motivo == '']
+        rechazos.agregar(lote[motivo != ''], motivo)
+        if validos.empty:
+            continue
+        filas = list(zip(
+            validos['nombre'].str.slice(0, 120), validos['dni'], validos['email'].str.slice(0, 120),
+            validos['telefono'].str.slice(0, 20), [ahora] * len(validos), [sucursal] * len(validos),
+        ))
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                'INSERT INTO "user" (nombre, dni, email, telefono, created_at, sucursal) '
+                'VALUES (?, ?, ?, ?, ?, ?)', filas)
+        vistos.update(validos['dni'])
+        importados += len(filas)
+
+    return _resultado('usuarios', leidos, importados, rechazos, t0)
+
+
+def _ultimo_id_empeno(conn):
+    """Mayor id de empeño asignado alguna vez: activo, archivado o según el contador
+    AUTOINCREMENT, para no reutilizar ids de empeños que ya pasaron al archivo"""
+    consultas = ['SELECT COALESCE(MAX(id), 0) FROM main.empeno',
+                 "SELECT COALESCE(MAX(seq), 0) FROM main.sqlite_sequence WHERE name = 'empeno'"]
+    if conn.exec_driver_sql("SELECT 1 FROM pragma_database_list WHERE name = 'archivo'").scalar() and \
+            conn.exec_driver_sql("SELECT 1 FROM archivo.sqlite_master WHERE name = 'empeno'").scalar():
+        consultas.append('SELECT COALESCE(MAX(id), 0) FROM archivo.empeno')
+    return max(conn.exec_driver_sql(consulta).scalar() or 0 for consulta in consultas)
+
+
+def importar_empenos(engine, ruta, sucursal, plazo_dias, tamano_lote=TAMANO_LOTE, ruta_rechazados=None):
+    """Importar empeños asociados por DNI a usuarios ya existentes.
+
+    Los empeños con estado 'pagado' generan además su fila en paid_log (fecha
+    `pagado_at`, o `created_at` si no viene) para que el resto de la app los
+    trate como liquidados.
+    """
+    t0 = time.perf_counter()
+    rechazos = _Rechazos(ruta_rechazados or os.path.splitext(ruta)[0] + '_rechazados.csv')
+    with engine.connect() as conn:
+        usuarios = dict(conn.exec_driver_sql('SELECT dni, id FROM "user"').all())
+    ahora = datetime.now(timezone.utc).isoformat()
+    leidos = importados = 0
+
+    for lote in _leer_lotes(ruta, COLUMNAS_EMPENOS, REQUERIDAS_EMPENOS, tamano_lote):
+        leidos += len(lote)
+        user_id = lote['dni'].map(usuarios)
+        valor = pd.to_numeric(lote['valor_estimado'], errors='coerce')
+        inicial = pd.to_numeric(lote['valor_inicial'].replace('', None), errors='coerce').fillna(valor)
+        renovaciones = pd.to_numeric(lote['renovaciones'].replace('', '0'), errors='coerce')
+        plazo = pd.to_numeric(lote['term_days'].replace('', str(plazo_dias)), errors='coerce')
+        estado = lote['estado'].str.lower().replace('', 'activo')
+        creado = pd.to_datetime(lote['created_at'].replace('', ahora), utc=True, errors='coerce', format='ISO8601')
+        pagado = pd.to_datetime(lote['pagado_at'].where(lote['pagado_at'] != '', lote['created_at']).replace('', ahora),
+                                utc=True, errors='coerce', format='ISO8601')
+
+        motivo = pd.Series('', index=lote.index)
+        motivo = _marcar(motivo, user_id.isna(), 'DNI sin usuario registrado')
+        motivo = _marcar(motivo, lote['tipo'] == '', 'tipo vacío')
+        motivo = _marcar(motivo, valor.isna() | (valor <= 0) | inicial.isna() | (inicial <= 0), 'valor inválido')
+        motivo = _marcar(motivo, renovaciones.isna() | (renovaciones < 0), 'renovaciones inválidas')
+        motivo = _marcar(motivo, plazo.isna() | (plazo <= 0), 'plazo inválido')
+        motivo = _marcar(motivo, ~estado.isin(ESTADOS_VALIDOS), 'estado inválido')
+        motivo = _marcar(motivo, creado.isna() | pagado.isna(), 'fecha inválida')
+
+        ok = motivo == ''
+        rechazos.agregar(lote[~ok], motivo)
+        if not ok.any():
+            continue
+        n = int(ok.sum())
+        user_ids = user_id[ok].astype('int64').tolist()
+        with engine.begin() as conn:
+            # La primera escritura toma el lock de SQLite: a partir de aquí MAX(id) es estable
+            conn.exec_driver_sql('DELETE FROM resumen_usuario WHERE user_id = ?', [(u,) for u in set(user_ids)])
+            primer_id = _ultimo_id_empeno(conn) + 1
+            ids = list(range(primer_id, primer_id + n))
+            conn.exec_driver_sql(
+                'INSERT INTO empeno (id, user_id, tipo, descripcion, valor_estimado, valor_inicial, created_at, '
+                'term_days, renovaciones, estado, interes_acumulado, sucursal) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                list(zip(
+                    ids, user_ids, lote['tipo'][ok].str.slice(0, 120), lote['descripcion'][ok].str.slice(0, 500),
+                    valor[ok].astype('int64').tolist(), inicial[ok].astype('int64').tolist(),
+                    creado[ok].map(lambda d: d.isoformat()), plazo[ok].astype('int64').tolist(),
+                    renovaciones[ok].astype('int64').tolist(), estado[ok], [0.0] * n, [sucursal] * n,
+                )))
+            es_pagado = (estado[ok] == 'pagado').tolist()
+            pagos = [(i, p.isoformat(), v) for i, p, v, pag in zip(
+                ids, pagado[ok], valor[ok].astype('int64').tolist(), es_pagado) if pag]
+            if pagos:  # executemany con una lista vacía falla en sqlite3
+                conn.exec_driver_sql(
+                    'INSERT INTO paid_log (empeno_id, by_admin, time, monto_pagado, interes_pagado) '
+                    'VALUES (?, 1, ?, ?, 0.0)', pagos)
+        importados += n
+
+    return _resultado('empenos', leidos, importados, rechazos, t0)
+
+
+def importar_catalogo(engine, ruta, tamano_lote=TAMANO_LOTE, ruta_rechazados=None):
+    """Importar artículos del catálogo (tipo, marca, modelo, valor_referencia).
+
+    Un artículo cuya clave normalizada ya existe actualiza su valor de referencia
+    y conserva el historial de empeños aceptados.
+    """
+    t0 = time.perf_counter()
+    rechazos = _Rechazos(ruta_rechazados or os.path.splitext(ruta)[0] + '_rechazados.csv')
+    ahora = datetime.now(timezone.utc).isoformat()
+    leidos = importados = 0
+
+    for lote in _leer_lotes(ruta, COLUMNAS_CATALOGO, REQUERIDAS_CATALOGO, tamano_lote):
+        leidos += len(lote)
+        valor = pd.to_numeric(lote['valor_referencia'], errors='coerce')
+        claves = [catalogo.clave(*fila) for fila in zip(lote['tipo'], lote['marca'], lote['modelo'])]
+        clave = pd.Series(claves, index=lote.index)
+
+        motivo = pd.Series('', index=lote.index)
+        motivo = _marcar(motivo, clave.str.startswith('|'), 'tipo vacío')
+        motivo = _marcar(motivo, valor.isna() | (valor <= 0), 'valor inválido')
+
+        ok = motivo == ''
+        rechazos.agregar(lote[~ok], motivo)
+        # Si una clave se repite en el archivo vale la última aparición
+        ok &= ~clave.duplicated(keep='last')
+        if not ok.any():
+            continue
+        with engine.begin() as conn:
+            conn.exec_driver_sql(catalogo.SQL_GUARDAR, list(zip(
+                clave[ok], lote['tipo'][ok].str.slice(0, 120), lote['marca'][ok].str.slice(0, 120),
+                lote['modelo'][ok].str.slice(0, 120), valor[ok].astype(float).tolist(), [ahora] * int(ok.sum()),
+            )))
+        importados += int(ok.sum())
+
+    return _resultado('catalogo', leidos, importados, rechazos, t0)
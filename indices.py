@@ -0,0 +1,158 @@
+"""indices.py
+Series diarias de índices (inflación, tasas de interés) cargadas de archivos CSV
+locales y consultadas en memoria. Cada serie es escalonada: un valor rige desde
+su fecha hasta la publicación siguiente (antes de la primera fecha rige el primer
+valor y después de la última, el último). Las fechas quedan en un arreglo NumPy
+ordenado, así que consultar el valor de cualquier día, de uno o de un millón, es
+una búsqueda binaria (np.searchsorted) sin pasar por la base.
+
+Para las tasas diarias se precalculan las sumas acumuladas de los cambios de tasa:
+el interés simple entre dos fechas sale de dos búsquedas, igual de barato que leer
+un valor, aunque la tasa haya cambiado cien veces en el medio.
+
+Las fechas se expresan en días desde 1970-01-01 (con fracción). Formato de los
+archivos (<directorio>/<serie>.csv, p. ej. ipc.csv), encabezado opcional:
+    fecha,valor
+    2024-01-01,1.0
+"""
+import bisect
+import csv
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class Serie:
+    """Serie escalonada de valores diarios, ordenada por fecha"""
+
+    def __init__(self, nombre, dias, valores):
+        dias = np.asarray(dias, dtype=np.float64)
+        valores = np.asarray(valores, dtype=np.float64)
+        if not len(dias) or len(dias) != len(valores):
+            raise ValueError(f'Serie {nombre}: hacen falta fechas y valores de igual largo')
+        orden = np.argsort(dias, kind='stable')  # Con fechas repetidas rige la última fila
+        self.nombre = nombre
+        self.dias = dias[orden]
+        self.valores = valores[orden]
+        # Sumas acumuladas de los cambios de valor (y de cambio × fecha) en cada fecha: la suma
+        # entre dos días es valor(desde) × días + Σ cambio × (hasta - fecha del cambio), sin restar
+        # dos integrales grandes que perderían precisión (y exacta con una sola tasa)
+        cambios = np.concatenate(([0.0], np.diff(self.valores)))
+        self._cambios = np.cumsum(cambios)
+        self._cambios_fecha = np.cumsum(cambios * self.dias)
+        # Copias en listas para las consultas de un solo día (bisect, sin el costo fijo de NumPy)
+        self._listas = (self.dias.tolist(), self.valores.tolist(), self._cambios.tolist(), self._cambios_fecha.tolist())
+
+    @classmethod
+    def constante(cls, nombre, valor):
+        return cls(nombre, [0.0], [valor])
+
+    def __len__(self):
+        return len(self.dias)
+
+    def _tramo(self, dias):
+        return np.maximum(np.searchsorted(self.dias, dias, side='right') - 1, 0)
+
+    def valor(self, dias):
+        """Valor vigente en `dias` (escalar o arreglo de días desde epoch)"""
+        if isinstance(dias, (int, float)):
+            fechas, valores = self._listas[:2]
+            return valores[max(bisect.bisect_right(fechas, dias) - 1, 0)]
+        return self.valores[self._tramo(dias)]
+
+    def acumulado(self, desde, hasta):
+        """Suma de la tasa diaria entre dos fechas (hasta >= desde): el interés simple por
+        unidad de capital"""
+        if isinstance(desde, (int, float)) and isinstance(hasta, (int, float)):
+            fechas, valores, cambios, cambios_fecha = self._listas
+            inicio = max(bisect.bisect_right(fechas, desde) - 1, 0)
+            fin = max(bisect.bisect_right(fechas, hasta) - 1, 0)
+        else:
+            valores, cambios, cambios_fecha = self.valores, self._cambios, self._cambios_fecha
+            inicio, fin = self._tramo(desde), self._tramo(hasta)
+        return (valores[inicio] * (hasta - desde) + hasta * (cambios[fin] - cambios[inicio])
+                - (cambios_fecha[fin] - cambios_fecha[inicio]))
+
+    def factor(self, desde, hasta):
+        """Cuánto cambió el índice entre dos fechas: valor(hasta) / valor(desde)"""
+        return self.valor(hasta) / self.valor(desde)
+
+
+def cargar_serie(ruta, nombre=None):
+    """Serie desde un CSV fecha,valor; ValueError con el archivo y la línea si algo no se entiende"""
+    nombre = nombre or os.path.splitext(os.path.basename(ruta))[0]
+    dias, valores = [], []
+    with open(ruta, newline='', encoding='utf-8-sig') as f:
+        for numero, fila in enumerate(csv.reader(f), 1):
+            if not fila or not fila[0].strip() or fila[0].lstrip().startswith('#'):
+                continue
+            try:
+                fecha, valor = date.fromisoformat(fila[0].strip()[:10]), float(fila[1])
+            except (ValueError, IndexError):
+                if numero == 1:
+                    continue  # Encabezado
+                raise ValueError(f'{ruta}, línea {numero}: se esperaba fecha ISO y valor')
+            dias.append(fecha.toordinal() - _EPOCH_ORDINAL)
+            valores.append(valor)
+    return Serie(nombre, dias, valores)
+
+
+class Indices:
+    """Series del directorio en memoria, con valores por defecto para las que no tienen archivo.
+
+    Los archivos se revisan (mtime y tamaño) a lo sumo cada `revision` segundos y
+    se recargan cuando cambian; si un archivo nuevo tiene errores se sigue usando
+    la versión anterior. Las consultas no toman locks: leen el dict vigente.
+    """
+
+    def __init__(self, directorio, por_defecto, revision=60.0, al_cargar=None):
+        self.directorio = directorio
+        self.revision = revision
+        self.al_cargar = al_cargar  # Callback(nombres, error) para registrar cada recarga
+        self._por_defecto = {nombre: Serie.constante(nombre, valor) for nombre, valor in por_defecto.items()}
+        self._series = {}
+        self._firma = None
+        self._proxima_revision = 0.0
+        self._lock = threading.Lock()
+
+    def _firma_directorio(self):
+        try:
+            archivos = sorted(n for n in os.listdir(self.directorio) if n.endswith('.csv'))
+        except OSError:
+            return ()
+        firma = []
+        for archivo in archivos:
+            estado = os.stat(os.path.join(self.directorio, archivo))
+            firma.append((archivo, estado.st_mtime_ns, estado.st_size))
+        return tuple(firma)
+
+    def recargar(self, forzar=False):
+        """Releer el directorio si cambió desde la última carga"""
+        with self._lock:
+            self._proxima_revision = time.monotonic() + self.revision
+            firma = self._firma_directorio()
+            if firma == self._firma and not forzar:
+                return
+            series, error = dict(self._series), None
+            for archivo, _, _ in firma:
+                try:
+                    serie = cargar_serie(os.path.join(self.directorio, archivo))
+                    series[serie.nombre] = serie
+                except (OSError, ValueError) as e:
+                    error = e
+            for nombre in set(series) - {os.path.splitext(archivo)[0] for archivo, _, _ in firma}:
+                del series[nombre]  # Archivo borrado: vuelve el valor por defecto
+            self._series, self._firma = series, firma
+        if self.al_cargar:
+            self.al_cargar(sorted(series), error)
+
+    def serie(self, nombre):
+        if time.monotonic() >= self._proxima_revision:
+            self.recargar()
+        serie = self._series.get(nombre)
+        return serie if serie is not None else self._por_defecto[nombre]
@@ -0,0 +1,161 @@
+"""mantenimiento.py
+Mantenimiento de las bases SQLite con la app en marcha:
+- Respaldo en línea con la API de backup de SQLite, copiando de a `paginas` páginas
+  con una pausa entre pasos para que los escritores no queden bloqueados.
+- Vacío incremental (auto_vacuum=INCREMENTAL) para devolver al disco las páginas
+  libres que dejan los borrados y el archivado.
+- ANALYZE / PRAGMA optimize para mantener las estadísticas del planificador.
+Cada operación se registra en un informe JSONL con su duración y el tamaño de la base.
+"""
+import glob
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _tamano(ruta):
+    return os.path.getsize(ruta) if os.path.exists(ruta) else 0
+
+
+def _conectar(ruta):
+    # isolation_level=None: los PRAGMA y VACUUM se ejecutan fuera de transacción
+    conn = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 30000')
+    return conn
+
+
+class _DemasiadosReinicios(Exception):
+    pass
+
+
+def respaldar(ruta, carpeta, paginas=256, pausa=0.005, conservar=7, max_reinicios=3):
+    """Copiar `ruta` a carpeta/<base>_<fecha>.db de a `paginas` páginas y podar respaldos viejos.
+
+    Si otra conexión escribe en la base, SQLite reinicia la copia desde el principio.
+    Tras `max_reinicios` se abandona el respaldo (se borra la copia parcial) y el
+    resultado lleva 'reintentar': una copia en un solo paso retendría el lock de lectura
+    durante toda la copia y los escritores esperarían en cada commit.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    destino = os.path.join(carpeta, f"{base}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+    t0 = time.perf_counter()
+    estado = {'restantes': None, 'reinicios': 0}
+
+    def _progreso(_status, restantes, _total):
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            estado['reinicios'] += 1
+            if estado['reinicios'] > max_reinicios:
+                raise _DemasiadosReinicios()
+        estado['restantes'] = restantes
+
+    origen = _conectar(ruta)
+    copia = sqlite3.connect(destino)
+    modo = 'por_pasos' if paginas > 0 else 'un_paso'
+    try:
+        origen.backup(copia, pages=paginas, sleep=pausa, progress=_progreso)
+    except _DemasiadosReinicios:
+        copia.close()
+        origen.close()
+        os.remove(destino)
+        return {'operacion': 'respaldo', 'destino': None, 'modo': 'cortado', 'reinicios': estado['reinicios'],
+                'segundos': time.perf_counter() - t0, 'bytes_respaldo': 0, 'reintentar': True,
+                'omitido': 'escrituras continuas; se reintenta en la próxima ventana sin actividad'}
+    finally:
+        copia.close()
+        origen.close()
+    # Los nombres llevan la fecha, así que el orden alfabético es cronológico
+    respaldos = sorted(glob.glob(os.path.join(carpeta, f'{base}_[0-9]*_[0-9]*.db')))
+    for viejo in respaldos[:-conservar] if conservar else []:
+        os.remove(viejo)
+    return {'operacion': 'respaldo', 'destino': destino, 'modo': modo, 'reinicios': estado['reinicios'],
+            'segundos': time.perf_counter() - t0, 'bytes_respaldo': _tamano(destino)}
+
+
+def compactar(ruta, max_paginas=2000):
+    """Liberar hasta `max_paginas` páginas libres con PRAGMA incremental_vacuum.
+
+    Una base creada sin auto_vacuum necesita un VACUUM completo (una sola vez) para
+    pasar a modo incremental; eso solo debería correr en una ventana sin actividad.
+    """
+    t0 = time.perf_counter()
+    conn = _conectar(ruta)
+    try:
+        resultado = {'operacion': 'vacio_incremental',
+                     'paginas_libres': conn.execute('PRAGMA freelist_count').fetchone()[0]}
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            resultado['operacion'] = 'vacuum_completo'
+        else:
+            # executescript recorre la sentencia completa; execute() solo libera una página por paso
+            conn.executescript(f'PRAGMA incremental_vacuum({int(max_paginas)});')
+        resultado['paginas_libres_despues'] = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        conn.close()
+    resultado['segundos'] = time.perf_counter() - t0
+    return resultado
+
+
+def optimizar(ruta):
+    """ANALYZE completo la primera vez; después PRAGMA optimize (solo lo que cambió)"""
+    t0 = time.perf_counter()
+    conn = _conectar(ruta)
+    try:
+        tiene_estadisticas = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+        if tiene_estadisticas:
+            conn.execute('PRAGMA optimize')
+        else:
+            conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return {'operacion': 'optimize' if tiene_estadisticas else 'analyze', 'segundos': time.perf_counter() - t0}
+
+
+def mantener(rutas, carpeta_respaldos, ruta_informe, hay_silencio=lambda: True,
+             paginas=256, pausa=0.005, conservar=7, max_paginas_vacio=2000):
+    """Respaldar cada base y, si `hay_silencio()`, compactarla y optimizarla.
+
+    Devuelve las entradas agregadas al informe JSONL.
+    """
+    entradas = []
+    for ruta in rutas:
+        if not os.path.exists(ruta):
+            continue
+        # (operación, tarea, requiere silencio): vacío y ANALYZE toman el lock de escritura
+        tareas = (
+            ('respaldo', lambda: respaldar(ruta, carpeta_respaldos, paginas, pausa, conservar), False),
+            ('vacio_incremental', lambda: compactar(ruta, max_paginas_vacio), True),
+            ('optimize', lambda: optimizar(ruta), True),
+        )
+        for operacion, tarea, requiere_silencio in tareas:
+            antes = _tamano(ruta)
+            if requiere_silencio and not hay_silencio():
+                entrada = {'operacion': operacion, 'omitido': 'hay actividad'}
+            else:
+                try:
+                    entrada = tarea()
+                except sqlite3.Error as e:
+                    entrada = {'operacion': operacion, 'error': str(e)}
+            entrada.update(fecha=datetime.now(timezone.utc).isoformat(), base=ruta,
+                           bytes_antes=antes, bytes_despues=_tamano(ruta))
+            entradas.append(entrada)
+    if entradas:
+        os.makedirs(os.path.dirname(ruta_informe) or '.', exist_ok=True)
+        with open(ruta_informe, 'a', encoding='utf-8') as f:
+            for entrada in entradas:
+                f.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+    return entradas
+
+
+def leer_informe(ruta_informe):
+    """Entradas del informe JSONL (lista vacía si todavía no existe)"""
+    if not os.path.exists(ruta_informe):
+        return []
+    with open(ruta_informe, encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
@@ -0,0 +1,106 @@
+"""riesgo.py
+Puntaje de riesgo de caducidad de los empeños activos (que el cliente no pague ni
+renueve antes del vencimiento) y cobro esperado de cada uno. Trabaja sobre
+arreglos NumPy columnares, una columna por dato, así que puntuar toda la cartera
+son unas pocas operaciones vectoriales en lugar de un cálculo por fila. Las
+carteras grandes se reparten en bloques entre procesos.
+
+El puntaje es una regresión logística con pesos fijos (no hay historial de
+caducidades etiquetado para entrenarla): cuanto más cerca o más pasado del
+vencimiento, más renovaciones, más interés acumulado sobre el capital y peor
+historial del cliente, más alto el riesgo.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+# Columnas de entrada, en el orden de las filas que lee la app: la cartera activa y el
+# historial por cliente (user_id, empeños, pagados, caducados)
+COLUMNAS_CARTERA = ('empeno_id', 'user_id', 'creado', 'plazo', 'renovaciones', 'valor')
+COLUMNAS_HISTORIAL = ('empenos_cliente', 'pagados_cliente', 'caducados_cliente')
+
+PESOS = {
+    'sesgo': -2.0,
+    'vencido': 2.5,            # Ya pasó el vencimiento sin pago
+    'cercania': 1.5,           # 0 recién empeñado, 1 el día del vencimiento
+    'renovaciones': 0.35,      # Por cada renovación
+    'interes_capital': 2.0,    # Interés acumulado / capital
+    'caducados_previos': 2.0,  # Fracción de los empeños anteriores del cliente que caducaron
+    'pagados_previos': -1.2,   # Fracción de los empeños anteriores que pagó
+    'cliente_nuevo': 0.5,      # Sin empeños anteriores
+}
+
+
+def columnas_desde_filas(cartera, historial):
+    """{columna: ndarray float64} de la cartera (None -> NaN), con el historial de cada
+    cliente unido por user_id con una búsqueda binaria en lugar de un JOIN en SQLite"""
+    # Las filas de SQLAlchemy (Row) se pasan a tuplas: NumPy convierte un millón de tuplas en
+    # medio segundo, pero recorre cada Row como secuencia genérica, unas 50 veces más lento
+    matriz = np.array([tuple(f) for f in cartera], dtype=np.float64).reshape(-1, len(COLUMNAS_CARTERA))
+    columnas = {nombre: matriz[:, i] for i, nombre in enumerate(COLUMNAS_CARTERA)}
+    clientes = np.array([tuple(f) for f in historial], dtype=np.float64).reshape(-1, len(COLUMNAS_HISTORIAL) + 1)
+    clientes = clientes[np.argsort(clientes[:, 0])]
+    posicion = np.minimum(np.searchsorted(clientes[:, 0], columnas['user_id']), max(len(clientes) - 1, 0))
+    encontrado = clientes[posicion, 0] == columnas['user_id'] if len(clientes) else np.zeros(len(matriz), bool)
+    for i, nombre in enumerate(COLUMNAS_HISTORIAL, 1):
+        columnas[nombre] = np.where(encontrado, clientes[posicion, i] if len(clientes) else 0.0, 0.0)
+    return columnas
+
+
+def puntuar(columnas, ahora, pesos=PESOS):
+    """Puntaje (0-1), días a vencer, interés/capital, caducados previos y cobro esperado.
+
+    `creado` va en segundos epoch (NaN si la fecha no se pudo leer: se trata como
+    recién creado, igual que _days_left). `interes_capital` lo agrega la app con sus
+    tasas (interés acumulado por unidad de capital).
+    """
+    creado = columnas['creado']
+    transcurridos = np.floor((ahora - np.where(np.isnan(creado), ahora, creado)) / 86400.0)
+    plazo = np.maximum(columnas['plazo'], 1)
+    dias_a_vencer = plazo - transcurridos
+    vencido = dias_a_vencer < 0
+    interes_capital = columnas['interes_capital']
+
+    # Historial del cliente sin contar este empeño
+    previos = np.maximum(columnas['empenos_cliente'] - 1, 0)
+    caducados_previos = np.maximum(columnas['caducados_cliente'] - vencido, 0)
+    divisor = np.maximum(previos, 1)
+
+    z = (pesos['sesgo']
+         + pesos['vencido'] * vencido
+         + pesos['cercania'] * np.clip(1 - dias_a_vencer / plazo, 0, 1)
+         + pesos['renovaciones'] * columnas['renovaciones']
+         + pesos['interes_capital'] * interes_capital
+         + pesos['caducados_previos'] * caducados_previos / divisor
+         + pesos['pagados_previos'] * columnas['pagados_cliente'] / divisor
+         + pesos['cliente_nuevo'] * (previos == 0))
+    puntaje = 1.0 / (1.0 + np.exp(-z))
+    return {
+        'empeno_id': columnas['empeno_id'].astype(np.int64),
+        'user_id': columnas['user_id'].astype(np.int64),
+        'puntaje': puntaje,
+        'dias_a_vencer': dias_a_vencer.astype(np.int64),
+        'renovaciones': columnas['renovaciones'].astype(np.int64),
+        'interes_capital': interes_capital,
+        'caducados_previos': caducados_previos.astype(np.int64),
+        'capital': columnas['valor'],
+        # Capital más interés, ponderado por la probabilidad de que el cliente lo pague
+        'cobro_esperado': (1.0 - puntaje) * columnas['valor'] * (1.0 + interes_capital),
+    }
+
+
+def puntuar_en_paralelo(columnas, ahora, procesos=1, bloque=200000):
+    """puntuar() por bloques de `bloque` filas en `procesos` procesos; con un solo bloque o
+    proceso se calcula en el proceso actual (crear el pool cuesta más que puntuarlo)"""
+    total = len(columnas['empeno_id'])
+    funcion = partial(puntuar, ahora=ahora)
+    if procesos <= 1 or total <= bloque:
+        return funcion(columnas)
+    bloques = [{nombre: valores[i:i + bloque] for nombre, valores in columnas.items()}
+               for i in range(0, total, bloque)]
+    # 'spawn': la app tiene hilos vivos (servidor, publicador SSE) y fork los copiaría a medias
+    with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+        partes = list(pool.map(funcion, bloques))
+    return {nombre: np.concatenate([parte[nombre] for parte in partes]) for nombre in partes[0]}